@@ -0,0 +1,249 @@
+"""
+One summary table of the whole campaign, a row per condition
+
+For every Temp/Press directory in the sweep the outputs of all its stages
+are reduced to steady-state values, the steady state being the last
+Steady fraction (half by default) of the compression/shear steps:
+
+- Friction: mean and standard deviation of shear/normal (fc_ave.dump) and
+  the mean shear and normal stress
+- Thermo: mean c_temp_free and Press (log.lammps) as FreeTemp and Pressure
+- Density: mean density and thickness of the molecules region from the z
+  profile of dump_comp.lammpstrj
+- Species: mean count of every fragment in bonds_comp.txt, one column each
+
+Conditions are reduced in parallel on a process pool, each one on its own
+so a condition that fails is reported without stopping the rest. The table
+is written to STARTINGDIR/campaign_summary.npz (columnar, one array per
+column) and campaign_summary.csv. Each row keeps a manifest of the sizes and
+mtimes of the output files it was reduced from, and a condition whose
+manifest hasn't changed since the last run is taken from the stored table
+instead of being reduced again. Rows of conditions outside a run (e.g.
+--temp 500K) are kept in the table as they were, and so is the stored row of
+a condition that fails to reduce this time. The stored table is only used
+with the same steady fraction, cutoff, resolution and element types.
+
+Run this file directly to update the table for the conditions in
+FileGenerator.py.
+"""
+
+import os
+import argparse
+import traceback
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import RestartDiscovery as RD
+import FrictionReader as FR
+import ThermoLog as TL
+import Profiles as PR
+import SpeciesAnalysis as SA
+import NpzCache as NC
+
+StoreName = 'campaign_summary.npz'
+CSVName = 'campaign_summary.csv'
+StoreVersion = 1
+
+# Every output a row is reduced from, per stage
+Outputs = (FR.FileName, TL.LogName, 'dump_comp.lammpstrj', 'bonds_comp.txt')
+# Thermo column -> summary column
+ThermoNames = {'c_temp_free': 'FreeTemp', 'Press': 'Pressure'}
+SpeciesPrefix = 'species:'
+
+# Values maps column name to value, Error is the traceback of a failed
+# reduction (Values is then empty)
+Summary = namedtuple('Summary', ['Temp', 'Press', 'Manifest', 'Values', 'Error'])
+
+def Manifest(ConditionDir):
+    # (stage, file, size, mtime) of every output of every stage, as a string
+    Entries = []
+    for Stage in RD.ScanCondition(ConditionDir):
+        for Name in Outputs:
+            try:
+                Stat = os.stat(os.path.join(Stage.Path, Name))
+            except FileNotFoundError:
+                continue
+            Entries.append((Stage.Name, Name, Stat.st_size, Stat.st_mtime_ns))
+    return repr(Entries)
+
+def SteadyStart(Step, Steady):
+    # First step of the last Steady fraction of the steps
+    if len(Step) == 0:
+        return 0
+    return int(Step[0] + (1.0 - Steady) * (Step[-1] - Step[0]))
+
+def Reduce(Settings, Temp, Press, Steady=0.5, Cutoff=0.3, Resolution=0.5):
+    Values = {}
+    Friction = FR.FrictionReader().Condition(Settings['STARTINGDIR'], Temp, Press)
+    FromStep = SteadyStart(Friction.Step, Steady)
+    Window = Friction.Step >= FromStep
+    Values['LastStep'] = float(Friction.Step[-1]) if len(Friction.Step) else np.nan
+    Values['Mu'] = float(np.nanmean(Friction.Mu[Window])) if Window.any() else np.nan
+    Values['MuStd'] = float(np.nanstd(Friction.Mu[Window])) if Window.any() else np.nan
+    Values['Shear'] = float(Friction.Shear[Window].mean()) if Window.any() else np.nan
+    Values['Normal'] = float(Friction.Normal[Window].mean()) if Window.any() else np.nan
+
+    for Name, Column in ThermoNames.items():
+        Step, Columns = TL.ConditionThermo(Settings['STARTINGDIR'], Temp, Press, [Name])
+        Window = Step >= FromStep
+        Values[Column] = float(Columns[Name][Window].mean()) if Window.any() else np.nan
+
+    Types = SA.TypeMap(Settings)
+    Profile = PR.ConditionProfile(Settings, Temp, Press, Types, Resolution=Resolution, FromStep=FromStep)
+    if Profile is None:
+        Values['Density'] = Values['Thickness'] = np.nan
+    else:
+        Low, High = Profile.Regions['molecules']
+        Inside = (Profile.Centres >= Low) & (Profile.Centres <= High)
+        Density = Profile.GroupDensity[PR.Groups.index('molecules')]
+        Values['Density'] = float(Density[Inside].mean()) if Inside.any() else np.nan
+        Values['Thickness'] = float(High - Low)
+
+    # Nested inside a pool worker, so the frames are analysed in this process
+    Series = SA.ConditionSpecies(Settings['STARTINGDIR'], Temp, Press, Types, Cutoff=Cutoff, Workers=1,
+                                 PoolType='thread')
+    Window = Series.Step >= FromStep
+    if Window.any():
+        for Name, Mean in zip(Series.Species, Series.Counts[Window].mean(axis=0)):
+            Values[SpeciesPrefix + Name] = float(Mean)
+    return Values
+
+def SafeReduce(Settings, Temp, Press, Manifest, Steady=0.5, Cutoff=0.3, Resolution=0.5):
+    # Per-condition error isolation, the traceback is kept for the report
+    try:
+        return Summary(Temp, Press, Manifest, Reduce(Settings, Temp, Press, Steady, Cutoff, Resolution), None)
+    except Exception:
+        return Summary(Temp, Press, Manifest, {}, traceback.format_exc())
+
+def StoreKey(Steady, Cutoff, Resolution, Types):
+    # The species columns depend on the element of each atom type
+    return repr((Steady, Cutoff, Resolution, sorted(Types.items())))
+
+def Columns(Summaries):
+    # Scalar columns in the order they were reduced, then species by name
+    Names = []
+    for Row in Summaries:
+        Names += [Name for Name in Row.Values if Name not in Names and not Name.startswith(SpeciesPrefix)]
+    return Names + sorted({Name for Row in Summaries for Name in Row.Values if Name.startswith(SpeciesPrefix)})
+
+def LoadStore(Path, Key):
+    # {(Temp, Press): Summary} of a stored table, {} if missing or out of date
+    try:
+        with np.load(Path) as Store:
+            if int(Store['Version']) != StoreVersion or str(Store['Key']) != Key:
+                return {}
+            Names = [str(Name) for Name in Store['Columns']]
+            Table = {Name: Store[f'c{i}'] for i, Name in enumerate(Names)}
+            Stored = {}
+            for Row, (Temp, Press, Manifest) in enumerate(zip(Store['Temp'], Store['Press'], Store['Manifest'])):
+                Values = {Name: float(Table[Name][Row]) for Name in Names
+                          if not (Name.startswith(SpeciesPrefix) and Table[Name][Row] == 0)}
+                Stored[(str(Temp), str(Press))] = Summary(str(Temp), str(Press), str(Manifest), Values, None)
+            return Stored
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def SaveStore(Path, Key, Summaries):
+    # Failed rows aren't stored so they are reduced again next time
+    Rows = [Row for Row in Summaries if Row.Error is None]
+    Names = Columns(Rows)
+    Arrays = {'Version': StoreVersion, 'Key': Key, 'Columns': np.array(Names, dtype=str),
+              'Temp': np.array([Row.Temp for Row in Rows], dtype=str),
+              'Press': np.array([Row.Press for Row in Rows], dtype=str),
+              'Manifest': np.array([Row.Manifest for Row in Rows], dtype=str)}
+    for i, Name in enumerate(Names):
+        Missing = 0.0 if Name.startswith(SpeciesPrefix) else np.nan
+        Arrays[f'c{i}'] = np.array([Row.Values.get(Name, Missing) for Row in Rows], dtype=np.float64)
+    NC.SaveNpzAtomic(Path, Compressed=True, **Arrays)
+
+def WriteCSV(Path, Summaries):
+    Rows = [Row for Row in Summaries if Row.Error is None]
+    Names = Columns(Rows)
+    Temporary = f'{Path}.{os.getpid()}.tmp'
+    with open(Temporary, 'w') as file:
+        file.write(','.join(['Temp', 'Press'] + Names) + '\n')
+        for Row in Rows:
+            Values = [Row.Values.get(Name, 0.0 if Name.startswith(SpeciesPrefix) else np.nan) for Name in Names]
+            file.write(','.join([Row.Temp, Row.Press] + [f'{Value:.6g}' for Value in Values]) + '\n')
+    os.replace(Temporary, Path)
+
+def Aggregate(Settings, Temperatures, Pressures, Workers=8, PoolType='process', Steady=0.5, Cutoff=0.3,
+              Resolution=0.5, Force=False):
+    # (Summaries in sweep order, number of conditions reduced this time)
+    if PoolType == 'thread':
+        Pool = ThreadPoolExecutor
+    elif PoolType == 'process':
+        Pool = ProcessPoolExecutor
+    else:
+        raise ValueError(f'Unknown pool type {PoolType!r}, expected "thread" or "process"')
+    STARTINGDIR = Settings['STARTINGDIR']
+    Key = StoreKey(Steady, Cutoff, Resolution, SA.TypeMap(Settings))
+    Stored = {} if Force else LoadStore(os.path.join(STARTINGDIR, StoreName), Key)
+
+    Summaries = {}
+    Pending = []
+    for Temp in Temperatures:
+        for Press in Pressures:
+            ConditionDir = os.path.join(STARTINGDIR, Temp, Press)
+            if not os.path.isdir(ConditionDir):
+                continue
+            Current = Manifest(ConditionDir)
+            Known = Stored.get((Temp, Press))
+            if Known is not None and Known.Manifest == Current:
+                Summaries[(Temp, Press)] = Known
+            else:
+                Pending.append((Temp, Press, Current))
+
+    if Pending:
+        with Pool(max_workers=Workers) as Executor:
+            Futures = [Executor.submit(SafeReduce, Settings, Temp, Press, Current, Steady, Cutoff, Resolution)
+                       for Temp, Press, Current in Pending]
+            for Future in as_completed(Futures):
+                Row = Future.result()
+                Summaries[(Row.Temp, Row.Press)] = Row
+
+    # Sweep order rather than completion order
+    Ordered = [Summaries[(Temp, Press)] for Temp in Temperatures for Press in Pressures
+               if (Temp, Press) in Summaries]
+    if Pending:
+        # Conditions outside this run, and those that failed this time, keep
+        # their stored rows
+        Table = dict(LoadStore(os.path.join(STARTINGDIR, StoreName), Key))
+        Table.update({Condition: Row for Condition, Row in Summaries.items()
+                      if Row.Error is None or Condition not in Table})
+        SaveStore(os.path.join(STARTINGDIR, StoreName), Key, list(Table.values()))
+        WriteCSV(os.path.join(STARTINGDIR, CSVName), list(Table.values()))
+    return Ordered, len(Pending)
+
+def PrintSummaries(Summaries, Reduced):
+    print(f'{"Temp":<8}{"Press":<8}{"Step":>12}{"Mu":>10}{"Mu std":>10}{"Density":>10}{"Thickness":>11}')
+    for Row in Summaries:
+        if Row.Error is not None:
+            print(f'{Row.Temp:<8}{Row.Press:<8}failed')
+            continue
+        Values = Row.Values
+        print(f'{Row.Temp:<8}{Row.Press:<8}{Values["LastStep"]:>12.0f}{Values["Mu"]:>10.4f}{Values["MuStd"]:>10.4f}'
+              f'{Values["Density"]:>10.4f}{Values["Thickness"]:>11.2f}')
+    print(f'{Reduced} reduced, {len(Summaries) - Reduced} unchanged')
+    for Row in Summaries:
+        if Row.Error is not None:
+            print(f'\n{Row.Temp} {Row.Press} failed:\n{Row.Error}')
+
+def main():
+    import FileGenerator as FG
+    Parser = argparse.ArgumentParser(description='Reduce every condition of the campaign to one summary row')
+    Parser.add_argument('--temp', nargs='+', default=FG.Temperatures)
+    Parser.add_argument('--press', nargs='+', default=FG.Pressures)
+    Parser.add_argument('--steady', type=float, default=0.5,
+                        help='fraction of the compression/shear steps averaged over, from the end')
+    Parser.add_argument('--workers', type=int, default=FG.Workers)
+    Parser.add_argument('--force', action='store_true', help='reduce every condition, changed or not')
+    Args = Parser.parse_args()
+
+    Summaries, Reduced = Aggregate(FG.Settings, Args.temp, Args.press, Workers=Args.workers, Steady=Args.steady,
+                                   Force=Args.force)
+    PrintSummaries(Summaries, Reduced)
+    print(f'Written to {os.path.join(FG.STARTINGDIR, StoreName)} and {CSVName}')
+
+if __name__ == '__main__':
+    main()
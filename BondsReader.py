@@ -0,0 +1,214 @@
+"""
+Streaming parser for the fix reax/c/bonds output (bonds_equil.txt and
+bonds_comp.txt)
+
+Each frame is a '# Timestep' header followed by one line per atom
+    id type nb id_1...id_nb mol bo_1...bo_nb abo nlp q
+The file is read in chunks and frames are yielded one at a time, so no more
+than one frame (and one chunk) is held in memory. A frame is parsed without
+a Python loop over its lines: every number is converted in one call, the
+tokens on each line are counted from the raw bytes and the columns are
+gathered by index into a CSR neighbour list, rows sorted by atom id.
+
+MapFrames runs a function over every frame of a file on a process pool.
+
+Run this file directly to benchmark against a naive line by line parser on
+a synthetic file, e.g.
+    python BondsReader.py 500 20000    (frames, atoms)
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Neighbours[IndPtr[i]:IndPtr[i + 1]] are bonded to atom Id[i], with bond
+# orders BondOrders[IndPtr[i]:IndPtr[i + 1]]. TotalBondOrder, LonePairs and
+# Charge are the abo, nlp and q columns
+BondFrame = namedtuple('BondFrame', ['Step', 'Id', 'Type', 'Molecule', 'IndPtr', 'Neighbours', 'BondOrders',
+                                     'TotalBondOrder', 'LonePairs', 'Charge'])
+
+Marker = b'# Timestep'
+
+def RawFrames(Path, ChunkBytes=1 << 26, Start=0):
+    # The bytes of each complete frame in the file from byte Start on, one at
+    # a time, with the offset just past the frame to carry on from later
+    with open(Path, 'rb') as file:
+        file.seek(Start)
+        Buffer = b''
+        Offset = Start # Of Buffer[0] in the file
+        while True:
+            Data = file.read(ChunkBytes)
+            Buffer += Data
+            First = Buffer.find(Marker)
+            if First == -1:
+                if Data:
+                    Offset += len(Buffer)
+                    Buffer = b''
+            else:
+                Next = Buffer.find(Marker, First + len(Marker))
+                while Next != -1:
+                    yield Offset + Next, Buffer[First:Next]
+                    First = Next
+                    Next = Buffer.find(Marker, First + len(Marker))
+                Offset += First
+                Buffer = Buffer[First:]
+            if not Data:
+                break
+        # The last frame is complete once its closing '#' line is there
+        if Buffer.startswith(Marker) and Buffer.rstrip(b' \n').endswith(b'\n#'):
+            yield Offset + len(Buffer), Buffer
+
+def AtomLines(Frame):
+    # The atom lines of a frame, without the '#' lines around them
+    Start = 0
+    while Frame[Start:Start + 1] == b'#':
+        Start = Frame.index(b'\n', Start) + 1
+    End = len(Frame.rstrip())
+    while End > Start:
+        Line = Frame.rfind(b'\n', Start, End) + 1
+        if Frame[Line:Line + 1] != b'#':
+            break
+        End = max(Line - 1, Start)
+    return Frame[Start:End]
+
+def ParseFrame(Frame):
+    Step = int(Frame[len(Marker):Frame.index(b'\n')])
+    Data = AtomLines(Frame)
+    Values = np.fromstring(Data, dtype=np.float64, sep=' ')
+
+    # Tokens per line, from where each token starts in the raw bytes
+    Bytes = np.frombuffer(Data, dtype=np.uint8)
+    Space = Bytes <= 32
+    Starts = np.flatnonzero(Space[:-1] & ~Space[1:]) + 1
+    if len(Bytes) > 0 and not Space[0]:
+        Starts = np.concatenate(([0], Starts))
+    Newlines = np.concatenate((np.flatnonzero(Bytes == 10), [len(Bytes)]))
+    Tokens = np.diff(np.searchsorted(Starts, Newlines), prepend=0)
+    Tokens = Tokens[Tokens > 0]
+    Offsets = np.concatenate(([0], np.cumsum(Tokens)[:-1]))
+
+    Order = np.argsort(Values[Offsets], kind='stable')
+    Offsets = Offsets[Order]
+    Bonds = Values[Offsets + 2].astype(np.int64)
+    IndPtr = np.concatenate(([0], np.cumsum(Bonds)))
+    Within = np.arange(IndPtr[-1]) - np.repeat(IndPtr[:-1], Bonds)
+    First = np.repeat(Offsets, Bonds) + Within
+    Tail = Offsets + 2 * Bonds # abo, nlp and q are at Tail + 4, 5 and 6
+    return BondFrame(Step, Values[Offsets].astype(np.int64), Values[Offsets + 1].astype(np.int32),
+                     Values[Offsets + 3 + Bonds].astype(np.int64), IndPtr,
+                     Values[First + 3].astype(np.int64), Values[First + 4 + np.repeat(Bonds, Bonds)],
+                     Values[Tail + 4], Values[Tail + 5], Values[Tail + 6])
+
+def ReadFrames(Path, ChunkBytes=1 << 26, Start=0):
+    for End, Frame in RawFrames(Path, ChunkBytes, Start):
+        yield ParseFrame(Frame)
+
+def _ParseAndApply(Function, Frame):
+    return Function(ParseFrame(Frame))
+
+def MapFrames(Path, Function, Workers=8, PoolType='process', ChunkBytes=1 << 26, Start=0):
+    # Function(BondFrame) for every frame from byte Start on, in order, and
+    # the offset reached. Function has to be importable (module level, or a
+    # partial of one) for a process pool. Frames are read ahead of the
+    # workers by at most two per worker
+    Pool = ProcessPoolExecutor if PoolType == 'process' else ThreadPoolExecutor
+    Results = []
+    End = Start
+    with Pool(max_workers=Workers) as Executor:
+        Pending = deque()
+        for End, Frame in RawFrames(Path, ChunkBytes, Start):
+            Pending.append(Executor.submit(_ParseAndApply, Function, Frame))
+            if len(Pending) >= 2 * Workers:
+                Results.append(Pending.popleft().result())
+        while Pending:
+            Results.append(Pending.popleft().result())
+    return Results, End
+
+def AtomCount(Frame):
+    return len(Frame.Id)
+
+def NaiveFrames(Path):
+    # Line by line reference parser, used by the benchmark
+    Frame = None
+    with open(Path) as file:
+        for Line in file:
+            if Line.startswith('# Timestep'):
+                if Frame is not None:
+                    yield Frame
+                Frame = [int(Line.split()[2]), {}]
+            elif not Line.startswith('#') and Line.strip():
+                Fields = Line.split()
+                Bonds = int(Fields[2])
+                Frame[1][int(Fields[0])] = (int(Fields[1]), [int(x) for x in Fields[3:3 + Bonds]],
+                                            int(Fields[3 + Bonds]),
+                                            [float(x) for x in Fields[4 + Bonds:4 + 2 * Bonds]],
+                                            float(Fields[-3]), float(Fields[-2]), float(Fields[-1]))
+    if Frame is not None:
+        yield Frame
+
+def WriteSynthetic(Path, Frames, Atoms, Seed=0):
+    Random = np.random.default_rng(Seed)
+    with open(Path, 'w') as file:
+        for Frame in range(Frames):
+            file.write(f'# Timestep {Frame * 4000} \n# \n# Number of particles {Atoms} \n# \n'
+                       f'# Max number of bonds per atom 4 with coarse bond order cutoff 0.300 \n'
+                       f'# Particle connection table and bond orders \n'
+                       f'# id type nb id_1...id_nb mol bo_1...bo_nb abo nlp q \n')
+            Lines = []
+            for Id in Random.permutation(Atoms) + 1:
+                Bonds = Random.integers(0, 5)
+                Neighbours = ' '.join(str(x) for x in Random.integers(1, Atoms + 1, Bonds))
+                Orders = ' '.join(f'{x:.3f}' for x in Random.random(Bonds))
+                Lines.append(f' {Id} {Id % 5 + 1} {Bonds} {Neighbours} 0 {Orders} {Random.random() * 4:.3f} '
+                             f'{0:.3f} {Random.random() - 0.5:.3f} ')
+            file.write('\n'.join(Line.replace('  ', ' ') for Line in Lines) + '\n# \n')
+
+def Agree(Path):
+    # Both parsers have to give the same frames, checked at the first, middle
+    # and last atom of every frame
+    Frames = 0
+    for Reference, Frame in zip(NaiveFrames(Path), ReadFrames(Path)):
+        assert Reference[0] == Frame.Step and len(Reference[1]) == len(Frame.Id)
+        for i in (0, len(Frame.Id) // 2, len(Frame.Id) - 1):
+            Type, Neighbours, Molecule, Orders, TotalBondOrder, LonePairs, Charge = Reference[1][Frame.Id[i]]
+            Slice = slice(Frame.IndPtr[i], Frame.IndPtr[i + 1])
+            assert Type == Frame.Type[i] and Charge == Frame.Charge[i]
+            assert Neighbours == list(Frame.Neighbours[Slice]) and Orders == list(Frame.BondOrders[Slice])
+        Frames += 1
+    assert Frames == sum(1 for Frame in NaiveFrames(Path)) == sum(1 for Frame in ReadFrames(Path))
+
+def Benchmark(Path=None, Frames=50, Atoms=20000):
+    if Path is None:
+        # The synthetic file goes once the benchmark is done
+        with tempfile.TemporaryDirectory() as Directory:
+            Path = os.path.join(Directory, 'bonds_comp.txt')
+            WriteSynthetic(Path, Frames, Atoms)
+            return Benchmark(Path)
+    Size = os.path.getsize(Path) / 1e6
+
+    Start = time.perf_counter()
+    Naive = sum(len(Frame[1]) for Frame in NaiveFrames(Path))
+    Naive = time.perf_counter() - Start
+
+    Start = time.perf_counter()
+    Vectorised = sum(len(Frame.Id) for Frame in ReadFrames(Path))
+    Vectorised = time.perf_counter() - Start
+
+    Start = time.perf_counter()
+    MapFrames(Path, AtomCount)
+    Pooled = time.perf_counter() - Start
+
+    Agree(Path)
+
+    print(f'{Path}: {Size:.0f} MB')
+    print(f'line by line      : {Size / Naive:8.1f} MB/s')
+    print(f'vectorised        : {Size / Vectorised:8.1f} MB/s')
+    print(f'vectorised + pool : {Size / Pooled:8.1f} MB/s')
+
+if __name__ == '__main__':
+    Benchmark(Frames=int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+              Atoms=int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
@@ -0,0 +1,184 @@
+"""
+Persistent index of campaign state, kept in an SQLite file in STARTINGDIR
+
+For every condition (Temp, Press) and each of its stages (FirstRun = 0,
+Restart_N = N) the index records the number of entries in the stage
+directory, the latest equil/comp restart step, the job ID submitted for it, how many times
+it has been submitted and the sizes of its output files.
+
+Directories are scanned with RestartDiscovery and only relisted when their mtime has changed since they were
+last indexed, so an unchanged condition costs two stat calls instead of
+listing every stage directory.
+
+Run this file directly to print the indexed state of the campaign.
+"""
+
+import os
+import json
+import time
+import sqlite3
+from collections import namedtuple
+import RestartDiscovery as RD
+
+IndexName = 'campaign_index.sqlite'
+
+# Entries whose mtime is this close to the time of the scan could still be
+# followed by more changes within the same mtime tick, so they are rescanned
+MtimeSafety = 2.0
+
+StageState = namedtuple('StageState', ['Name', 'Number', 'Files', 'EquilStep', 'CompStep',
+                                       'JobId', 'Sizes', 'Attempts'])
+ConditionState = namedtuple('ConditionState', ['Temp', 'Press', 'Stages'])
+
+Schema = """
+CREATE TABLE IF NOT EXISTS conditions (
+    temp TEXT NOT NULL,
+    press TEXT NOT NULL,
+    mtime_ns INTEGER,
+    updated REAL,
+    PRIMARY KEY (temp, press)
+);
+CREATE TABLE IF NOT EXISTS stages (
+    temp TEXT NOT NULL,
+    press TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    mtime_ns INTEGER,
+    files INTEGER,
+    equil_step INTEGER,
+    comp_step INTEGER,
+    job_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    sizes TEXT,
+    updated REAL,
+    PRIMARY KEY (temp, press, stage)
+);
+"""
+
+def Connect(STARTINGDIR):
+    # A new connection per call keeps the index safe to use from threads and
+    # processes. The default rollback journal is used as WAL needs shared
+    # memory, which network filesystems don't provide
+    Connection = sqlite3.connect(os.path.join(STARTINGDIR, IndexName), timeout=60)
+    Connection.executescript(Schema)
+    # Indexes made before submissions were counted
+    Columns = {Row[1] for Row in Connection.execute('PRAGMA table_info(stages)')}
+    if 'attempts' not in Columns:
+        Connection.execute('ALTER TABLE stages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+    return Connection
+
+def TrustedMtime(Stat):
+    # None marks an entry to be rescanned next time
+    if time.time() - Stat.st_mtime < MtimeSafety:
+        return None
+    return Stat.st_mtime_ns
+
+def _UpdateStage(Connection, Temp, Press, Name, StageDir, Stat):
+    Scan = RD.ScanStage(StageDir)
+    EquilStep = Scan.EquilSteps[-1] if Scan.EquilSteps else None
+    CompStep = Scan.CompSteps[-1] if Scan.CompSteps else None
+    Connection.execute("""
+        INSERT INTO stages (temp, press, stage, number, mtime_ns, files, equil_step, comp_step, sizes, updated)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (temp, press, stage) DO UPDATE SET
+            mtime_ns = excluded.mtime_ns, files = excluded.files, equil_step = excluded.equil_step,
+            comp_step = excluded.comp_step, sizes = excluded.sizes, updated = excluded.updated
+        """, (Temp, Press, Name, RD.StageNumber(Name), TrustedMtime(Stat), Scan.Files, EquilStep, CompStep,
+              json.dumps(Scan.Sizes), time.time()))
+
+def Refresh(STARTINGDIR, Temp, Press):
+    # Bring the index up to date for one condition and return its state
+    ConditionDir = os.path.join(STARTINGDIR, Temp, Press)
+    Connection = Connect(STARTINGDIR)
+    try:
+        with Connection:
+            ConditionStat = os.stat(ConditionDir)
+            Row = Connection.execute('SELECT mtime_ns FROM conditions WHERE temp = ? AND press = ?',
+                                     (Temp, Press)).fetchone()
+            Indexed = {Name: MtimeNs for Name, MtimeNs in Connection.execute(
+                'SELECT stage, mtime_ns FROM stages WHERE temp = ? AND press = ?', (Temp, Press))}
+
+            if Row is None or Row[0] is None or Row[0] != ConditionStat.st_mtime_ns:
+                # Stages may have been added or removed, relist the condition
+                Present = [Stage.Name for Stage in RD.ScanCondition(ConditionDir)]
+                for Name in set(Indexed) - set(Present):
+                    Connection.execute('DELETE FROM stages WHERE temp = ? AND press = ? AND stage = ?',
+                                       (Temp, Press, Name))
+                    del Indexed[Name]
+                for Name in Present:
+                    Indexed.setdefault(Name, None)
+                Connection.execute("""
+                    INSERT INTO conditions (temp, press, mtime_ns, updated) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (temp, press) DO UPDATE SET mtime_ns = excluded.mtime_ns, updated = excluded.updated
+                    """, (Temp, Press, TrustedMtime(ConditionStat), time.time()))
+
+            # Stages before the last two are finished with, so they are only
+            # scanned when first indexed
+            Latest = sorted(Indexed, key=RD.StageNumber)[-2:]
+            for Name, MtimeNs in Indexed.items():
+                if MtimeNs is not None and Name not in Latest:
+                    continue
+                StageDir = os.path.join(ConditionDir, Name)
+                Stat = os.stat(StageDir)
+                if MtimeNs is None or MtimeNs != Stat.st_mtime_ns:
+                    _UpdateStage(Connection, Temp, Press, Name, StageDir, Stat)
+        return Query(STARTINGDIR, Temp, Press, Connection)
+    finally:
+        Connection.close()
+
+def Query(STARTINGDIR, Temp, Press, Connection=None):
+    # State as last indexed, without touching the filesystem
+    Own = Connection is None
+    if Own:
+        Connection = Connect(STARTINGDIR)
+    try:
+        Rows = Connection.execute("""
+            SELECT stage, number, files, equil_step, comp_step, job_id, sizes, attempts FROM stages
+            WHERE temp = ? AND press = ? ORDER BY number""", (Temp, Press)).fetchall()
+    finally:
+        if Own:
+            Connection.close()
+    Stages = [StageState(Name, Number, Files, EquilStep, CompStep, JobId, json.loads(Sizes or '{}'), Attempts)
+              for Name, Number, Files, EquilStep, CompStep, JobId, Sizes, Attempts in Rows]
+    return ConditionState(Temp, Press, Stages)
+
+def RecordJob(STARTINGDIR, Temp, Press, Stage, JobId):
+    Connection = Connect(STARTINGDIR)
+    try:
+        with Connection:
+            # mtime left NULL so the stage is scanned on the next refresh
+            Connection.execute("""
+                INSERT INTO stages (temp, press, stage, number, job_id, attempts, updated) VALUES (?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT (temp, press, stage) DO UPDATE SET
+                    job_id = excluded.job_id, attempts = attempts + 1, updated = excluded.updated
+                """, (Temp, Press, Stage, RD.StageNumber(Stage), JobId, time.time()))
+    finally:
+        Connection.close()
+
+def JobIds(STARTINGDIR):
+    # Every job ID recorded for the campaign, mapped to (Temp, Press, Stage)
+    Connection = Connect(STARTINGDIR)
+    try:
+        Rows = Connection.execute('SELECT job_id, temp, press, stage FROM stages WHERE job_id IS NOT NULL')
+        return {JobId: (Temp, Press, Stage) for JobId, Temp, Press, Stage in Rows}
+    finally:
+        Connection.close()
+
+def PrintStatus(STARTINGDIR, Temperatures, Pressures, Refreshing=True):
+    print(f'{"Temp":<8}{"Press":<8}{"Stage":<12}{"Equil":>10}{"Comp":>10}  {"Job":<16}log.lammps')
+    for Temp in Temperatures:
+        for Press in Pressures:
+            if Refreshing and os.path.isdir(os.path.join(STARTINGDIR, Temp, Press)):
+                State = Refresh(STARTINGDIR, Temp, Press)
+            else:
+                State = Query(STARTINGDIR, Temp, Press)
+            if len(State.Stages) == 0:
+                print(f'{Temp:<8}{Press:<8}-')
+                continue
+            Stage = State.Stages[-1]
+            print(f'{Temp:<8}{Press:<8}{Stage.Name:<12}{Stage.EquilStep or "-":>10}{Stage.CompStep or "-":>10}'
+                  f'  {Stage.JobId or "-":<16}{Stage.Sizes.get("log.lammps", "-")}')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintStatus(FG.STARTINGDIR, FG.Temperatures, FG.Pressures)
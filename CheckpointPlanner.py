@@ -0,0 +1,196 @@
+"""
+Restart file interval from the cost of writing one and how often jobs fail
+
+- The cost C of a restart file is measured from the stages already run: the
+  Output share of the MPI timing breakdown in log.lammps, split between the
+  restart and dump bytes the stage wrote, per restart file (at
+  DefaultBandwidth when the log has no timing yet)
+- The mean time between failures M comes from the campaign: a stage that
+  crashed, or was killed in the middle of a run (its log ends without the
+  run finishing and a later stage exists), is a failure, over the wall time
+  every stage ran for. The HPC's Reliability is added as one failure in that
+  many hours, so a young campaign isn't trusted to never fail
+- The interval is Daly's optimum, sqrt(2 C M) [1 + sqrt(C / 2M) / 3 +
+  C / 18M] - C (M if C >= 2M), converted to steps with the condition's own
+  seconds per step. The step interval used is the divisor of both EquilTime
+  and CompTime that wastes least around it, so restart files still land on
+  the end of each phase, where completion is read from
+- For the rest of the condition the expected I/O overhead (T / interval) C
+  and the compute expected to be lost to failures (T / M) (interval / 2 + C)
+  are given for the planned interval and the current RestartFileFreq
+
+With CheckpointPlanning = True in FileGenerator.py each new stage is written
+with its condition's planned step interval between restart files, through
+its own template field (RestartFileFreq, which also sets the fc_ave window,
+is left alone). Conditions with nothing run yet keep the RestartFileFreq in
+FileGenerator.py. The stage records of a sweep are read once
+(CampaignRecords) and shared by the failure rate and every condition's
+plan. Run this file directly to print the plan of every condition.
+"""
+
+import os
+import math
+from collections import namedtuple
+import RestartDiscovery as RD
+import ProgressProbe as PP
+import Performance as PF
+
+# Prior mean time between failures (or preemptions) of each HPC, in hours
+Reliability = {'Imperial': 72.0, 'UCL': 48.0}
+DefaultBandwidth = 200e6 # bytes/s
+
+# WriteSeconds is per restart file, Timed when it was measured rather than
+# taken at DefaultBandwidth, Elapsed the wall seconds the stage ran
+StageRecord = namedtuple('StageRecord', ['Name', 'Start', 'LastStep', 'SecondsPerStep', 'Elapsed', 'Restarts',
+                                         'RestartBytes', 'WriteSeconds', 'Timed', 'Failed'])
+# IntervalSteps is None when there is nothing to plan from
+Plan = namedtuple('Plan', ['Temp', 'Press', 'Cost', 'MTBF', 'SecondsPerStep', 'Interval', 'IntervalSteps',
+                           'Remaining', 'Overhead', 'Lost', 'CurrentOverhead', 'CurrentLost'])
+
+def Daly(Cost, MTBF):
+    if Cost >= 2 * MTBF:
+        return MTBF
+    return math.sqrt(2 * Cost * MTBF) * (1 + math.sqrt(Cost / (2 * MTBF)) / 3 + Cost / (18 * MTBF)) - Cost
+
+def Waste(Remaining, Interval, Cost, MTBF):
+    # (I/O overhead, expected lost compute) in seconds over Remaining seconds
+    return Remaining / Interval * Cost, Remaining / MTBF * (Interval / 2 + Cost)
+
+def Divisors(Number):
+    Found = set()
+    for i in range(1, math.isqrt(Number) + 1):
+        if Number % i == 0:
+            Found.update((i, Number // i))
+    return sorted(Found)
+
+def ScanRecord(Stage, EquilTime, CompTime, Superseded):
+    # What a stage's files say about its timing, restart files and fate
+    Generated = None
+    Restarts = []
+    DumpBytes = 0
+    with os.scandir(Stage.Path) as Entries:
+        for Entry in Entries:
+            Found = RD.RestartStep(Entry.name)
+            if Found is not None:
+                Stat = Entry.stat()
+                Restarts.append((Found[1], Stat.st_size, Stat.st_mtime))
+            elif Entry.name.endswith('.pbs'):
+                Generated = Entry.stat().st_mtime
+            elif Entry.name.endswith('.lammpstrj'):
+                DumpBytes += Entry.stat().st_size
+    # The restart file the stage started from is staged in before its job
+    # script is written, the ones it wrote come after
+    Own = [Restart for Restart in Restarts if Generated is None or Restart[2] > Generated]
+    Staged = [Restart[0] for Restart in Restarts if Restart not in Own]
+    Start = min(Staged) if Staged else 0
+
+    Log = os.path.join(Stage.Path, PP.LogName)
+    Runs = PF.ParseLog(Log) if os.path.exists(Log) else []
+    Steps = sum(Run.Steps for Run in Runs)
+    Loop = sum(Run.LoopTime for Run in Runs)
+    Output = sum(Run.LoopTime * Run.Sections.get('Output', 0.0) / 100 for Run in Runs)
+    SecondsPerStep = Loop / Steps if Steps else None
+    if SecondsPerStep is None and len(Own) > 1:
+        Own.sort()
+        SecondsPerStep = (Own[-1][2] - Own[0][2]) / max(1, Own[-1][0] - Own[0][0])
+
+    Progress = PP.Probe(Stage.Path, EquilTime, CompTime)
+    Elapsed = None
+    if SecondsPerStep is not None and Progress.LastStep is not None:
+        Elapsed = SecondsPerStep * max(0, Progress.LastStep - Start)
+
+    RestartBytes = WriteSeconds = None
+    if Own:
+        Total = sum(Restart[1] for Restart in Own)
+        RestartBytes = Total / len(Own)
+        if Output > 0:
+            WriteSeconds = Output * Total / (Total + DumpBytes) / len(Own)
+        else:
+            WriteSeconds = RestartBytes / DefaultBandwidth
+    Failed = Progress.State == 'Crashed' or (Superseded and Progress.State == 'Running' and not Progress.RunEnded)
+    return StageRecord(Stage.Name, Start, Progress.LastStep, SecondsPerStep, Elapsed, len(Own), RestartBytes,
+                       WriteSeconds, bool(Own) and Output > 0, Failed)
+
+def ConditionRecords(Settings, Temp, Press):
+    ConditionDir = os.path.join(Settings['STARTINGDIR'], Temp, Press)
+    if not os.path.isdir(ConditionDir):
+        return []
+    Stages = RD.ScanCondition(ConditionDir)
+    Records = [ScanRecord(Stage, Settings['EquilTime'], Settings['CompTime'], i + 1 < len(Stages))
+               for i, Stage in enumerate(Stages)]
+    # A stage killed before its second restart file has no timing of its
+    # own, the condition's other stages run at the same speed
+    Known = [Record.SecondsPerStep for Record in Records if Record.SecondsPerStep]
+    if Known:
+        Records = [Record if Record.SecondsPerStep or Record.LastStep is None else
+                   Record._replace(SecondsPerStep=Known[-1],
+                                   Elapsed=Known[-1] * max(0, Record.LastStep - Record.Start)) for Record in Records]
+    return Records
+
+def CampaignRecords(Settings, Conditions):
+    # {(Temp, Press): [StageRecord, ...]} for (Temp, Press) pairs, read once
+    # per sweep as every log is parsed for them
+    return {(Temp, Press): ConditionRecords(Settings, Temp, Press) for Temp, Press in Conditions}
+
+def CampaignMTBF(Settings, Records):
+    # Seconds between failures over the stage records of CampaignRecords
+    Failures = 0
+    Exposure = 0.0
+    for Condition in Records.values():
+        for Record in Condition:
+            Failures += Record.Failed
+            Exposure += Record.Elapsed or 0.0
+    Prior = Reliability.get(Settings['HPC'], 48.0) * 3600
+    return (Exposure + Prior) / (Failures + 1)
+
+def PlanCondition(Settings, Temp, Press, MTBF, Records=None):
+    # The planned interval of a condition, from its latest stage with
+    # timing and restart files (a measured write time before an estimated
+    # one). Without one the rest is None and the RestartFileFreq in Settings
+    # is kept
+    CompTime = int(Settings['CompTime'])
+    Current = int(Settings['RestartFileFreq'])
+    if Records is None:
+        Records = ConditionRecords(Settings, Temp, Press)
+    Measured = [Record for Record in Records if Record.WriteSeconds is not None and Record.SecondsPerStep]
+    if not Measured:
+        return Plan(Temp, Press, None, MTBF, None, None, None, None, None, None, None, None)
+    Record = sorted(Measured, key=lambda x: x.Timed)[-1]
+    Cost = Record.WriteSeconds
+    LastStep = max(Each.LastStep or 0 for Each in Records)
+    Remaining = max(0, CompTime - LastStep) * Record.SecondsPerStep
+
+    # The inputs take whole steps that divide both phases, the one closest
+    # to Daly's optimum in waste rather than in steps
+    Optimum = Daly(Cost, MTBF) / Record.SecondsPerStep
+    Steps = Divisors(math.gcd(int(Settings['EquilTime']), CompTime))
+    Below = [Each for Each in Steps if Each <= Optimum]
+    Above = [Each for Each in Steps if Each > Optimum]
+    Choices = Below[-1:] + Above[:1]
+    IntervalSteps = min(Choices, key=lambda x: sum(Waste(1.0, x * Record.SecondsPerStep, Cost, MTBF)))
+    Interval = IntervalSteps * Record.SecondsPerStep
+    Overhead, Lost = Waste(Remaining, Interval, Cost, MTBF)
+    CurrentOverhead, CurrentLost = Waste(Remaining, CompTime / Current * Record.SecondsPerStep, Cost, MTBF)
+    return Plan(Temp, Press, Cost, MTBF, Record.SecondsPerStep, Interval, IntervalSteps, Remaining, Overhead,
+                Lost, CurrentOverhead, CurrentLost)
+
+def PrintPlans(Settings, Temperatures, Pressures):
+    Conditions = [(Temp, Press) for Temp in Temperatures for Press in Pressures]
+    Records = CampaignRecords(Settings, Conditions)
+    MTBF = CampaignMTBF(Settings, Records)
+    Current = int(Settings['CompTime']) // int(Settings['RestartFileFreq'])
+    print(f'Mean time between failures {MTBF / 3600:.1f} h, restart files every {Current} steps now')
+    print(f'{"Temp":<8}{"Press":<8}{"Write s":>9}{"Interval h":>12}{"Steps":>10}{"Left h":>9}'
+          f'{"I/O h":>8}{"Lost h":>8}{"Now I/O h":>11}{"Now lost h":>12}')
+    for Temp, Press in Conditions:
+        Planned = PlanCondition(Settings, Temp, Press, MTBF, Records[(Temp, Press)])
+        if Planned.Cost is None:
+            print(f'{Temp:<8}{Press:<8}{"-":>9}{"-":>12}{Current:>10}')
+            continue
+        print(f'{Temp:<8}{Press:<8}{Planned.Cost:>9.2f}{Planned.Interval / 3600:>12.2f}{Planned.IntervalSteps:>10}'
+              f'{Planned.Remaining / 3600:>9.1f}{Planned.Overhead / 3600:>8.2f}'
+              f'{Planned.Lost / 3600:>8.2f}{Planned.CurrentOverhead / 3600:>11.2f}{Planned.CurrentLost / 3600:>12.2f}')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintPlans(FG.Settings, FG.Temperatures, FG.Pressures)
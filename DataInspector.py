@@ -0,0 +1,235 @@
+"""
+Sizing of a campaign from the {System}.data file in SourceDir
+
+- The Atoms section (atom_style charge: id type q x y z [ix iy iz]) is parsed
+  in one np.fromstring call, the header for the box
+- The parsed atoms are cached as .{System}.data.inspect.npz in STARTINGDIR
+  (not next to the data file, as everything in SourceDir is staged into
+  every stage), keyed by the SHA-1 of its contents. The file is only hashed
+  again when its size or mtime has changed, and only parsed again when its
+  hash has
+- From the atoms: the count of every type, the z distribution, the atoms in
+  each of the inputs' layers (bot_fixed ... top_fixed, Profiles.Regions) for
+  Wall_Z/Fix_Z/Thermo_Z, and the thickness of the bottom and top slabs of
+  the surface type, which Wall_Z should match
+- For a number of MPI ranks the box is split the way LAMMPS does (the
+  processor grid with the least subdomain surface) and the atoms counted per
+  subdomain, with and without the ghost atoms within GhostCutoff. reax/c
+  sizes its arrays max(safezone * atoms, mincap), so Safezone covers the
+  densest subdomain against the average and Mincap the most atoms any
+  subdomain holds with its ghosts, both with Margin to spare for the
+  compression. Memory per rank is estimated from the far neighbour list
+
+With Safezone or Mincap set to 'auto' in FileGenerator.py these values are
+used for the sweep. Run this file directly to print the sizing of the data
+file in FileGenerator.py.
+"""
+
+import os
+import re
+import math
+import hashlib
+import numpy as np
+from collections import namedtuple
+import Profiles as PR
+import Performance as PF
+import NpzCache as NC
+
+CacheVersion = 1
+GhostCutoff = 12.0 # reax/c's 10 A non-bonded cutoff plus the 2 A skin
+Margin = 1.5
+Resolution = 1.0 # A, of the z distribution
+BytesPerNeighbour = 48 # reax/c far_neighbor_data
+BytesPerAtom = 4096 # Bonds, hydrogen bonds and workspace per atom
+
+# Box is [[xlo, xhi], [ylo, yhi], [zlo, zhi]], Id/Type/Position sorted by id
+DataFile = namedtuple('DataFile', ['Path', 'Hash', 'Box', 'Id', 'Type', 'Position'])
+Sizing = namedtuple('Sizing', ['Ranks', 'Grid', 'MaxLocal', 'MeanLocal', 'MaxTotal', 'Safezone', 'Mincap',
+                               'MemoryMB'])
+
+def FileHash(Path, ChunkBytes=1 << 24):
+    Hash = hashlib.sha1()
+    with open(Path, 'rb') as file:
+        while True:
+            Data = file.read(ChunkBytes)
+            if not Data:
+                break
+            Hash.update(Data)
+    return Hash.hexdigest()
+
+def ParseData(Path):
+    # (Box, Id, Type, Position) of a data file
+    with open(Path, 'rb') as file:
+        Data = file.read()
+    Atoms = int(re.search(rb'^\s*(\d+)\s+atoms\s*$', Data, re.M).group(1))
+    Box = np.array([[float(x) for x in re.search(rb'^\s*(\S+)\s+(\S+)\s+%s\s+%s' % (Low, High), Data, re.M).groups()]
+                    for Low, High in ((b'xlo', b'xhi'), (b'ylo', b'yhi'), (b'zlo', b'zhi'))])
+    Header = re.search(rb'^Atoms\b.*$', Data, re.M)
+    if Header is None:
+        raise ValueError(f'No Atoms section in {Path}')
+    # The section runs to the next section keyword or the end of the file
+    Next = re.compile(rb'^\s*[A-Za-z]', re.M).search(Data, Header.end() + 1)
+    Block = Data[Header.end():Next.start() if Next else len(Data)]
+    if b'#' in Block:
+        Block = b'\n'.join(Line.split(b'#')[0] for Line in Block.split(b'\n'))
+    Values = np.fromstring(Block.decode(), dtype=np.float64, sep=' ')
+    if len(Values) % Atoms:
+        raise ValueError(f'{len(Values)} values in the Atoms section of {Path} for {Atoms} atoms')
+    Values = Values.reshape(Atoms, -1)
+    Values = Values[np.argsort(Values[:, 0])]
+    return Box, Values[:, 0].astype(np.int64), Values[:, 1].astype(np.int64), Values[:, 3:6].copy()
+
+def CachePath(Path, CacheDir):
+    return os.path.join(CacheDir, f'.{os.path.basename(Path)}.inspect.npz')
+
+def ReadData(Path, CacheDir, Caching=True):
+    Stat = os.stat(Path)
+    Cache = CachePath(Path, CacheDir)
+    Cached = None
+    if Caching:
+        try:
+            with np.load(Cache) as Loaded:
+                if int(Loaded['Version']) == CacheVersion:
+                    Cached = {Key: Loaded[Key] for Key in Loaded.files}
+        except (OSError, KeyError, ValueError):
+            Cached = None
+    if Cached is not None and int(Cached['Size']) == Stat.st_size and int(Cached['MtimeNs']) == Stat.st_mtime_ns:
+        Hash = str(Cached['Hash'])
+    else:
+        Hash = FileHash(Path)
+        if Cached is not None and str(Cached['Hash']) != Hash:
+            Cached = None
+
+    if Cached is None:
+        Box, Id, Type, Position = ParseData(Path)
+    else:
+        Box, Id, Type, Position = Cached['Box'], Cached['Id'], Cached['Type'], Cached['Position']
+    if Caching and (Cached is None or int(Cached['Size']) != Stat.st_size
+                    or int(Cached['MtimeNs']) != Stat.st_mtime_ns):
+        NC.SaveNpzAtomic(Cache, Version=CacheVersion, Hash=Hash, Size=Stat.st_size, MtimeNs=Stat.st_mtime_ns,
+                         Box=Box, Id=Id, Type=Type, Position=Position)
+    return DataFile(Path, Hash, Box, Id, Type, Position)
+
+def TypeCounts(Data):
+    Types, Counts = np.unique(Data.Type, return_counts=True)
+    return {int(Type): int(Count) for Type, Count in zip(Types, Counts)}
+
+def ZDistribution(Data, Resolution=Resolution):
+    # (bin centres, atoms per bin for each type in TypeCounts order)
+    Low, High = Data.Box[2]
+    Bins = max(1, int(math.ceil((High - Low) / Resolution)))
+    Bin = np.clip(((Data.Position[:, 2] - Low) / Resolution).astype(np.int64), 0, Bins - 1)
+    Types = sorted(TypeCounts(Data))
+    Row = np.searchsorted(Types, Data.Type)
+    Counts = np.bincount(Row * Bins + Bin, minlength=len(Types) * Bins).reshape(len(Types), Bins)
+    return Low + (np.arange(Bins) + 0.5) * Resolution, Counts
+
+def Layers(Data, Wall_Z, Fix_Z, Thermo_Z):
+    # Atoms in each of the inputs' groups
+    Z = Data.Position[:, 2]
+    Group = PR.GroupOf(Z, PR.Regions(Z, Wall_Z, Fix_Z, Thermo_Z))
+    return dict(zip(PR.Groups, np.bincount(Group, minlength=len(PR.Groups)).tolist()))
+
+def SlabThickness(Data, SurfaceType):
+    # z thickness of the bottom and top slabs of SurfaceType, split at the
+    # widest gap between its atoms
+    Z = np.sort(Data.Position[Data.Type == int(SurfaceType), 2])
+    if len(Z) < 2:
+        return None
+    Gap = int(np.argmax(np.diff(Z)))
+    Bottom = Data.Position[:, 2].min()
+    Top = Data.Position[:, 2].max()
+    return float(Z[Gap] - Bottom), float(Top - Z[Gap + 1])
+
+def ProcessorGrid(Box, Ranks):
+    # Px * Py * Pz = Ranks with the least subdomain surface, as LAMMPS picks
+    Lengths = Box[:, 1] - Box[:, 0]
+    Best = None
+    for Px in range(1, Ranks + 1):
+        if Ranks % Px:
+            continue
+        for Py in range(1, Ranks // Px + 1):
+            if (Ranks // Px) % Py:
+                continue
+            Pz = Ranks // Px // Py
+            Area = (Lengths[0] * Lengths[1] / (Px * Py) + Lengths[1] * Lengths[2] / (Py * Pz)
+                    + Lengths[0] * Lengths[2] / (Px * Pz))
+            if Best is None or Area < Best[0]:
+                Best = (Area, (Px, Py, Pz))
+    return Best[1]
+
+def Subdomains(Data, Grid, Cutoff=GhostCutoff):
+    # (owned, owned + ghost) atoms of every subdomain. x and y are periodic
+    Owned = []
+    Masks = []
+    for Axis, Count in enumerate(Grid):
+        Low, High = Data.Box[Axis]
+        Length = High - Low
+        Width = Length / Count
+        Coordinate = Data.Position[:, Axis]
+        Cell = np.clip(((Coordinate - Low) / Width).astype(np.int64), 0, Count - 1)
+        Owned.append(Cell)
+        if Axis < 2:
+            Near = [np.mod(Coordinate - (Low + k * Width - Cutoff), Length) < Width + 2 * Cutoff
+                    if Width + 2 * Cutoff < Length else np.ones(len(Coordinate), dtype=bool) for k in range(Count)]
+        else:
+            Near = [(Coordinate >= Low + k * Width - Cutoff) & (Coordinate < Low + (k + 1) * Width + Cutoff)
+                    for k in range(Count)]
+        Masks.append(Near)
+    Local = np.bincount((Owned[0] * Grid[1] + Owned[1]) * Grid[2] + Owned[2], minlength=int(np.prod(Grid)))
+    Total = np.array([(Masks[0][i] & Masks[1][j] & Masks[2][k]).sum()
+                      for i in range(Grid[0]) for j in range(Grid[1]) for k in range(Grid[2])])
+    return Local, Total
+
+def Size(Data, Ranks, Cutoff=GhostCutoff):
+    Grid = ProcessorGrid(Data.Box, Ranks)
+    Local, Total = Subdomains(Data, Grid, Cutoff)
+    MeanLocal = len(Data.Id) / Ranks
+    Safezone = max(1.2, math.ceil(10 * Margin * Local.max() / MeanLocal) / 10)
+    Mincap = int(math.ceil(Margin * Total.max() / 10) * 10)
+
+    # Far neighbours of an atom at the densest subdomain's number density,
+    # half of them stored (newton on)
+    Lengths = Data.Box[:, 1] - Data.Box[:, 0]
+    Volume = np.prod(Lengths / np.array(Grid) + 2 * Cutoff)
+    Neighbours = Total.max() / Volume * 4 / 3 * math.pi * Cutoff ** 3 / 2
+    Capacity = max(Safezone * Total.max(), Mincap)
+    MemoryMB = Capacity * (Neighbours * BytesPerNeighbour + BytesPerAtom) / 2 ** 20
+    return Sizing(Ranks, Grid, int(Local.max()), MeanLocal, int(Total.max()), Safezone, Mincap, MemoryMB)
+
+def DataPath(Settings):
+    return os.path.join(Settings['SOURCEDIR'], f'{Settings["System"]}.data')
+
+def MemoryParameters(Settings, Ranks=None):
+    # Settings values for Safezone and Mincap, computed where they are 'auto'
+    if Ranks is None:
+        Resources = Settings.get('Resources') or PF.DefaultResources[Settings['HPC']]
+        Ranks = Resources.Ranks
+    Sized = Size(ReadData(DataPath(Settings), Settings['STARTINGDIR']), Ranks)
+    return {'Safezone': f'{Sized.Safezone:g}' if Settings['Safezone'] == 'auto' else Settings['Safezone'],
+            'Mincap': str(Sized.Mincap) if Settings['Mincap'] == 'auto' else Settings['Mincap']}
+
+def PrintInspection(Settings, Ranks=None):
+    Ranks = Ranks or PF.DefaultResources[Settings['HPC']].Ranks
+    Data = ReadData(DataPath(Settings), Settings['STARTINGDIR'])
+    Lengths = Data.Box[:, 1] - Data.Box[:, 0]
+    print(f'{Data.Path}: {len(Data.Id)} atoms, box {Lengths[0]:.2f} x {Lengths[1]:.2f} x {Lengths[2]:.2f} A, '
+          f'sha1 {Data.Hash[:12]}')
+    Elements = {int(Settings[f'{Element}Type']): Element for Element in ('H', 'Fe', 'O', 'P', 'C')}
+    print('Atoms per type: ' + ', '.join(f'{Type} ({Elements.get(Type, "?")}) {Count}'
+                                         for Type, Count in TypeCounts(Data).items()))
+    Slabs = SlabThickness(Data, Settings['FeType'])
+    if Slabs is not None:
+        print(f'Surface slabs: bottom {Slabs[0]:.2f} A, top {Slabs[1]:.2f} A thick (Wall_Z = {Settings["Wall_Z"]})')
+    print('Atoms per layer: ' + ', '.join(f'{Group} {Count}' for Group, Count in
+                                          Layers(Data, Settings['Wall_Z'], Settings['Fix_Z'],
+                                                 Settings['Thermo_Z']).items()))
+    Sized = Size(Data, Ranks)
+    print(f'{Ranks} ranks as {Sized.Grid[0]}x{Sized.Grid[1]}x{Sized.Grid[2]}: at most {Sized.MaxLocal} atoms per '
+          f'rank ({Sized.MeanLocal:.0f} on average), {Sized.MaxTotal} with ghosts')
+    print(f'safezone {Sized.Safezone:g} mincap {Sized.Mincap}, about {Sized.MemoryMB:.0f} MB per rank '
+          f'(FileGenerator.py has safezone {Settings["Safezone"]} mincap {Settings["Mincap"]})')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintInspection(FG.Settings)
@@ -15,24 +15,8 @@ at the same 'stage', will need to check this.
 """
 
 ######### Imports #########
-import pandas as pd 
-import numpy as np
-import math
-import csv
 import os
-import collections
-from pathlib import Path
-import subprocess
-from copy import deepcopy
-import HelperFunctions as HF
-
-def runcmd(cmd, verbose = False, *args, **kwargs):
-    #bascially allows python to run a bash command, and the code makes sure 
-    #the error of the subproceess is communicated if it fails
-    process = subprocess.run(
-        cmd,
-        text=True,
-        shell=True)
+import GenerationEngine as GE
 
 ######### File Generation Parameters ###########
 
@@ -56,147 +40,39 @@ Temperatures = ['500K', '600K', '700K'] # Temperatures to be simulated
 Pressures = ['1GPa', '2GPa', '3GPa', '4GPa', '5GPa'] # Pressures to be simulated
 EquilPress = '10' # Equilibration Temperature, in MPa
 EquilTemp = '300'
-Safezone = '80' # System memory parameter
-Mincap = '180' # System memory parameter
+Safezone = '80' # System memory parameter, 'auto' to size it from the data file (DataInspector.py)
+Mincap = '180' # System memory parameter, 'auto' to size it from the data file
 RestartFileFreq = '100' 
 HPC = "Imperial"
 
+Workers = 8 # Number of conditions generated at the same time
+PoolType = 'thread' # 'thread' or 'process'
+SubmitMode = 'single' # 'single' for one qsub per condition, 'array' for one array job per sweep
+SchedulerConcurrency = 8 # Scheduler commands allowed in flight at once
+SchedulerTTL = 300 # Seconds a qstat snapshot is reused for
+ChainDepth = 0 # Further restart stages queued behind each new stage with afterany dependencies
+Recommend = False # Pick ranks, memory and walltime from the performance history (Performance.py)
+Checkpointing = False # Stop on a fresh restart file before the job's walltime runs out
+CheckpointMargin = 900 # Seconds before the walltime to stop at
+CheckpointPlanning = False # Steps between restart files planned per condition (CheckpointPlanner.py)
+MaxAttempts = 3 # Submissions of a stage that never starts before it's reported as Failed
+
 ############# Calling the function #########################
 
 FirstRun = False
-copycommand = 'cp'
-os.chdir(STARTINGDIR) # Go to starting directory
-
-for Temp in Temperatures:
-    for Press in Pressures:
-        os.chdir(STARTINGDIR) # Go to starting directory
-
-        #Make directories if they don't exist
-        try:
-            os.mkdir(f'{Temp}')
-        except FileExistsError:
-            pass
-        
-        os.chdir(os.path.join(STARTINGDIR, Temp))
-        
-        try:
-            os.mkdir(f'{Press}')
-        except FileExistsError:
-            pass
-
-        os.chdir(os.path.join(STARTINGDIR, Temp, Press))
-
-        # RestartList = [x for x in os.listdir() if 'Restart' in x]
-        
-        if FirstRun:
-            runcmd('mkdir FirstRun')
-            os.chdir(os.path.join(os.getcwd(), 'FirstRun')) #Enter first run directory
-            CWD = os.getcwd()
-            for file in os.listdir(SOURCEDIR): # Copy enabler files from source directory
-                runcmd(f'{copycommand} "{os.path.join(SOURCEDIR, file)}" {os.getcwd()}')
-        
-            HF.MakeLAMMPSFile(CWD, Wall_V, System, EquilTime, CompTime, Wall_Z, HType,
-                FeType, OType, PType, CType, ReaxFFTyping, Temp[:3], EquilTemp, Press[0],
-                EquilPress, Fix_Z, Thermo_Z, Safezone, Mincap, RestartFileFreq)            
-            
-            HF.MakePBSFile(System, Temp, Press, CWD)
-
-            runcmd(f'qsub {System}_{Temp}_{Press}.pbs')
-
-        # Check how many restarts there are 
-        RestartList = [x for x in os.listdir() if 'Restart' in x]
-        
-        # Condition for if it's the first restart
-        if len(RestartList) == 0:
-            runcmd('mkdir Restart_1')
-            os.chdir(os.path.join(os.getcwd(), f'Restart_1'))
-            for file in os.listdir(SOURCEDIR):  
-                runcmd(f'{copycommand} "{os.path.join(SOURCEDIR, file)}" {os.getcwd()}')
-
-            FirstStage = 'FirstRun' 
-            NextStage = 'Restart_1'
-
-            #Check if first run directory has all relevant files
-            if len(os.listdir(os.getcwd())) > 18:
-                print('Previous simulation ran, creating files for next simulation')
-                
-                HF.MakeFiles(STARTINGDIR, Temp, Press, FirstStage, NextStage,
-                copycommand, EquilTime, Wall_V, System, CompTime,
-                ReaxFFTyping, EquilTemp, EquilPress, Fix_Z, Thermo_Z,
-                Safezone, Mincap, RestartFileFreq, runcmd, HPC)
-                
-                runcmd(f'qsub {System}_{Temp}_{Press}.pbs')
-            
-            else:
-                print('Previous similation not yet run, creating files')
-                HF.MakeFiles(STARTINGDIR, Temp, Press, FirstStage, NextStage,
-                copycommand, EquilTime, Wall_V, System, CompTime,
-                ReaxFFTyping, EquilTemp, EquilPress, Fix_Z, Thermo_Z,
-                Safezone, Mincap, RestartFileFreq, runcmd, HPC)
-                
-                runcmd(f'qsub {System}_{Temp}_{Press}.pbs')		
-
-        # Condition for if it's after the first restart
-        else:
-            # Get number of restarted simulations
-            RestartNumbers = [x.split('_')[-1] for x in RestartList]
-            CurrentRestartNumber = int(sorted(RestartNumbers)[-1])
-            NextRestartNumber = CurrentRestartNumber + 1
-            PreviousRestartNumber = CurrentRestartNumber - 1
-
-            os.chdir(os.path.join(STARTINGDIR, Temp, Press, f'Restart_{CurrentRestartNumber}'))
-            #Check if previous restart has ran
-            
-            if len(os.listdir(os.getcwd())) > 18:
-                print('Previous simulation ran') # Could add note saying how far it ran
-
-                # Check if completely finished
-                files = os.listdir()
-
-                # Get restart file progress
-                equilfiles = [int(x.split('.')[-1]) for x in files if 'equil.restart' in x]
-                compfiles = [int(x.split('.')[-1]) for x in files if 'comp.restart' in x]
-                restartfiles = equilfiles + compfiles # Concatenating restart file numbers
-                restartfiles = sorted(restartfiles)
-
-                if restartfiles[-1] == CompTime:
-                    print('Simulation Completed')
-                    continue
-
-                os.chdir(os.path.join(STARTINGDIR, Temp, Press)) 
-                runcmd(f'mkdir Restart_{NextRestartNumber}')
-                os.chdir(os.path.join(STARTINGDIR, Temp, Press, f'Restart_{NextRestartNumber}')) 
-                
-                # Copy enabler files into 
-                for file in os.listdir(SOURCEDIR):  
-                    runcmd(f'{copycommand} "{os.path.join(SOURCEDIR, file)}" {os.getcwd()}')
-
-                FirstStage = f'Restart_{CurrentRestartNumber}' 
-                NextStage = f'Restart_{NextRestartNumber}'
-
-                HF.MakeFiles(STARTINGDIR, Temp, Press, FirstStage, NextStage,
-                copycommand, EquilTime, Wall_V, System, CompTime,
-                ReaxFFTyping, EquilTemp, EquilPress, Fix_Z, Thermo_Z,
-                Safezone, Mincap, RestartFileFreq, runcmd, HPC)
-                
-                runcmd(f'qsub {System}_{Temp}_{Press}.pbs')
-
-            else:
-                print('Previous similation not yet run, creating files in current directory')
-                os.chdir(os.path.join(STARTINGDIR, Temp, Press, f'Restart_{CurrentRestartNumber}')) 
-                for file in os.listdir(SOURCEDIR):  
-                    runcmd(f'{copycommand} "{os.path.join(SOURCEDIR, file)}" {os.getcwd()}')
-                
-                FirstStage = f'Restart_{PreviousRestartNumber}' 
-                if PreviousRestartNumber == 0:
-                    FirstStage = 'FirstRun'
-                
-                NextStage = f'Restart_{CurrentRestartNumber}'
-
-                HF.MakeFiles(STARTINGDIR, Temp, Press, FirstStage, NextStage,
-                copycommand, EquilTime, Wall_V, System, CompTime,
-                ReaxFFTyping, EquilTemp, EquilPress, Fix_Z, Thermo_Z,
-                Safezone, Mincap, RestartFileFreq, runcmd, HPC)
-                
-                runcmd(f'qsub {System}_{Temp}_{Press}.pbs')
-                
\ No newline at end of file
+LinkMode = 'hardlink' # How SourceDir files are staged: 'hardlink', 'symlink', 'reflink' or 'copy'
+
+Settings = dict(
+    STARTINGDIR=STARTINGDIR, SOURCEDIR=SOURCEDIR, System=System, EquilTime=EquilTime,
+    CompTime=CompTime, Wall_V=Wall_V, Wall_Z=Wall_Z, HType=HType, FeType=FeType,
+    OType=OType, PType=PType, CType=CType, Fix_Z=Fix_Z, Thermo_Z=Thermo_Z,
+    ReaxFFTyping=ReaxFFTyping, EquilPress=EquilPress, EquilTemp=EquilTemp,
+    Safezone=Safezone, Mincap=Mincap, RestartFileFreq=RestartFileFreq, HPC=HPC,
+    FirstRun=FirstRun, LinkMode=LinkMode, SubmitMode=SubmitMode,
+    SchedulerConcurrency=SchedulerConcurrency, SchedulerTTL=SchedulerTTL,
+    ChainDepth=ChainDepth, Recommend=Recommend, Checkpointing=Checkpointing,
+    CheckpointMargin=CheckpointMargin, CheckpointPlanning=CheckpointPlanning, MaxAttempts=MaxAttempts)
+
+if __name__ == '__main__':
+    Results = GE.RunSweep(Settings, Temperatures, Pressures, Workers=Workers, PoolType=PoolType)
+    GE.PrintReport(Results)
@@ -0,0 +1,138 @@
+"""
+Streaming reader for the fc_ave.dump files written by the compression/shear
+inputs (fix fc_ave ... v_s_bot v_p_bot file fc_ave.dump)
+
+- Files are read in chunks straight into NumPy arrays, never as a DataFrame
+- The byte offset reached in each file is remembered, so reading a growing
+  file again only parses the lines added since. A file that got shorter or
+  was replaced is read again from the start
+- The offset and rows are also cached as .fc_ave.dump.npz next to the dump,
+  keyed by its inode and the bytes just before the offset, so a new reader
+  (or process) only parses what was added since the last one
+- The stages of a condition are stitched by timestep (Stitching.py), a later
+  stage taking over from the first step it wrote
+- The friction coefficient is shear/normal (v_s_bot/v_p_bot), with its
+  running average over the condition
+
+Run this file directly to print the friction of every condition in
+FileGenerator.py.
+"""
+
+import os
+import numpy as np
+from collections import namedtuple
+import Stitching as ST
+import NpzCache as NC
+
+FileName = 'fc_ave.dump'
+CacheName = '.fc_ave.dump.npz'
+CacheVersion = 1
+
+Friction = namedtuple('Friction', ['Step', 'Shear', 'Normal', 'Mu', 'RunningMu'])
+
+def ParseRows(Data, Columns):
+    # Whitespace separated numbers to an (N, Columns) array, skipping the
+    # '#' header lines fix ave/time writes at the top of the file
+    if b'#' in Data:
+        Data = b'\n'.join(Line for Line in Data.split(b'\n') if not Line.lstrip().startswith(b'#'))
+    Values = np.fromstring(Data.decode(), dtype=np.float64, sep=' ')
+    return Values[:len(Values) - len(Values) % Columns].reshape(-1, Columns)
+
+def SaveCache(Path, Inode, Offset, Tail, Rows):
+    return NC.SaveNpzAtomic(Path, Version=CacheVersion, Inode=Inode, Offset=Offset,
+                            Tail=np.frombuffer(Tail, dtype=np.uint8), Rows=Rows)
+
+def LoadCache(Path, DumpPath, Stat, Columns):
+    # (Inode, Offset, Rows) cached for the dump, or None if the cache is
+    # missing or the dump isn't the file it was made from
+    try:
+        with np.load(Path) as Cache:
+            Inode, Offset = int(Cache['Inode']), int(Cache['Offset'])
+            if (int(Cache['Version']) != CacheVersion or Inode != Stat.st_ino or Stat.st_size < Offset
+                    or Cache['Rows'].shape[1:] != (Columns,)):
+                return None
+            if NC.ReadTail(DumpPath, Offset) != Cache['Tail'].tobytes():
+                return None
+            return Inode, Offset, Cache['Rows']
+    except (OSError, KeyError, ValueError, IndexError):
+        return None
+
+def FrictionCoefficient(Step, Shear, Normal):
+    Mu = np.divide(Shear, Normal, out=np.full_like(Shear, np.nan), where=Normal != 0)
+    Valid = ~np.isnan(Mu)
+    Count = np.cumsum(Valid)
+    Total = np.cumsum(np.where(Valid, Mu, 0.0))
+    RunningMu = np.divide(Total, Count, out=np.full_like(Total, np.nan), where=Count > 0)
+    return Friction(Step, Shear, Normal, Mu, RunningMu)
+
+class FrictionReader:
+    def __init__(self, ChunkBytes=1 << 24, Columns=3, Caching=True):
+        self.ChunkBytes = ChunkBytes
+        self.Caching = Caching
+        self.Columns = Columns # TimeStep v_s_bot v_p_bot
+        self._Files = {}
+        self._Stitcher = ST.Stitcher(self.Part, FileName)
+
+    def Read(self, Path):
+        # (N, Columns) array of everything in the file so far
+        Stat = os.stat(Path)
+        CachePath = os.path.join(os.path.dirname(Path), CacheName)
+        Known = self._Files.get(Path)
+        if Known is None and self.Caching:
+            Known = LoadCache(CachePath, Path, Stat, self.Columns)
+        if Known is None or Known[0] != Stat.st_ino or Stat.st_size < Known[1]:
+            Known = (Stat.st_ino, 0, np.empty((0, self.Columns)))
+        Inode, Offset, Rows = Known
+        if Stat.st_size == Offset:
+            return Rows
+
+        Chunks = [Rows]
+        with open(Path, 'rb') as file:
+            file.seek(Offset)
+            Rest = b''
+            while True:
+                Data = file.read(self.ChunkBytes)
+                if not Data:
+                    break
+                Data = Rest + Data
+                End = Data.rfind(b'\n') + 1 # A final line without a newline is still being written
+                Rest = Data[End:]
+                Chunks.append(ParseRows(Data[:End], self.Columns))
+                Offset += End
+        Rows = np.concatenate(Chunks)
+        if self.Caching and Offset != Known[1]:
+            SaveCache(CachePath, Inode, Offset, NC.ReadTail(Path, Offset), Rows)
+        self._Files[Path] = (Inode, Offset, Rows)
+        return Rows
+
+    def Part(self, Path, Stage):
+        Rows = self.Read(Path)
+        return ST.Part(Stage, Rows[:, 0].astype(np.int64), {'Shear': Rows[:, 1], 'Normal': Rows[:, 2]})
+
+    def View(self, STARTINGDIR, Temp, Press):
+        # Stitched view of the condition's fc_ave.dump files
+        return self._Stitcher.View(os.path.join(STARTINGDIR, Temp, Press))
+
+    def Condition(self, STARTINGDIR, Temp, Press):
+        # Friction of a condition across all of its stages
+        View = self.View(STARTINGDIR, Temp, Press)
+        return FrictionCoefficient(View.Step, View.Column('Shear'), View.Column('Normal'))
+
+def PrintFriction(STARTINGDIR, Temperatures, Pressures, Reader=None):
+    Reader = Reader or FrictionReader()
+    print(f'{"Temp":<8}{"Press":<8}{"Rows":>10}{"Step":>12}{"Mu":>12}{"Mean Mu":>12}')
+    for Temp in Temperatures:
+        for Press in Pressures:
+            if not os.path.isdir(os.path.join(STARTINGDIR, Temp, Press)):
+                print(f'{Temp:<8}{Press:<8}-')
+                continue
+            Result = Reader.Condition(STARTINGDIR, Temp, Press)
+            if len(Result.Step) == 0:
+                print(f'{Temp:<8}{Press:<8}{0:>10}')
+                continue
+            print(f'{Temp:<8}{Press:<8}{len(Result.Step):>10}{Result.Step[-1]:>12}'
+                  f'{Result.Mu[-1]:>12.4f}{Result.RunningMu[-1]:>12.4f}')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintFriction(FG.STARTINGDIR, FG.Temperatures, FG.Pressures)
@@ -0,0 +1,321 @@
+"""
+Engine to generate files/directories for every condition of a sweep in parallel
+
+- Every condition is worked on through explicit paths, never os.chdir, so
+  several conditions can be generated at the same time
+- Conditions are run on a thread pool (default) or a process pool
+- An exception in one condition is recorded and the rest of the sweep carries on
+- A summary report is returned/printed once every condition has been visited
+- Conditions with a job still queued or running are left alone, based on one
+  qstat snapshot per sweep (SchedulerState.py)
+- Restart files are read from the campaign index (CampaignIndex.py) and the
+  job ID of each submission is recorded back into it
+- Whether a stage ran, finished or crashed is read from the end of its
+  log.lammps (ProgressProbe.py). Crashed conditions are reported, not rerun,
+  and a stage that never started is resubmitted at most MaxAttempts times
+- Submission happens once every condition has been generated, through the
+  asynchronous scheduler client (SchedulerClient.py). With SubmitMode =
+  'single' one job per condition is submitted concurrently, with SubmitMode =
+  'array' the whole sweep goes to the scheduler as one array job
+- With ChainDepth > 0 that many further stages are generated behind each new
+  stage and submitted with afterany dependencies, so segments run back to
+  back without rerunning the generator. PBS can't make a job wait on one
+  subjob of an array, so chained sweeps are always submitted one job per
+  condition
+- With Recommend = True the ranks, memory and walltime of new jobs come from
+  the performance history of the campaign's logs (Performance.py)
+- Safezone/Mincap = 'auto' sizes reax/c's memory from the data file
+  (DataInspector.py)
+- With Checkpointing = True the inputs stop CheckpointMargin seconds before
+  the job's walltime on a fresh restart file, which the next stage resumes
+  from
+- With CheckpointPlanning = True every condition gets the restart interval
+  that balances restart writes against failures (CheckpointPlanner.py)
+"""
+
+import os
+import traceback
+from collections import namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import HelperFunctions as HF
+import CampaignIndex as CI
+import RestartDiscovery as RD
+import ProgressProbe as PP
+import Performance as PF
+import DataInspector as DI
+import CheckpointPlanner as CP
+import SchedulerClient as SC
+import SchedulerState as SS
+import Staging
+
+# Outcome of a single (Temperature, Pressure) condition
+# Chain holds the stages pre-generated behind Stage when ChainDepth > 0
+ConditionResult = namedtuple('ConditionResult', ['Temp', 'Press', 'Action', 'Stage', 'JobId', 'Error', 'Chain'],
+                             defaults=[()])
+
+def CopySourceFiles(Settings, CWD):
+    # Stage enabler files from source directory
+    Staging.StageFiles(Settings['SOURCEDIR'], CWD, Settings['LinkMode'])
+
+def ArrayTaskId(JobId, Task):
+    # PBS names subjobs 1234[5].server, SGE names tasks 1234.5
+    if '[]' in JobId:
+        return JobId.replace('[]', f'[{Task}]')
+    return f'{JobId}.{Task}'
+
+def IndexedSteps(Stage):
+    # The index keeps the latest equil and comp restart step of each stage
+    return ([Stage.EquilStep] if Stage.EquilStep is not None else [],
+            [Stage.CompStep] if Stage.CompStep is not None else [])
+
+def StageTimeout(Settings):
+    # LAMMPS timer timeout for the inputs, None unless checkpointing
+    if not Settings['Checkpointing']:
+        return None
+    return HF.JobTimeout(Settings['HPC'], Settings.get('Resources'), Settings['CheckpointMargin'])
+
+def MakeStage(Settings, Temp, Press, FirstStage, NextStage, State):
+    S = Settings
+    # Restart progress of the stage being restarted from, as indexed
+    restart = None
+    for Stage in State.Stages:
+        if Stage.Name == FirstStage:
+            restart = RD.LatestRestart(*IndexedSteps(Stage), S['EquilTime'])
+    HF.MakeFiles(S['STARTINGDIR'], Temp, Press, FirstStage, NextStage,
+                 S['LinkMode'], S['EquilTime'], S['Wall_V'], S['System'], S['CompTime'],
+                 S['ReaxFFTyping'], S['EquilTemp'], S['EquilPress'], S['Fix_Z'], S['Thermo_Z'],
+                 S['Safezone'], S['Mincap'], S['RestartFileFreq'], S['HPC'], restart, Resources=S.get('Resources'),
+                 Timeout=StageTimeout(S), RestartSteps=S.get('RestartSteps'))
+
+def MakeChain(Settings, Temp, Press, Number):
+    # Pre-generate ChainDepth stages behind stage Number, each resolving its
+    # restart file when its job starts
+    S = Settings
+    Chain = []
+    for Next in range(Number + 1, Number + 1 + S['ChainDepth']):
+        CWD = os.path.join(S['STARTINGDIR'], Temp, Press, RD.StageName(Next))
+        os.makedirs(CWD, exist_ok=True)
+        CopySourceFiles(S, CWD)
+        HF.MakeFiles(S['STARTINGDIR'], Temp, Press, RD.StageName(Next - 1), RD.StageName(Next),
+                     S['LinkMode'], S['EquilTime'], S['Wall_V'], S['System'], S['CompTime'],
+                     S['ReaxFFTyping'], S['EquilTemp'], S['EquilPress'], S['Fix_Z'], S['Thermo_Z'],
+                     S['Safezone'], S['Mincap'], S['RestartFileFreq'], S['HPC'], Chained=True,
+                     Resources=S.get('Resources'), Timeout=StageTimeout(S), RestartSteps=S.get('RestartSteps'))
+        Chain.append(RD.StageName(Next))
+    return tuple(Chain)
+
+def StageProgress(Settings, Temp, Press, Stage):
+    return PP.Probe(os.path.join(Settings['STARTINGDIR'], Temp, Press, Stage), Settings['EquilTime'],
+                    Settings['CompTime'])
+
+def GenerateCondition(Settings, Temp, Press, LiveJobs=None):
+    S = Settings
+    # A queued or running job would be duplicated, and could have its
+    # restart files overwritten, if the condition was generated again
+    if LiveJobs:
+        return ConditionResult(Temp, Press, 'Live', LiveJobs[0].Stage, LiveJobs[0].JobId, None)
+
+    ConditionDir = os.path.join(S['STARTINGDIR'], Temp, Press)
+    os.makedirs(ConditionDir, exist_ok=True) # Make directories if they don't exist
+
+    if S['CheckpointPlanning']:
+        S = dict(S, RestartSteps=CP.PlanCondition(S, Temp, Press, S['MTBF'], S['StageRecords'].get((Temp, Press)))
+                 .IntervalSteps)
+
+    if S['FirstRun']:
+        CWD = os.path.join(ConditionDir, 'FirstRun')
+        os.makedirs(CWD, exist_ok=True)
+        CopySourceFiles(S, CWD)
+
+        HF.MakeLAMMPSFile(CWD, S['Wall_V'], S['System'], S['EquilTime'], S['CompTime'], S['Wall_Z'],
+            S['HType'], S['FeType'], S['OType'], S['PType'], S['CType'], S['ReaxFFTyping'],
+            Temp[:3], S['EquilTemp'], Press[0], S['EquilPress'], S['Fix_Z'], S['Thermo_Z'],
+            S['Safezone'], S['Mincap'], S['RestartFileFreq'], S['HPC'], StageTimeout(S), S.get('RestartSteps'))
+        HF.MakePBSFile(S['System'], Temp, Press, CWD, S['HPC'], Resources=S.get('Resources'))
+
+        return ConditionResult(Temp, Press, 'FirstRun', 'FirstRun', None, None, MakeChain(S, Temp, Press, 0))
+
+    # Stage progress comes from the campaign index rather than listing directories
+    State = CI.Refresh(S['STARTINGDIR'], Temp, Press)
+    Restarts = [Stage for Stage in State.Stages if Stage.Number > 0]
+
+    # Condition for if it's the first restart
+    if len(Restarts) == 0:
+        CWD = os.path.join(ConditionDir, 'Restart_1')
+        os.makedirs(CWD, exist_ok=True)
+        CopySourceFiles(S, CWD)
+
+        MakeStage(S, Temp, Press, 'FirstRun', 'Restart_1', State)
+        return ConditionResult(Temp, Press, 'Created', 'Restart_1', None, None, MakeChain(S, Temp, Press, 1))
+
+    # Chained stages queued behind a stage that never ran are picked up
+    # again from the first stage that didn't run
+    while len(Restarts) > 1 and StageProgress(S, Temp, Press, Restarts[-2].Name).State == 'NotStarted':
+        Restarts.pop()
+
+    # Get number of restarted simulations
+    Current = Restarts[-1]
+    CurrentRestartNumber = Current.Number
+    NextRestartNumber = CurrentRestartNumber + 1
+    PreviousRestartNumber = CurrentRestartNumber - 1
+    CurrentDir = os.path.join(ConditionDir, f'Restart_{CurrentRestartNumber}')
+
+    # Check if previous restart has ran, from the end of its log.lammps
+    Progress = StageProgress(S, Temp, Press, Current.Name)
+    if Progress.State == 'Crashed':
+        # LAMMPS errors come back when rerun from the same restart, so
+        # leave the condition for someone to look at
+        return ConditionResult(Temp, Press, 'Crashed', Current.Name, None, Progress.Error)
+    if Progress.State != 'NotStarted':
+        # Check if completely finished
+        if Progress.Compressed:
+            return ConditionResult(Temp, Press, 'Completed', f'Restart_{CurrentRestartNumber}', None, None)
+
+        CWD = os.path.join(ConditionDir, f'Restart_{NextRestartNumber}')
+        os.makedirs(CWD, exist_ok=True)
+        CopySourceFiles(S, CWD)
+
+        MakeStage(S, Temp, Press, f'Restart_{CurrentRestartNumber}', f'Restart_{NextRestartNumber}', State)
+        return ConditionResult(Temp, Press, 'Created', f'Restart_{NextRestartNumber}', None, None,
+                               MakeChain(S, Temp, Press, NextRestartNumber))
+
+    # Previous simulation not yet run, creating files in current directory.
+    # A chained stage that found its predecessor already finished stops
+    # without writing anything, so check for that first
+    FirstStage = RD.StageName(PreviousRestartNumber)
+    if StageProgress(S, Temp, Press, FirstStage).Compressed:
+        return ConditionResult(Temp, Press, 'Completed', FirstStage, None, None)
+
+    # A job that dies before LAMMPS starts (a bad module, a missing binary)
+    # would die the same way on every resubmission
+    if Current.Attempts >= S['MaxAttempts']:
+        return ConditionResult(Temp, Press, 'Failed', Current.Name, None,
+                               f'{Current.Name} was submitted {Current.Attempts} times without LAMMPS writing '
+                               f'anything, not resubmitting it. Check the job output of {Current.JobId}')
+
+    CopySourceFiles(S, CurrentDir)
+
+    MakeStage(S, Temp, Press, FirstStage, f'Restart_{CurrentRestartNumber}', State)
+    return ConditionResult(Temp, Press, 'Regenerated', f'Restart_{CurrentRestartNumber}', None, None,
+                           MakeChain(S, Temp, Press, CurrentRestartNumber))
+
+def StageDir(Settings, Result, Stage=None):
+    return os.path.join(Settings['STARTINGDIR'], Result.Temp, Result.Press, Stage or Result.Stage)
+
+def StageScript(Settings, Result, Stage=None):
+    return f'{Settings["System"]}_{Result.Temp}_{Result.Press}.pbs', StageDir(Settings, Result, Stage)
+
+def RecordSubmissions(Settings, Results, Generated, Outcomes):
+    # Outcomes holds the job IDs of each generated condition's stage and
+    # chained stages, ending with an exception if a submission failed
+    Submitted = {}
+    for Result, Outcome in zip(Generated, Outcomes):
+        Updated = Result
+        for Stage, JobId in zip((Result.Stage,) + Result.Chain, Outcome):
+            if isinstance(JobId, BaseException):
+                Error = ''.join(traceback.format_exception(type(JobId), JobId, JobId.__traceback__))
+                Updated = Updated._replace(Action='Failed', Error=f'Submitting {Stage} failed:\n{Error}')
+                break
+            CI.RecordJob(Settings['STARTINGDIR'], Result.Temp, Result.Press, Stage, JobId)
+            if Stage == Result.Stage:
+                Updated = Updated._replace(JobId=JobId)
+        Submitted[(Result.Temp, Result.Press)] = Updated
+    return [Submitted.get((Result.Temp, Result.Press), Result) for Result in Results]
+
+def SubmitSweep(Settings, Results, Client):
+    # Submit every condition that had files generated this sweep, either one
+    # job each (concurrently) or all together as one array job. Chained
+    # stages are submitted behind their condition's job with afterany
+    # dependencies
+    Generated = [Result for Result in Results if Result.Action in ('FirstRun', 'Created', 'Regenerated')]
+    if len(Generated) == 0:
+        return Results
+
+    # PBS refuses an array with a single subjob, and only takes dependencies
+    # on a whole array, not on one of its subjobs, so chained sweeps are
+    # submitted one job per condition
+    Chained = any(Result.Chain for Result in Generated)
+    if Settings['SubmitMode'] == 'single' or len(Generated) == 1 or Chained:
+        Chains = [[StageScript(Settings, Result, Stage) for Stage in (Result.Stage,) + Result.Chain]
+                  for Result in Generated]
+        Outcomes = Client.SubmitChainsSync(Chains)
+        return RecordSubmissions(Settings, Results, Generated, Outcomes)
+
+    Conditions = [(Result.Temp, Result.Press, Result.Stage, StageDir(Settings, Result)) for Result in Generated]
+    try:
+        Script = HF.MakePBSArrayFile(Settings['System'], Conditions, Settings['STARTINGDIR'], Settings['HPC'],
+                                     Settings.get('Resources'))
+        ArrayId = Client.SubmitChainsSync([[(Script, Settings['STARTINGDIR'])]])[0][0]
+        if isinstance(ArrayId, BaseException):
+            raise ArrayId
+    except Exception as e:
+        return RecordSubmissions(Settings, Results, Generated, [[e]] * len(Generated))
+    TaskIds = [ArrayTaskId(ArrayId, Task) for Task in range(1, len(Generated) + 1)]
+    return RecordSubmissions(Settings, Results, Generated, [[TaskId] for TaskId in TaskIds])
+
+def SafeGenerateCondition(Settings, Temp, Press, LiveJobs=None):
+    # Per-condition error isolation, the traceback is kept for the report
+    try:
+        return GenerateCondition(Settings, Temp, Press, LiveJobs)
+    except Exception:
+        return ConditionResult(Temp, Press, 'Failed', None, None, traceback.format_exc())
+
+def RunSweep(Settings, Temperatures, Pressures, Workers=8, PoolType='thread', Queue=None):
+    Conditions = [(Temp, Press) for Temp in Temperatures for Press in Pressures]
+    return RunConditions(Settings, Conditions, Workers, PoolType, Queue)
+
+def RunConditions(Settings, Conditions, Workers=8, PoolType='thread', Queue=None):
+    # Conditions is a list of (Temp, Press)
+    if PoolType == 'thread':
+        Pool = ThreadPoolExecutor
+    elif PoolType == 'process':
+        Pool = ProcessPoolExecutor
+    else:
+        raise ValueError(f'Unknown pool type {PoolType!r}, expected "thread" or "process"')
+
+    # Queue can be passed in to share one snapshot between sweeps
+    if Queue is None:
+        Client = SC.SchedulerClient(Settings['HPC'], Concurrency=Settings['SchedulerConcurrency'])
+        Queue = SS.SchedulerState(Client, Settings['System'], Settings['STARTINGDIR'], Settings['SchedulerTTL'])
+    Live = Queue.LiveJobs() # One qstat for the whole sweep
+
+    # Ranks, memory and walltime from the performance history, worked out
+    # once for the sweep
+    if Settings['Recommend']:
+        Settings = dict(Settings, Resources=PF.RecommendFor(Settings))
+    # reax/c memory parameters sized from the data file for those ranks
+    if 'auto' in (Settings['Safezone'], Settings['Mincap']):
+        Settings = dict(Settings, **DI.MemoryParameters(Settings))
+    # One failure rate for the campaign, each condition plans its own interval
+    # from the stage records read here once for the sweep
+    if Settings['CheckpointPlanning']:
+        Records = CP.CampaignRecords(Settings, Conditions)
+        Settings = dict(Settings, MTBF=CP.CampaignMTBF(Settings, Records), StageRecords=Records)
+
+    Results = []
+    with Pool(max_workers=Workers) as Executor:
+        Futures = [Executor.submit(SafeGenerateCondition, Settings, Temp, Press, Live.get((Temp, Press)))
+                   for Temp, Press in Conditions]
+        for Future in as_completed(Futures):
+            Results.append(Future.result())
+
+    # Report in sweep order rather than completion order
+    Order = {Condition: i for i, Condition in enumerate(Conditions)}
+    Results.sort(key=lambda x: Order[(x.Temp, x.Press)])
+
+    Results = SubmitSweep(Settings, Results, Queue.Client)
+    Queue.Invalidate() # The queue has changed
+    return Results
+
+def PrintReport(Results):
+    print(f'{"Temp":<8}{"Press":<8}{"Action":<13}{"Stage":<12}{"Job":<16}Chained')
+    for Result in Results:
+        print(f'{Result.Temp:<8}{Result.Press:<8}{Result.Action:<13}{Result.Stage or "-":<12}'
+              f'{Result.JobId or "-":<16}{", ".join(Result.Chain) or "-"}')
+
+    Counts = Counter(Result.Action for Result in Results)
+    print(', '.join(f'{Action}: {Count}' for Action, Count in sorted(Counts.items())))
+
+    for Result in Results:
+        if Result.Error is not None:
+            print(f'\n{Result.Temp} {Result.Press} failed:\n{Result.Error}')
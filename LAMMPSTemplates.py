@@ -0,0 +1,756 @@
+"""
+Compiled, cached LAMMPS input templates
+
+- The inputs written by MakeLAMMPSFile and MakeLAMMPSRestartFile live here as
+  str.format templates, with LAMMPS's own ${...} braces doubled
+- Each template is parsed into literal/field segments once per process
+- Rendering takes a parameter object (a dict keyed by the template field
+  names) and caches the output keyed on those parameters
+- WriteIfChanged leaves a file, and its mtime, alone when it already holds
+  the rendered text
+- With a timeout (CheckpointParams) the inputs set LAMMPS's timer timeout
+  and write a restart file at the exact step every run that advanced ends
+  on, then quit if the timeout stopped it, so a job never loses more than
+  the margin before its walltime
+
+Run this file directly to benchmark rendering a whole sweep in memory
+against formatting every input from scratch, as the f-strings used to.
+"""
+
+import os
+import sys
+import time
+import string
+
+FirstRunTemplate = """
+echo both
+{Timer}
+units real 
+atom_style charge
+dimension 3 
+boundary p p f
+
+#----------------------initial variables-------------------------
+
+variable Temp_eq equal {EquilTemp} # Equilibration temperature in K
+variable       Press_eq  equal {EquilPress}*9.86923                  # Equilibration pressure in atm (10 MPa)
+
+variable Temp equal {Temp} # Temperature in K
+variable Press_MPa equal {Pressure}000 # Applied pressure in MPa
+variable       Press     equal ${{Press_MPa}}*9.86923        # Applied pressure in atm
+ 
+variable       Nequil    equal {EquilTime}                      # Number of timesteps (fs) to equilibrate (300 K, 1 atm)
+variable       Ncomp     equal {CompTime}                     # Number of timesteps (fs) to compress
+
+variable       Wall_v    equal {Wall_V}                      # Wall velocity (A/fs) - equal to 10 m/s
+
+variable       res       equal 0.5                         # Resolution for density profiles etc (A)
+
+timestep       0.25                                        # in fs
+
+#----------------------initial position of atoms------------------------- 
+read_data {System}.data
+#----------------------calculate variables-------------------------
+
+variable        Sz       equal lx*ly
+variable        z_top    equal (bound(all,zmax))
+variable        z_bot    equal (bound(all,zmin))
+variable        volume   equal ${{Sz}}*(${{z_top}}-${{z_bot}})
+
+variable        bot_wall_z equal bound(bot_wall,zmax)
+variable        top_wall_z equal bound(top_wall,zmin)
+variable        delta_h equal (v_top_wall_z-v_bot_wall_z)               # inner wall-wall
+variable        delta_out equal bound(all,zmax)-bound(all,zmin)         # outer wall-wall
+
+#-----------------------Wall and region definition ----------------------------------- 
+
+group Fe type {FeType}
+group P type {PType}
+group O type {OType}
+group C type {CType}
+group H type {HType}
+
+variable z_bot equal (bound(all,zmin))
+variable z_top equal (bound(all,zmax))
+variable wall_z equal {Wall_Z}
+variable z_top_l equal ${{z_top}}-${{wall_z}}
+variable z_bot_h equal ${{z_bot}}+${{wall_z}}
+
+region top_wall block INF INF INF INF ${{z_top_l}} ${{z_top}}
+region bot_wall block INF INF INF INF ${{z_bot}} ${{z_bot_h}}
+
+group top_wall region top_wall
+group bot_wall region bot_wall
+group walls union top_wall bot_wall
+group molecules subtract all walls
+
+variable fix_z equal {Fix_Z}
+variable thermo_z equal {Thermo_Z}
+variable z_top_fix equal ${{z_top}}-${{fix_z}}
+variable z_top_thermo equal ${{z_top_fix}}-${{thermo_z}}
+
+variable z_bot_fix equal ${{z_bot}}+${{fix_z}}
+variable z_bot_thermo equal ${{z_bot_fix}}+${{thermo_z}}
+
+region top_fixed block INF INF INF INF ${{z_top_fix}} ${{z_top}}
+region top_thermo block INF INF INF INF ${{z_top_thermo}} ${{z_top_fix}} 
+
+region bot_fixed block INF INF INF INF ${{z_bot}} ${{z_bot_fix}}
+region bot_thermo block INF INF INF INF ${{z_bot_fix}} ${{z_bot_thermo}}
+
+group top_fixed region top_fixed
+group top_thermo region top_thermo
+group top_free subtract top_wall top_thermo top_fixed
+
+group bot_fixed region bot_fixed
+group bot_thermo region bot_thermo
+group bot_free subtract bot_wall bot_thermo bot_fixed
+
+group total_check union molecules top_fixed top_thermo top_free bot_fixed bot_thermo bot_free
+
+#----------------------Estimate density-------------------------- 
+
+variable        dens_conv   equal 1.0E24/6.02214857E23                              #g/mol/A^3 to g/cm^3 
+variable        dens_liq    equal (mass(molecules)/(lx*ly*v_delta_h))*v_dens_conv
+
+#----------------------Defining the interactions-------------------------- 
+
+pair_style reax/c NULL checkqeq yes safezone {Safezone} mincap {Mincap}
+pair_coeff * * reaxFF_CHOFeP300 {ReaxFFTyping}
+#------------------------------------------------------------------------- 
+
+neighbor 2.0 bin #2 because the default parameter for skin is 2 in real units 
+neigh_modify every 10 delay 0 check no
+
+fix charge all qeq/reax 1 0.0 10.0 1e-6 reax/c 
+
+#----------------------ReaxFF Energies-------------------------
+
+compute reax all pair reax/c
+variable eb equal c_reax[1] # bond energy
+variable ea equal c_reax[2] # atom energy
+variable elp equal c_reax[3] # lone-pair energy
+variable emol equal c_reax[4] # molecule energy (0)
+variable ev equal c_reax[5] # valence angle energy
+variable epen equal c_reax[6] # double-bond valence angle penalty
+variable ecoa equal c_reax[7] # valence angle conjugation energy
+variable ehb equal c_reax[8] # hydrogen bond energy
+variable et equal c_reax[9] # torsion energy
+variable eco equal c_reax[10] # conjugation energy
+variable ew equal c_reax[11] # van der Waals energy
+variable ep equal c_reax[12] # Coulomb energy
+variable efi equal c_reax[13] # electric field energy (0)
+variable eqeq equal c_reax[14] # charge equilibration energy
+
+######################################################################
+#---------------------ReaxFF Minimization----------------------------#
+###################################################################### 
+
+fix freeze_top top_fixed setforce 0.0 0.0 0.0
+fix freeze_bot bot_fixed setforce 0.0 0.0 0.0 
+
+thermo 10 
+thermo_style custom step temp pe ke press pxx pyy pzz v_delta_h v_dens_liq
+
+dump ovito_min all custom 10 dump_min.lammpstrj id type x y z 
+
+minimize 1.0e-7 1.0e-7 40000 40000 
+min_style cg
+
+undump ovito_min
+
+##############################################
+#-------------Equilibrate--------------------#
+##############################################
+
+#-------------Top wall piston-------------------------
+
+unfix           freeze_top
+
+fix             piston_top top_fixed setforce 0.0 0.0 NULL
+
+# ----------- Heat and Thermostat ----------------------------
+
+group           movable subtract all top_fixed bot_fixed
+compute         temp_free movable temp
+compute         temp_surf walls temp
+
+velocity        movable create ${{Temp_eq}} 45722345
+
+compute         temp_y_top top_thermo temp/partial 0 1 0
+fix             lang_top   top_thermo langevin ${{Temp_eq}} ${{Temp_eq}} $(100.0*dt) 699483 zero yes
+fix_modify      lang_top   temp temp_y_top
+compute         temp_y_bot bot_thermo temp/partial 0 1 0
+fix             lang_bot   bot_thermo langevin ${{Temp_eq}} ${{Temp_eq}} $(100.0*dt) 2847563 zero yes
+fix_modify      lang_bot   temp temp_y_bot
+
+###########################################################################
+
+#-------------Compress to equil pressure--------------
+
+fix             nve_all all nve
+
+#1GPa = 0.14393 kcal mol-1 A-3, 1atm = 0.0000145837 kcal mol-1 A-3, kcal mol-1 A-3 x A2 = kcal mol-1 A-1
+variable        applied_press_eq equal ${{Press_eq}}                                                    # 10 MPa
+variable        applied_force_eq equal (${{applied_press_eq}}*0.0000145837*${{Sz}})                       # in kcal mol-1 A-1
+
+group top_fixed_fe subtract top_fixed O
+variable        z_force_top_fe_eq equal (-${{applied_force_eq}})/(count(top_fixed_fe))
+
+fix             comp_top_fe_eq top_fixed_fe aveforce NULL NULL v_z_force_top_fe_eq
+
+#-------------Bond info------------------------------
+
+fix             bonds_equil all reax/c/bonds 4000 bonds_equil.txt
+
+dump            ovito_equil all custom 4000 dump_equil.lammpstrj id type x y z
+
+#-------------Normal and shear forces-----------------------
+
+variable        s_bot equal -f_freeze_bot[1]/0.000014393/${{Sz}}
+variable        p_bot equal -f_freeze_bot[3]/0.000014393/${{Sz}}
+
+#------------Thermo Equil/Heat/Comp/Shear-----------------
+
+thermo          4000 
+thermo_style    custom step pe etotal c_temp_free c_temp_surf press pxx pyy pzz v_delta_h v_dens_liq v_s_bot v_p_bot
+thermo_modify   lost ignore flush yes
+
+#-------------Run Equilibration-------------------
+
+variable        Nequil_10 equal {EquilRestartEvery}
+restart         ${{Nequil_10}} equil.restart
+{EquilStart}run             ${{Nequil}}
+{EquilCheckpoint}
+unfix           lang_top
+unfix           lang_bot
+
+unfix           bonds_equil
+undump          ovito_equil
+
+fix             lang_top_2 top_thermo langevin ${{Temp}} ${{Temp}} $(100*dt) 699483 zero yes
+fix_modify      lang_top_2 temp temp_y_top
+
+fix             lang_bot_2 bot_thermo langevin ${{Temp}} ${{Temp}} $(100*dt) 284756 zero yes
+fix_modify      lang_bot_2 temp temp_y_bot
+
+
+###################################################
+# ----------Compression and Shear-----------------#
+###################################################
+
+#-------------Compress to set pressure--------------
+
+#1GPa = 0.14393 kcal mol-1 A-3, 1atm = 0.0000145837 kcal mol-1 A-3, kcal mol-1 A-3 x A2 = kcal mol-1 A-1
+variable        applied_press equal ${{Press}}
+variable        applied_force equal (${{applied_press}}*0.0000145837*${{Sz}})                       #in kcal mol-1 A-1 (/2 if applied to both surfaces)
+print           "Applied Force = ${{applied_force}} kcal mol^-1 A^-1"                            
+print           "Surface Area = ${{Sz}} A^2"
+
+group top_fixed_fe subtract top_fixed O
+variable        z_force_top_fe equal (-${{applied_force}})/(count(top_fixed_fe))
+print           "z_force_top_fe = ${{z_force_top_fe}} kcal mol-1 A-1"
+
+fix             comp_top_fe top_fixed_fe aveforce NULL NULL v_z_force_top_fe
+
+#---------Add Velocity-----------------------------
+
+variable        vel_top equal  ${{Wall_v}}/2     
+variable        vel_bot equal -${{Wall_v}}/2 
+velocity        top_fixed set ${{vel_top}} 0.0 0.0 units box
+velocity        top_fixed set ${{vel_bot}} 0.0 0.0 units box
+
+#---------Calculate Friction-----------------------------
+
+variable        div_s    equal 1000
+variable        ts_div_s equal ${{Ncomp}}/${{div_s}}
+
+fix             fc_ave all ave/time 1 ${{ts_div_s}} ${{ts_div_s}} v_s_bot v_p_bot file fc_ave.dump
+
+#-------------Bond info-------------------------------
+
+fix             bonds_comp all reax/c/bonds 4000 bonds_comp.txt
+
+dump            ovito_comp all custom 4000 dump_comp.lammpstrj id type x y z
+
+#-----------Run Compression and Shear-----------------------
+
+variable        Ncomp_10 equal {CompRestartEvery}
+restart         ${{Ncomp_10}} comp.restart
+
+{CompStart}run             ${{Ncomp}} upto
+{CompCheckpoint}
+unfix           bonds_comp
+undump          ovito_comp
+"""
+
+EquilibrationTemplate = """echo both
+{Timer}units real 
+atom_style charge
+dimension 3 
+boundary p p f
+
+#----------------------initial variables-------------------------
+variable       Temp_eq equal {EquilTemp} # Equilibration temperature in K
+variable       Press_eq  equal {EquilPress}*9.86923                  # Equilibration pressure in atm (10 MPa)
+
+variable Temp equal {Temp} # Temperature in K
+variable Press_MPa equal {Pressure}000 # Applied pressure in MPa
+variable       Press     equal ${{Press_MPa}}*9.86923        # Applied pressure in atm
+
+variable       Nequil    equal {EquilTime}                      # Number of timesteps (fs) to equilibrate (300 K, 1 atm)
+
+variable       Ncomp     equal {CompTime}                     # Number of timesteps (fs) to compress
+
+variable       Wall_v    equal {Wall_V}                      # Wall velocity (A/fs) - equal to 10 m/s
+
+variable       res       equal 0.5                         # Resolution for density profiles etc (A)
+
+timestep       0.25                                        # in fs
+
+#----------------------initial position of atoms------------------------- 
+
+read_restart {restartfilename}
+
+#----------------------calculate variables-------------------------
+
+variable        Sz       equal lx*ly
+variable        z_top    equal (bound(all,zmax))
+variable        z_bot    equal (bound(all,zmin))
+variable        volume   equal ${{Sz}}*(${{z_top}}-${{z_bot}})
+
+variable        bot_wall_z equal bound(bot_wall,zmax)
+variable        top_wall_z equal bound(top_wall,zmin)
+variable        delta_h equal (v_top_wall_z-v_bot_wall_z)               # inner wall-wall
+variable        delta_out equal bound(all,zmax)-bound(all,zmin)         # outer wall-wall
+
+#----------------------Estimate density-------------------------- 
+
+variable        dens_conv   equal 1.0E24/6.02214857E23                              #g/mol/A^3 to g/cm^3 
+variable        dens_liq    equal (mass(molecules)/(lx*ly*v_delta_h))*v_dens_conv
+
+#----------------------Defining the interactions-------------------------- 
+
+pair_style reax/c NULL checkqeq yes safezone {Safezone} mincap {Mincap} 
+pair_coeff * * reaxFF_CHOFeP300 {ReaxFFTyping}
+
+#------------------------------------------------------------------------- 
+
+neighbor 2.0 bin #2 because the default parameter for skin is 2 in real units 
+neigh_modify every 10 delay 0 check no
+
+fix charge all qeq/reax 1 0.0 10.0 1e-6 reax/c 
+
+#----------------------ReaxFF Energies-------------------------
+
+fix freeze_bot bot_fixed setforce 0.0 0.0 0.0 
+
+thermo 10 
+thermo_style custom step temp pe ke press pxx pyy pzz v_delta_h v_dens_liq
+
+#-------------Top wall piston-------------------------
+
+fix             piston_top top_fixed setforce 0.0 0.0 NULL
+
+# ----------- Heat and Thermostat ----------------------------
+
+compute         temp_free movable temp
+compute         temp_surf walls temp
+
+velocity        movable create ${{Temp_eq}} 45722345
+
+compute         temp_y_top top_thermo temp/partial 0 1 0
+fix             lang_top   top_thermo langevin ${{Temp_eq}} ${{Temp_eq}} $(100.0*dt) 699483 zero yes
+fix_modify      lang_top   temp temp_y_top
+compute         temp_y_bot bot_thermo temp/partial 0 1 0
+fix             lang_bot   bot_thermo langevin ${{Temp_eq}} ${{Temp_eq}} $(100.0*dt) 2847563 zero yes
+fix_modify      lang_bot   temp temp_y_bot
+
+###########################################################################
+
+#-------------Compress to equil pressure--------------
+
+fix             nve_all all nve
+
+#1GPa = 0.14393 kcal mol-1 A-3, 1atm = 0.0000145837 kcal mol-1 A-3, kcal mol-1 A-3 x A2 = kcal mol-1 A-1
+variable        applied_press_eq equal ${{Press_eq}}                                                    # 10 MPa
+variable        applied_force_eq equal (${{applied_press_eq}}*0.0000145837*${{Sz}})                       # in kcal mol-1 A-1
+
+variable        z_force_top_fe_eq equal (-${{applied_force_eq}})/(count(top_fixed_fe))
+
+fix             comp_top_fe_eq top_fixed_fe aveforce NULL NULL v_z_force_top_fe_eq
+
+#-------------Bond info------------------------------
+
+fix             bonds_equil all reax/c/bonds 4000 bonds_equil.txt
+
+dump            ovito_equil all custom 4000 dump_equil.lammpstrj id type x y z
+
+
+#-------------Normal and shear forces-----------------------
+
+variable        s_bot equal -f_freeze_bot[1]/0.000014393/${{Sz}}
+variable        p_bot equal -f_freeze_bot[3]/0.000014393/${{Sz}}
+
+#------------Thermo Equil/Heat/Comp/Shear-----------------
+
+thermo          4000 
+thermo_style    custom step pe etotal c_temp_free c_temp_surf press pxx pyy pzz v_delta_h v_dens_liq v_s_bot v_p_bot
+thermo_modify   lost ignore flush yes
+
+#-------------Run Equilibration-------------------
+
+variable        Nequil_10 equal {EquilRestartEvery}
+restart         ${{Nequil_10}} equil.restart
+
+{EquilStart}run             ${{Nequil}} upto
+{EquilCheckpoint}
+unfix           lang_top
+unfix           lang_bot
+
+unfix           bonds_equil
+undump          ovito_equil
+
+
+fix             lang_top_2 top_thermo langevin ${{Temp}} ${{Temp}} $(100*dt) 699483 zero yes
+fix_modify      lang_top_2 temp temp_y_top
+
+fix             lang_bot_2 bot_thermo langevin ${{Temp}} ${{Temp}} $(100*dt) 284756 zero yes
+fix_modify      lang_bot_2 temp temp_y_bot
+
+#------------Thermo Equil/Heat/Comp/Shear-----------------
+
+thermo          4000 
+thermo_style    custom step pe etotal c_temp_free c_temp_surf press pxx pyy pzz v_s_bot v_p_bot
+thermo_modify   lost ignore flush yes
+
+
+###################################################
+# ----------Compression and Shear-----------------#
+###################################################
+
+#-------------Compress to set pressure--------------
+
+variable        applied_press equal ${{Press}}
+variable        applied_force equal (${{applied_press}}*0.0000145837*${{Sz}})                       #in kcal mol-1 A-1 (/2 if applied to both surfaces)
+print           "Applied Force = ${{applied_force}} kcal mol^-1 A^-1"                            
+print           "Surface Area = ${{Sz}} A^2"
+
+#variable        z_force_top   equal (-${{applied_force}})/(count(top_fixed))
+#print           "z_force_top = ${{z_force_top}} kcal mol-1 A-1"
+#fix             comp_top top_fixed aveforce NULL NULL ${{z_force_top}}
+
+group top_fixed_fe subtract top_fixed O
+variable        z_force_top_fe equal (-${{applied_force}})/(count(top_fixed_fe))
+print           "z_force_top_fe = ${{z_force_top_fe}} kcal mol-1 A-1"
+fix             comp_top_fe top_fixed_fe aveforce NULL NULL v_z_force_top_fe
+
+#---------Add Velocity-----------------------------
+
+variable        vel_top equal  ${{Wall_v}}/2     
+velocity        top_fixed set ${{vel_top}} 0.0 0.0 units box
+
+#---------Calculate Friction-----------------------------
+
+variable        div_s    equal {RestartFileFreq}
+variable        ts_div_s equal ${{Ncomp}}/${RestartFileFreq}
+
+fix             fc_ave all ave/time 1 ${{ts_div_s}} ${{ts_div_s}} v_s_bot v_p_bot file fc_ave.dump
+
+#-------------Bond info-------------------------------
+
+fix             bonds_comp all reax/c/bonds 4000 bonds_comp.txt
+
+dump            ovito_comp all custom 4000 dump_comp.lammpstrj id type x y z
+
+#-----------Run Compression and Shear-----------------------
+
+variable        Ncomp_100 equal {CompRestartEvery}
+restart         ${{Ncomp_100}} comp.restart
+
+{CompStart}run             ${{Ncomp}}
+{CompCheckpoint}
+unfix           bonds_comp
+undump          ovito_comp    
+"""
+
+CompShearTemplate = """echo both
+{Timer}units real 
+atom_style charge
+dimension 3 
+boundary p p f
+
+#----------------------initial variables-------------------------
+
+variable Temp equal {Temp} # Temperature in K
+variable Press_MPa equal {Pressure}000 # Applied pressure in MPa
+variable       Press     equal ${{Press_MPa}}*9.86923        # Applied pressure in atm
+
+variable       Nequil    equal {EquilTime}                      # Number of timesteps (fs) to equilibrate (300 K, 1 atm)
+
+variable       Ncomp     equal {CompTime}                     # Number of timesteps (fs) to compress
+
+variable       Wall_v    equal {Wall_V}                      # Wall velocity (A/fs) - equal to 10 m/s
+
+variable       res       equal 0.5                         # Resolution for density profiles etc (A)
+
+timestep       0.25                                        # in fs
+
+#----------------------initial position of atoms------------------------- 
+
+read_restart {restartfilename}
+
+#----------------------calculate variables-------------------------
+
+variable        Sz       equal lx*ly
+
+#----------------------Estimate density-------------------------- 
+
+#variable        dens_conv   equal 1.0E24/6.02214857E23                              #g/mol/A^3 to g/cm^3 
+#variable        dens_liq    equal (mass(molecules)/(lx*ly*v_delta_h))*v_dens_conv
+
+#----------------------Defining the interactions-------------------------- 
+
+pair_style reax/c NULL checkqeq yes safezone {Safezone} mincap {Mincap} 
+pair_coeff * * reaxFF_CHOFeP300 {ReaxFFTyping}
+
+#------------------------------------------------------------------------- 
+
+neighbor 2.0 bin #2 because the default parameter for skin is 2 in real units 
+neigh_modify every 10 delay 0 check no
+
+fix charge all qeq/reax 1 0.0 10.0 1e-6 reax/c 
+
+#----------------------ReaxFF Energies-------------------------
+
+fix freeze_bot bot_fixed setforce 0.0 0.0 0.0 
+
+#-------------Top wall piston-------------------------
+
+fix             piston_top top_fixed setforce 0.0 0.0 NULL
+
+# ----------- Heat and Thermostat ----------------------------
+
+compute         temp_free movable temp
+compute         temp_surf walls temp
+
+compute         temp_y_top top_thermo temp/partial 0 1 0
+compute         temp_y_bot bot_thermo temp/partial 0 1 0
+
+
+###########################################################################
+
+#-------------Compress to equil pressure--------------
+
+fix             nve_all all nve
+
+#-------------Normal and shear forces-----------------------
+
+variable        s_bot equal -f_freeze_bot[1]/0.000014393/${{Sz}}
+variable        p_bot equal -f_freeze_bot[3]/0.000014393/${{Sz}}
+
+#-------------Run Equilibration-------------------
+
+fix             lang_top_2 top_thermo langevin ${{Temp}} ${{Temp}} $(100*dt) 699483 zero yes
+fix_modify      lang_top_2 temp temp_y_top
+
+fix             lang_bot_2 bot_thermo langevin ${{Temp}} ${{Temp}} $(100*dt) 284756 zero yes
+fix_modify      lang_bot_2 temp temp_y_bot
+
+#------------Thermo Equil/Heat/Comp/Shear-----------------
+
+thermo          4000 
+thermo_style    custom step pe etotal c_temp_free c_temp_surf press pxx pyy pzz v_s_bot v_p_bot
+thermo_modify   lost ignore flush yes
+
+
+###################################################
+# ----------Compression and Shear-----------------#
+###################################################
+
+#-------------Compress to set pressure--------------
+
+variable        applied_press equal ${{Press}}
+variable        applied_force equal (${{applied_press}}*0.0000145837*${{Sz}})                       #in kcal mol-1 A-1 (/2 if applied to both surfaces)
+print           "Applied Force = ${{applied_force}} kcal mol^-1 A^-1"                            
+print           "Surface Area = ${{Sz}} A^2"
+
+#variable        z_force_top   equal (-${{applied_force}})/(count(top_fixed))
+#print           "z_force_top = ${{z_force_top}} kcal mol-1 A-1"
+#fix             comp_top top_fixed aveforce NULL NULL ${{z_force_top}}
+
+group top_fixed_fe subtract top_fixed O
+variable        z_force_top_fe equal (-${{applied_force}})/(count(top_fixed_fe))
+print           "z_force_top_fe = ${{z_force_top_fe}} kcal mol-1 A-1"
+fix             comp_top_fe top_fixed_fe aveforce NULL NULL v_z_force_top_fe
+
+#---------Add Velocity-----------------------------
+
+variable        vel_top equal  ${{Wall_v}}/2     
+variable        vel_bot equal -${{Wall_v}}/2 
+velocity        top_fixed set ${{vel_top}} 0.0 0.0 units box
+velocity        top_fixed set ${{vel_bot}} 0.0 0.0 units box
+
+#---------Calculate Friction-----------------------------
+
+variable        div_s    equal {RestartFileFreq}
+variable        ts_div_s equal ${{Ncomp}}/${{div_s}}
+
+fix             fc_ave all ave/time 1 ${{ts_div_s}} ${{ts_div_s}} v_s_bot v_p_bot file fc_ave.dump
+
+#-------------Bond info-------------------------------
+
+fix             bonds_comp all reax/c/bonds 4000 bonds_comp.txt
+
+dump            ovito_comp all custom 4000 dump_comp.lammpstrj id type x y z
+
+#-----------Run Compression and Shear-----------------------
+
+variable        Ncomp_100 equal {CompRestartEvery}
+restart         ${{Ncomp_100}} comp.restart
+
+{CompStart}run             ${{Ncomp}} upto
+{CompCheckpoint}
+unfix           bonds_comp
+undump          ovito_comp
+"""
+
+Templates = {
+    'FirstRun': FirstRunTemplate,
+    'Equilibration': EquilibrationTemplate,
+    'CompShear': CompShearTemplate,
+}
+
+_Compiled = {}
+_Fields = {}
+_Rendered = {}
+RenderCacheSize = 4096 # Rendered inputs kept in memory
+
+def Compile(Name):
+    # Parse a template once into (literal, field) segments
+    if Name not in _Compiled:
+        Segments = []
+        for Literal, Field, Spec, Conversion in string.Formatter().parse(Templates[Name]):
+            if Spec or Conversion:
+                raise ValueError(f'Template {Name} uses a format spec or conversion on {Field}')
+            Segments.append((Literal, Field))
+        _Compiled[Name] = tuple(Segments)
+        _Fields[Name] = tuple(sorted({Field for _, Field in Segments if Field is not None}))
+    return _Compiled[Name]
+
+def Fields(Name):
+    Compile(Name)
+    return _Fields[Name]
+
+def ParamsKey(Name, Params):
+    # Only the fields the template uses take part, so extra parameters in a
+    # shared settings dict don't defeat the cache
+    return (Name,) + tuple(str(Params[Field]) for Field in Fields(Name))
+
+def Render(Name, Params, Cache=True):
+    # With Cache=False the rendered cache is neither read nor written
+    Key = ParamsKey(Name, Params) if Cache else None
+    Text = _Rendered.get(Key) if Cache else None
+    if Text is None:
+        Text = ''.join(Literal if Field is None else Literal + str(Params[Field])
+                       for Literal, Field in Compile(Name))
+        if Cache:
+            if len(_Rendered) >= RenderCacheSize:
+                _Rendered.clear()
+            _Rendered[Key] = Text
+    return Text
+
+def WriteIfChanged(Path, Text):
+    # Returns True if the file had to be (re)written
+    Data = Text.encode()
+    try:
+        if os.path.getsize(Path) == len(Data):
+            with open(Path, 'rb') as file:
+                if file.read() == Data:
+                    return False
+    except FileNotFoundError:
+        pass
+    with open(Path, 'wb') as file:
+        file.write(Data)
+    return True
+
+def RenderToFile(Name, Params, Path):
+    return WriteIfChanged(Path, Render(Name, Params))
+
+def RestartParams(RestartFileFreq, RestartSteps=None):
+    # Template fields for the steps between restart files, a RestartFileFreq
+    # share of each run unless RestartSteps (e.g. the interval planned by
+    # CheckpointPlanner.py) is given. RestartFileFreq also sets the fc_ave
+    # averaging window, which RestartSteps leaves alone
+    if RestartSteps is None:
+        return dict(EquilRestartEvery=f'${{Nequil}}/{RestartFileFreq}',
+                    CompRestartEvery=f'${{Ncomp}}/{RestartFileFreq}')
+    return dict(EquilRestartEvery=str(int(RestartSteps)), CompRestartEvery=str(int(RestartSteps)))
+
+def CheckpointParams(Timeout=None, Every=100):
+    # Template fields for walltime-aware checkpointing, Timeout in seconds.
+    # Runs stop once the timer runs out (checked every Every steps) and later
+    # runs are skipped, so quit rather than set up the next phase. The step
+    # a run starts from is kept, and a run that didn't advance (a stage
+    # resuming at or past its upto target) writes nothing, as its restart
+    # file would overwrite the staged one it was read from
+    if Timeout is None:
+        return dict(Timer='', EquilStart='', CompStart='', EquilCheckpoint='', CompCheckpoint='')
+    Timeout = max(60, int(Timeout))
+    Start = 'variable        {0}_start equal $(step)\n'
+    Checkpoint = ('if              "$(step) > ${{{0}_start}}" then "write_restart {0}.restart.*"\n'
+                  'if              "$(timeremain) == 0" then "quit 0"\n')
+    return dict(Timer=f'timer           timeout {Timeout // 3600:02d}:{Timeout % 3600 // 60:02d}:{Timeout % 60:02d} '
+                      f'every {Every}\n',
+                EquilStart=Start.format('equil'), CompStart=Start.format('comp'),
+                EquilCheckpoint=Checkpoint.format('equil'), CompCheckpoint=Checkpoint.format('comp'))
+
+def SweepParams(Settings, Temperatures, Pressures, restartfilename='comp.restart.0'):
+    # Parameter objects for every input of a sweep, keyed by (Temp, Press, Template)
+    Sweep = {}
+    for Temp in Temperatures:
+        for Press in Pressures:
+            for Name in Templates:
+                Sweep[(Temp, Press, Name)] = dict(Settings, Temp=Temp[:3], Pressure=Press[0],
+                                                  restartfilename=restartfilename, **CheckpointParams(),
+                                                  **RestartParams(Settings['RestartFileFreq']))
+    return Sweep
+
+def RenderSweep(Settings, Temperatures, Pressures):
+    # Render every input of a sweep into memory
+    return {Key: Render(Key[2], Params)
+            for Key, Params in SweepParams(Settings, Temperatures, Pressures).items()}
+
+def Benchmark(Settings, Temperatures, Pressures, Repeats=20):
+    Sweep = SweepParams(Settings, Temperatures, Pressures)
+    Inputs = len(Sweep) * Repeats
+
+    # Formatting every input from scratch on every call, as the f-strings did
+    Start = time.perf_counter()
+    for _ in range(Repeats):
+        for Key, Params in Sweep.items():
+            Templates[Key[2]].format(**Params)
+    Formatted = time.perf_counter() - Start
+
+    Start = time.perf_counter()
+    for _ in range(Repeats):
+        for Key, Params in Sweep.items():
+            Render(Key[2], Params, Cache=False)
+    Compiled = time.perf_counter() - Start
+
+    _Rendered.clear()
+    Start = time.perf_counter()
+    for _ in range(Repeats):
+        RenderSweep(Settings, Temperatures, Pressures)
+    Cached = time.perf_counter() - Start
+
+    print(f'{Inputs} inputs rendered')
+    print(f'format every call : {Inputs / Formatted:12.0f} inputs/s')
+    print(f'compiled          : {Inputs / Compiled:12.0f} inputs/s')
+    print(f'compiled + cached : {Inputs / Cached:12.0f} inputs/s')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    Temperatures = [f'{T}K' for T in range(300, 1000, 10)]
+    Pressures = [f'{P}GPa' for P in range(1, 10)]
+    Benchmark(FG.Settings, Temperatures, Pressures, Repeats=int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,200 @@
+"""
+Monitor mode, keeps a campaign moving without rerunning FileGenerator.py
+
+The campaign tree is polled with stat calls only: each condition directory
+and its latest stages are checked for a changed mtime, and a condition is
+only relisted when its own mtime changes. Polling speeds back up to
+MinInterval as soon as something changes and backs off towards MaxInterval
+while nothing does.
+
+When a condition changes, or its job leaves the queue, the scheduler is
+asked again (at most once per QueryInterval) and every condition without a
+live job is generated and submitted through the same engine as a sweep.
+A condition that changes while its job is still running is left alone.
+
+Each condition is locked (flock on Temp/Press/.monitor.lock) by the first
+monitor to act on it and stays locked until that monitor exits, so two
+monitors never generate or submit for the same condition.
+
+A poll that fails (qstat or qsub still failing after its retries, or an
+error in the engine) is logged and retried after a backoff, with every
+condition looked at again.
+
+Polling is done with stat rather than inotify as inotify doesn't see changes
+made by the compute nodes on a network filesystem.
+
+Settings come from FileGenerator.py, e.g.
+    python Monitor.py --min-interval 5 --max-interval 60
+    python Monitor.py --polls 1
+"""
+
+import os
+import time
+import fcntl
+import traceback
+import argparse
+import GenerationEngine as GE
+import RestartDiscovery as RD
+import SchedulerClient as SC
+import SchedulerState as SS
+import FileGenerator as FG
+
+LockName = '.monitor.lock'
+
+def AcquireLock(ConditionDir):
+    # Returns the open lock file, or None if another monitor holds it. The
+    # lock goes away with the process that holds it
+    File = open(os.path.join(ConditionDir, LockName), 'a+')
+    try:
+        fcntl.flock(File, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        File.close()
+        return None
+    File.truncate(0)
+    File.write(f'{os.uname().nodename} {os.getpid()}\n')
+    File.flush()
+    return File
+
+def Log(Message):
+    print(f'{time.strftime("%Y-%m-%d %H:%M:%S")} {Message}', flush=True)
+
+class Monitor:
+    def __init__(self, Settings, Temperatures, Pressures, Queue=None, MinInterval=5.0, MaxInterval=60.0,
+                 QueryInterval=15.0, Workers=8, PoolType='thread'):
+        self.Settings = dict(Settings, FirstRun=False) # FirstRun stages are set up by FileGenerator.py
+        self.Conditions = [(Temp, Press) for Temp in Temperatures for Press in Pressures]
+        if Queue is None:
+            Client = SC.SchedulerClient(Settings['HPC'], Concurrency=Settings['SchedulerConcurrency'])
+            Queue = SS.SchedulerState(Client, Settings['System'], Settings['STARTINGDIR'], Settings['SchedulerTTL'])
+        self.Queue = Queue
+        self.MinInterval = MinInterval
+        self.MaxInterval = MaxInterval
+        self.QueryInterval = QueryInterval
+        self.Workers = Workers
+        self.PoolType = PoolType
+        self.Interval = MinInterval
+        self._Signatures = {}
+        self._Stages = {}
+        self._Locks = {}
+        self._Skipped = set()
+        self._Live = set()
+        self._Queried = None
+
+    def Signature(self, Temp, Press):
+        # mtimes of the condition directory and of the stages that can still
+        # change (the running stage and any chained behind it), or None if
+        # the condition hasn't been set up yet
+        ConditionDir = os.path.join(self.Settings['STARTINGDIR'], Temp, Press)
+        try:
+            MtimeNs = os.stat(ConditionDir).st_mtime_ns
+            Known = self._Stages.get((Temp, Press))
+            if Known is None or Known[0] != MtimeNs:
+                Paths = [Stage.Path for Stage in RD.ScanCondition(ConditionDir)]
+                Known = self._Stages[(Temp, Press)] = (MtimeNs, Paths[-(self.Settings['ChainDepth'] + 2):])
+            return (MtimeNs,) + tuple(os.stat(Path).st_mtime_ns for Path in Known[1])
+        except FileNotFoundError:
+            self._Stages.pop((Temp, Press), None)
+            return None
+
+    def Lock(self, Temp, Press):
+        if (Temp, Press) not in self._Locks:
+            File = AcquireLock(os.path.join(self.Settings['STARTINGDIR'], Temp, Press))
+            if File is None:
+                if (Temp, Press) not in self._Skipped:
+                    Log(f'{Temp} {Press} is locked by another monitor, skipping it')
+                    self._Skipped.add((Temp, Press))
+                return False
+            self._Locks[(Temp, Press)] = File
+            self._Skipped.discard((Temp, Press))
+        return True
+
+    def Poll(self):
+        # One pass over the campaign, returns the conditions that changed and
+        # the results of those acted on
+        Changed = set()
+        for Condition in self.Conditions:
+            Signature = self.Signature(*Condition)
+            if Signature is not None and Signature != self._Signatures.get(Condition):
+                self._Signatures[Condition] = Signature
+                Changed.add(Condition)
+
+        # A change to a condition without a live job is looked at straight
+        # away. Running jobs keep writing restart files, so their changes only
+        # bring the next qstat forward to QueryInterval
+        Since = float('inf') if self._Queried is None else time.monotonic() - self._Queried
+        if Changed - self._Live:
+            Due = True
+        elif Changed:
+            Due = Since >= self.QueryInterval
+        else:
+            Due = Since >= self.Queue.TTL
+        if not Due:
+            return Changed, []
+
+        self.Queue.Invalidate()
+        Live = self.Queue.LiveJobs()
+        self._Queried = time.monotonic()
+        Ended = {Condition for Condition in self._Live if Condition not in Live}
+        self._Live = {Condition for Condition in self.Conditions if Condition in Live}
+
+        Ready = [Condition for Condition in self.Conditions
+                 if Condition in Changed | Ended and Condition not in Live and Condition in self._Signatures
+                 and self.Lock(*Condition)]
+        if len(Ready) == 0:
+            return Changed, []
+
+        Results = GE.RunConditions(self.Settings, Ready, self.Workers, self.PoolType, self.Queue)
+        for Result in Results:
+            # Files written while acting aren't a change to react to
+            self._Signatures[(Result.Temp, Result.Press)] = self.Signature(Result.Temp, Result.Press)
+            if Result.JobId is not None:
+                self._Live.add((Result.Temp, Result.Press))
+        return Changed, Results
+
+    def Run(self, Polls=None):
+        Done = 0
+        while Polls is None or Done < Polls:
+            try:
+                Changed, Results = self.Poll()
+            except Exception:
+                # A qstat/qsub that keeps failing or an error in the engine
+                # mustn't end the monitor. Back off and look at every
+                # condition again on the next poll, as what changed in this
+                # one may not have been acted on
+                self.Interval = min(self.MaxInterval, self.Interval * 2)
+                Log(f'Poll failed, retrying in {self.Interval:.0f} s:\n{traceback.format_exc()}')
+                self._Signatures = {}
+                self._Queried = None
+                Changed, Results = set(), []
+            else:
+                # Adaptive backoff, back to MinInterval as soon as anything moves
+                if Changed:
+                    self.Interval = self.MinInterval
+                else:
+                    self.Interval = min(self.MaxInterval, self.Interval * 2)
+            for Result in Results:
+                Log(f'{Result.Temp} {Result.Press} {Result.Action} {Result.Stage or "-"} {Result.JobId or "-"}')
+                if Result.Error is not None:
+                    Log(f'{Result.Temp} {Result.Press} failed:\n{Result.Error}')
+            Done += 1
+            if Polls is None or Done < Polls:
+                time.sleep(self.Interval)
+
+def main():
+    Parser = argparse.ArgumentParser(description='Generate and submit the next stage of a campaign as soon as '
+                                                 'the previous one ends')
+    Parser.add_argument('--temp', nargs='+', default=FG.Temperatures)
+    Parser.add_argument('--press', nargs='+', default=FG.Pressures)
+    Parser.add_argument('--min-interval', type=float, default=5.0, help='seconds between polls while active')
+    Parser.add_argument('--max-interval', type=float, default=60.0, help='seconds between polls while idle')
+    Parser.add_argument('--query-interval', type=float, default=15.0,
+                        help='least seconds between qstat calls triggered by running jobs')
+    Parser.add_argument('--polls', type=int, default=None, help='exit after this many polls')
+    Args = Parser.parse_args()
+
+    Log(f'Monitoring {len(Args.temp) * len(Args.press)} conditions in {FG.STARTINGDIR}')
+    Monitor(FG.Settings, Args.temp, Args.press, MinInterval=Args.min_interval, MaxInterval=Args.max_interval,
+            QueryInterval=Args.query_interval, Workers=FG.Workers, PoolType=FG.PoolType).Run(Args.polls)
+
+if __name__ == '__main__':
+    main()
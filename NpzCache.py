@@ -0,0 +1,37 @@
+"""
+Atomic writes of the .npz caches kept beside the outputs of a campaign
+
+A cache is written to a temporary file named for the process and moved over
+the old one, so a reader never sees half a cache and two processes saving
+the same cache don't interleave.
+
+A cache of a file that only grows keeps the offset it got to and the bytes
+just before it (ReadTail), so a file rewritten in place since is told apart
+from one that was appended to.
+"""
+
+import os
+import numpy as np
+
+TailBytes = 64 # Bytes before the offset kept to tell a replaced file apart
+
+def ReadTail(Path, Offset):
+    with open(Path, 'rb') as file:
+        file.seek(max(0, Offset - TailBytes))
+        return file.read(min(Offset, TailBytes))
+
+def SaveNpzAtomic(Path, Compressed=False, **Arrays):
+    # False if the cache couldn't be written, a read-only campaign is still
+    # readable without it
+    Temporary = f'{Path}.{os.getpid()}.tmp'
+    try:
+        with open(Temporary, 'wb') as file:
+            (np.savez_compressed if Compressed else np.savez)(file, **Arrays)
+        os.replace(Temporary, Path)
+        return True
+    except OSError:
+        try:
+            os.remove(Temporary)
+        except OSError:
+            pass
+        return False
@@ -0,0 +1,305 @@
+"""
+Performance history of the campaign's LAMMPS runs, and the MPI resources to
+ask for from it
+
+- Every log.lammps under STARTINGDIR is harvested for its runs: the 'Loop
+  time of ... on P procs for S steps with N atoms' line, 'Performance:'
+  (ns/day, timesteps/s), the per rank memory and the MPI task timing
+  breakdown (% of the loop time per section). Runs go into an SQLite file in
+  STARTINGDIR, a log only being read again when its size or mtime changes
+- The time per step of a System is fitted as
+      N (Serial + Parallel / P) + Comm log2(P)
+  for N atoms on P cores, and the memory per rank as Base + PerAtom N / P
+- For a stage of EquilTime + CompTime steps the recommended rank count is
+  the one with the most steps per core-hour among those that finish within
+  the machine's walltime limit (the fastest if none do), with memory and
+  walltime from the fits plus a safety margin
+
+Runs of fewer than MinSteps steps (minimisation, setup) are left out of the
+fits. Nothing is recommended until a System has runs on at least two core
+counts, MakePBSFile then keeps its defaults. WriteSyntheticLog writes logs
+of a known model, to check the fits and recommendations against.
+
+Run this file directly to harvest the campaign in FileGenerator.py and
+print the fitted model and recommendation.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import numpy as np
+from collections import namedtuple
+import RestartDiscovery as RD
+
+HistoryName = 'performance_history.sqlite'
+LogName = 'log.lammps'
+MinSteps = 1000
+TimeSafety = 1.25
+MemorySafety = 1.5
+
+# Sections maps each MPI timing section (Pair, Neigh, Comm, ...) to its % of
+# the loop time
+Run = namedtuple('Run', ['Procs', 'Threads', 'Steps', 'Atoms', 'LoopTime', 'StepsPerSecond', 'NsPerDay',
+                         'MemoryMB', 'Sections'])
+Model = namedtuple('Model', ['System', 'Serial', 'Parallel', 'Comm', 'MemoryBase', 'MemoryPerAtom', 'Runs',
+                             'Atoms'])
+# MemoryGB is per node on PBS (Imperial) and per rank on SGE (UCL), as the
+# schedulers ask for it
+Resources = namedtuple('Resources', ['Ranks', 'Nodes', 'MemoryGB', 'WalltimeHours'])
+Machine = namedtuple('Machine', ['CoresPerNode', 'Candidates', 'MaxWalltime', 'MemoryPer'])
+
+DefaultResources = {'Imperial': Resources(32, 1, 62, 72), 'UCL': Resources(120, 1, 1, 24)}
+Machines = {'Imperial': Machine(32, (8, 16, 24, 32, 64, 96, 128), 72, 'node'),
+            'UCL': Machine(40, (24, 40, 80, 120, 160, 200, 240), 48, 'rank')}
+
+LoopLine = re.compile(r'Loop time of (\S+) on (\d+) procs for (\d+) steps with (\d+) atoms')
+ThreadsLine = re.compile(r'with (\d+) MPI tasks x (\d+) OpenMP threads')
+PerformanceLine = re.compile(r'Performance:(?:.*?(\S+) ns/day)?(?:.*?(\S+) timesteps/s)?')
+# 'Memory usage per processor' is how LAMMPS before 2016 put it
+MemoryLine = re.compile(r'Per MPI rank memory allocation \(min/avg/max\) = \S+ \| \S+ \| (\S+) Mbytes'
+                        r'|Memory usage per processor = (\S+) Mbytes')
+
+Schema = """
+CREATE TABLE IF NOT EXISTS logs (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT NOT NULL,
+    run INTEGER NOT NULL,
+    system TEXT NOT NULL,
+    procs INTEGER,
+    threads INTEGER,
+    steps INTEGER,
+    atoms INTEGER,
+    loop_time REAL,
+    steps_per_second REAL,
+    ns_per_day REAL,
+    memory_mb REAL,
+    sections TEXT,
+    harvested REAL,
+    PRIMARY KEY (path, run)
+);
+"""
+
+def ParseLog(Path):
+    # Every finished run of a log. The memory line comes before its run, the
+    # rest after the Loop time line
+    Runs = []
+    Memory = None
+    Current = None
+    Sections = None
+    with open(Path, errors='replace') as file:
+        for Line in file:
+            Match = MemoryLine.search(Line)
+            if Match:
+                Memory = float(Match.group(1) or Match.group(2))
+                continue
+            Match = LoopLine.match(Line)
+            if Match:
+                if Current is not None:
+                    Runs.append(Current)
+                Current = Run(int(Match.group(2)), 1, int(Match.group(3)), int(Match.group(4)),
+                              float(Match.group(1)), None, None, Memory, {})
+                Memory = None
+                continue
+            if Current is None:
+                continue
+            if Line.startswith('Performance:'):
+                Match = PerformanceLine.match(Line)
+                Current = Current._replace(NsPerDay=float(Match.group(1)) if Match.group(1) else None,
+                                           StepsPerSecond=float(Match.group(2)) if Match.group(2) else None)
+            elif 'MPI tasks x' in Line:
+                Match = ThreadsLine.search(Line)
+                if Match:
+                    Current = Current._replace(Threads=int(Match.group(2)))
+            elif Line.startswith('Section |'):
+                Sections = Current.Sections
+            elif Sections is not None:
+                Fields = [Field.strip() for Field in Line.split('|')]
+                if len(Fields) == 6:
+                    try:
+                        Sections[Fields[0]] = float(Fields[5])
+                    except ValueError:
+                        pass # The ---- line under the header
+                elif not Line.startswith('-'):
+                    Sections = None
+    if Current is not None:
+        Runs.append(Current)
+    return Runs
+
+def Connect(STARTINGDIR):
+    Connection = sqlite3.connect(os.path.join(STARTINGDIR, HistoryName), timeout=60)
+    Connection.executescript(Schema)
+    return Connection
+
+def Logs(STARTINGDIR):
+    # log.lammps of every stage of every Temp/Press directory
+    for Temp in os.scandir(STARTINGDIR):
+        if not Temp.is_dir():
+            continue
+        for Press in os.scandir(Temp.path):
+            if not Press.is_dir():
+                continue
+            for Stage in RD.ScanCondition(Press.path):
+                Path = os.path.join(Stage.Path, LogName)
+                if os.path.exists(Path):
+                    yield Path
+
+def Harvest(STARTINGDIR, System):
+    # Add new and changed logs to the history, returns the number read
+    Connection = Connect(STARTINGDIR)
+    Read = 0
+    try:
+        Known = dict((Path, (Size, MtimeNs)) for Path, Size, MtimeNs in
+                     Connection.execute('SELECT path, size, mtime_ns FROM logs'))
+        for Path in Logs(STARTINGDIR):
+            Stat = os.stat(Path)
+            if Known.get(Path) == (Stat.st_size, Stat.st_mtime_ns):
+                continue
+            Runs = ParseLog(Path)
+            with Connection:
+                Connection.execute('DELETE FROM runs WHERE path = ?', (Path,))
+                Connection.executemany("""
+                    INSERT INTO runs (path, run, system, procs, threads, steps, atoms, loop_time,
+                                      steps_per_second, ns_per_day, memory_mb, sections, harvested)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    [(Path, i, System, Run.Procs, Run.Threads, Run.Steps, Run.Atoms, Run.LoopTime,
+                      Run.StepsPerSecond, Run.NsPerDay, Run.MemoryMB, json.dumps(Run.Sections), time.time())
+                     for i, Run in enumerate(Runs)])
+                Connection.execute("""
+                    INSERT INTO logs (path, size, mtime_ns) VALUES (?, ?, ?)
+                    ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns
+                    """, (Path, Stat.st_size, Stat.st_mtime_ns))
+            Read += 1
+    finally:
+        Connection.close()
+    return Read
+
+def History(STARTINGDIR, System):
+    # Runs of System long enough to fit, oldest first
+    Connection = Connect(STARTINGDIR)
+    try:
+        Rows = Connection.execute("""
+            SELECT procs, threads, steps, atoms, loop_time, steps_per_second, ns_per_day, memory_mb, sections
+            FROM runs WHERE system = ? AND steps >= ? AND loop_time > 0 ORDER BY harvested, path, run""",
+            (System, MinSteps)).fetchall()
+    finally:
+        Connection.close()
+    return [Run(*Row[:8], json.loads(Row[8] or '{}')) for Row in Rows]
+
+def NonNegative(X, y):
+    # Least squares with the coefficients held at >= 0, dropping the
+    # negative ones and solving again
+    Active = np.ones(X.shape[1], dtype=bool)
+    Coefficients = np.zeros(X.shape[1])
+    while Active.any():
+        Solution = np.linalg.lstsq(X[:, Active], y, rcond=None)[0]
+        if (Solution >= 0).all():
+            Coefficients[Active] = Solution
+            break
+        Active[np.flatnonzero(Active)[Solution < 0]] = False
+    return Coefficients
+
+def Fit(System, Runs):
+    # None until there are runs on at least two core counts
+    if len(Runs) < 2:
+        return None
+    Cores = np.array([Run.Procs * Run.Threads for Run in Runs], dtype=np.float64)
+    if len(np.unique(Cores)) < 2:
+        return None
+    Atoms = np.array([Run.Atoms for Run in Runs], dtype=np.float64)
+    PerStep = np.array([Run.LoopTime / Run.Steps for Run in Runs])
+    Serial, Parallel, Comm = NonNegative(np.column_stack([Atoms, Atoms / Cores, np.log2(Cores)]), PerStep)
+
+    Memory = np.array([Run.MemoryMB if Run.MemoryMB is not None else np.nan for Run in Runs])
+    Known = ~np.isnan(Memory)
+    MemoryBase = MemoryPerAtom = np.nan
+    if Known.any():
+        MemoryBase, MemoryPerAtom = NonNegative(
+            np.column_stack([np.ones(Known.sum()), (Atoms / Cores)[Known]]), Memory[Known])
+    return Model(System, Serial, Parallel, Comm, MemoryBase, MemoryPerAtom, len(Runs), int(Atoms[-1]))
+
+def SecondsPerStep(Fitted, Atoms, Cores):
+    return Atoms * (Fitted.Serial + Fitted.Parallel / Cores) + Fitted.Comm * math.log2(Cores)
+
+def Candidates(Fitted, HPC, Atoms, Steps):
+    # (Cores, hours, core-hours) of a run of Steps for every candidate core count
+    return [(Cores, SecondsPerStep(Fitted, Atoms, Cores) * Steps * TimeSafety / 3600,
+             SecondsPerStep(Fitted, Atoms, Cores) * Steps * Cores / 3600) for Cores in Machines[HPC].Candidates]
+
+def Recommend(Fitted, HPC, Atoms, Steps):
+    Limits = Machines[HPC]
+    Options = Candidates(Fitted, HPC, Atoms, Steps)
+    Fitting = [Option for Option in Options if Option[1] <= Limits.MaxWalltime]
+    if Fitting:
+        Cores, Hours, CoreHours = min(Fitting, key=lambda x: (x[2], x[1]))
+    else:
+        Cores, Hours, CoreHours = min(Options, key=lambda x: x[1])
+    Walltime = min(Limits.MaxWalltime, max(1, math.ceil(Hours)))
+
+    Nodes = max(1, math.ceil(Cores / Limits.CoresPerNode)) if Limits.MemoryPer == 'node' else 1
+    Default = DefaultResources[HPC]
+    if np.isnan(Fitted.MemoryBase):
+        MemoryGB = Default.MemoryGB
+    else:
+        PerRank = (Fitted.MemoryBase + Fitted.MemoryPerAtom * Atoms / Cores) * MemorySafety / 1024
+        MemoryGB = max(1, math.ceil(PerRank * (Cores // Nodes if Limits.MemoryPer == 'node' else 1)))
+    return Resources(Cores, Nodes, MemoryGB, Walltime)
+
+def RecommendFor(Settings):
+    # Resources for a new stage of Settings['System'], None without enough
+    # history
+    Harvest(Settings['STARTINGDIR'], Settings['System'])
+    Fitted = Fit(Settings['System'], History(Settings['STARTINGDIR'], Settings['System']))
+    if Fitted is None:
+        return None
+    return Recommend(Fitted, Settings['HPC'], Fitted.Atoms, int(Settings['EquilTime']) + int(Settings['CompTime']))
+
+def WriteSyntheticLog(Path, Procs, Atoms, Steps, Serial, Parallel, Comm, MemoryBase=50.0, MemoryPerAtom=0.05,
+                      Runs=1):
+    # A log.lammps of Runs runs timed by the model, in the layout LAMMPS writes
+    Loop = Steps * (Atoms * (Serial + Parallel / Procs) + Comm * math.log2(Procs))
+    Memory = MemoryBase + MemoryPerAtom * Atoms / Procs
+    with open(Path, 'w') as file:
+        file.write('LAMMPS (29 Sep 2021 - Update 3)\n')
+        for i in range(Runs):
+            file.write(f'Per MPI rank memory allocation (min/avg/max) = {Memory * 0.9:.4g} | {Memory * 0.95:.4g} | '
+                       f'{Memory:.4g} Mbytes\nStep Temp PotEng\n')
+            for Step in range(i * Steps, (i + 1) * Steps + 1, max(1, Steps // 4)):
+                file.write(f'{Step:>8} 300 -1000\n')
+            file.write(f'Loop time of {Loop:g} on {Procs} procs for {Steps} steps with {Atoms} atoms\n\n'
+                       f'Performance: {Steps / Loop * 86400 * 0.25e-6:.3f} ns/day, '
+                       f'{Loop / Steps / 86400 / 0.25e-6:.3f} hours/ns, {Steps / Loop:.3f} timesteps/s\n'
+                       f'99.8% CPU use with {Procs} MPI tasks x 1 OpenMP threads\n\n'
+                       'MPI task timing breakdown:\n'
+                       'Section |  min time  |  avg time  |  max time  |%varavg| %total\n'
+                       '---------------------------------------------------------------\n'
+                       f'Pair    | {Loop * 0.8:.4g} | {Loop * 0.8:.4g} | {Loop * 0.8:.4g} |   0.0 | 80.00\n'
+                       f'Comm    | {Loop * 0.1:.4g} | {Loop * 0.1:.4g} | {Loop * 0.1:.4g} |   0.0 | 10.00\n'
+                       f'Modify  | {Loop * 0.1:.4g} | {Loop * 0.1:.4g} | {Loop * 0.1:.4g} |   0.0 | 10.00\n\n')
+        file.write('Total wall time: 0:00:01\n')
+
+def PrintRecommendation(Settings):
+    Read = Harvest(Settings['STARTINGDIR'], Settings['System'])
+    Runs = History(Settings['STARTINGDIR'], Settings['System'])
+    print(f'{Read} logs harvested, {len(Runs)} runs of {Settings["System"]} in the history')
+    Fitted = Fit(Settings['System'], Runs)
+    if Fitted is None:
+        print('Not enough history to fit, MakePBSFile keeps its defaults')
+        return
+    print(f'Seconds per step = N ({Fitted.Serial:.3g} + {Fitted.Parallel:.3g} / P) + {Fitted.Comm:.3g} log2(P), '
+          f'memory per rank = {Fitted.MemoryBase:.4g} + {Fitted.MemoryPerAtom:.3g} N / P MB')
+    Steps = int(Settings['EquilTime']) + int(Settings['CompTime'])
+    print(f'{"Cores":>6}{"Hours":>10}{"Core-hours":>12}  for {Steps} steps of {Fitted.Atoms} atoms')
+    for Cores, Hours, CoreHours in Candidates(Fitted, Settings['HPC'], Fitted.Atoms, Steps):
+        print(f'{Cores:>6}{Hours:>10.1f}{CoreHours:>12.0f}')
+    print(Recommend(Fitted, Settings['HPC'], Fitted.Atoms, Steps))
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintRecommendation(FG.Settings)
@@ -0,0 +1,177 @@
+"""
+Density (and temperature) profiles along z from the dump_*.lammpstrj files
+
+- Atoms are binned along z at Resolution (0.5 A, the inputs' 'res') with
+  np.bincount, one frame at a time into running sums, so memory doesn't
+  depend on the length of the trajectory
+- Profiles are split by atom type (element) and by region group. Groups are
+  given to atoms from their position in the first frame, the way the inputs
+  define them: bot_fixed/bot_thermo/bot_free and top_free/top_thermo/top_fixed
+  from Fix_Z, Thermo_Z and Wall_Z, and molecules in between
+- Temperature profiles need velocities in the dump (vx vy vz), which the
+  current inputs don't write, so they are only filled in when present
+- Frames of a condition are stitched by timestep (Stitching.py), a later
+  stage taking over from the first step it wrote
+
+Run this file directly to write the averaged dump_comp profiles of every
+condition to STARTINGDIR/Temp/Press/profile_comp.csv.
+"""
+
+import os
+import numpy as np
+from collections import namedtuple
+import RestartDiscovery as RD
+import Stitching as ST
+
+# g/mol, as used by the ReaxFF force field
+Masses = {'H': 1.008, 'C': 12.011, 'O': 15.999, 'P': 30.974, 'Fe': 55.845}
+
+Groups = ('bot_fixed', 'bot_thermo', 'bot_free', 'molecules', 'top_free', 'top_thermo', 'top_fixed')
+
+# Real units: g/mol A^2/fs^2 to kcal/mol, Boltzmann constant in kcal/mol/K,
+# g/mol/A^3 to g/cm^3
+MVV2E = 48.88821291 ** 2
+Boltzmann = 0.0019872067
+DensityConversion = 1.0E24 / 6.02214857E23
+
+# Counts (atoms per bin) and Density (g/cm^3) are averaged over Frames, per
+# element (rows in the order of Elements) and per group (rows in the order
+# of Groups). Regions are the (zlo, zhi) of each group in the first frame
+Profile = namedtuple('Profile', ['Centres', 'Elements', 'Counts', 'Density', 'GroupCounts', 'GroupDensity',
+                                 'Temperature', 'Regions', 'Frames'])
+
+def Regions(Z, Wall_Z, Fix_Z, Thermo_Z):
+    # The inputs' regions, from the atom positions they were defined with
+    Bottom, Top = Z.min(), Z.max()
+    Wall_Z, Fix_Z, Thermo_Z = float(Wall_Z), float(Fix_Z), float(Thermo_Z)
+    return {'bot_fixed': (Bottom, Bottom + Fix_Z),
+            'bot_thermo': (Bottom + Fix_Z, Bottom + Fix_Z + Thermo_Z),
+            'bot_free': (Bottom + Fix_Z + Thermo_Z, Bottom + Wall_Z),
+            'molecules': (Bottom + Wall_Z, Top - Wall_Z),
+            'top_free': (Top - Wall_Z, Top - Fix_Z - Thermo_Z),
+            'top_thermo': (Top - Fix_Z - Thermo_Z, Top - Fix_Z),
+            'top_fixed': (Top - Fix_Z, Top)}
+
+def GroupOf(Z, Bounds):
+    # Index into Groups of every atom. Region edges follow the order the
+    # inputs assign groups in, fixed before thermo before free
+    Group = np.full(len(Z), Groups.index('molecules'))
+    for Name in ('bot_free', 'top_free', 'bot_thermo', 'top_thermo', 'bot_fixed', 'top_fixed'):
+        Low, High = Bounds[Name]
+        Group[(Z >= Low) & (Z <= High)] = Groups.index(Name)
+    return Group
+
+class ProfileAccumulator:
+    def __init__(self, Low, High, Types, Settings, Resolution=0.5):
+        self.Resolution = Resolution
+        self.Low = Low
+        self.Bins = max(1, int(np.ceil((High - Low) / Resolution)))
+        self.Elements = sorted(set(Types.values()), key=lambda x: -Masses.get(x, 0))
+        self.Lookup = np.full(max(Types) + 1, len(self.Elements))
+        for Type, Element in Types.items():
+            self.Lookup[Type] = self.Elements.index(Element)
+        self.Mass = np.array([Masses.get(Element, 0.0) for Element in self.Elements] + [0.0])
+        self.Settings = Settings
+        self.Counts = np.zeros((len(self.Elements) + 1, self.Bins))
+        self.GroupCounts = np.zeros((len(Groups), self.Bins))
+        self.GroupMass = np.zeros((len(Groups), self.Bins))
+        self.Kinetic = np.zeros(self.Bins)
+        self.Moving = np.zeros(self.Bins)
+        self.Area = 0.0
+        self.Frames = 0
+        self.Regions = None
+        self._Ids = None
+        self._Group = None
+
+    def Add(self, Atoms, Box):
+        if self._Ids is None:
+            # Groups are fixed when first seen, like LAMMPS groups
+            self.Regions = Regions(Atoms['z'], self.Settings['Wall_Z'], self.Settings['Fix_Z'],
+                                   self.Settings['Thermo_Z'])
+            self._Ids = Atoms['id']
+            self._Group = GroupOf(Atoms['z'], self.Regions)
+        if len(Atoms) == len(self._Ids) and np.array_equal(Atoms['id'], self._Ids):
+            Group = self._Group
+        else:
+            # Atoms have been lost (or added), look each one up by id
+            Where = np.minimum(np.searchsorted(self._Ids, Atoms['id']), len(self._Ids) - 1)
+            Group = np.where(self._Ids[Where] == Atoms['id'], self._Group[Where], Groups.index('molecules'))
+
+        Bin = np.clip(((Atoms['z'] - self.Low) / self.Resolution).astype(np.int64), 0, self.Bins - 1)
+        Element = self.Lookup[np.minimum(Atoms['type'], len(self.Lookup) - 1)]
+        Mass = self.Mass[Element]
+        self.Counts += np.bincount(Element * self.Bins + Bin,
+                                   minlength=self.Counts.size).reshape(self.Counts.shape)
+        Key = Group * self.Bins + Bin
+        self.GroupCounts += np.bincount(Key, minlength=self.GroupCounts.size).reshape(self.GroupCounts.shape)
+        self.GroupMass += np.bincount(Key, weights=Mass, minlength=self.GroupMass.size).reshape(self.GroupMass.shape)
+        if all(Column in Atoms.dtype.names for Column in ('vx', 'vy', 'vz')):
+            Speed = Atoms['vx'] ** 2 + Atoms['vy'] ** 2 + Atoms['vz'] ** 2
+            self.Kinetic += np.bincount(Bin, weights=Mass * Speed * MVV2E, minlength=self.Bins)
+            self.Moving += np.bincount(Bin, minlength=self.Bins)
+        self.Area += (Box[0][1] - Box[0][0]) * (Box[1][1] - Box[1][0])
+        self.Frames += 1
+
+    def Result(self):
+        Frames = max(self.Frames, 1)
+        Volume = (self.Area / Frames) * self.Resolution
+        Scale = DensityConversion / Frames / Volume if Volume > 0 else 0.0
+        Counts = self.Counts[:-1] / Frames # The last row holds types outside the map
+        Density = self.Counts[:-1] * self.Mass[:-1, None] * Scale
+        Temperature = np.divide(self.Kinetic, 3 * self.Moving * Boltzmann, out=np.full(self.Bins, np.nan),
+                                where=self.Moving > 0)
+        Centres = self.Low + (np.arange(self.Bins) + 0.5) * self.Resolution
+        return Profile(Centres, self.Elements, Counts, Density, self.GroupCounts / Frames, self.GroupMass * Scale,
+                       Temperature, self.Regions, self.Frames)
+
+def Bounds(Trajectories):
+    # z range of every box of every trajectory, from the frame indexes
+    Low = min(Trajectory.Index['Box'][:, 2, 0].min() for Trajectory in Trajectories if len(Trajectory))
+    High = max(Trajectory.Index['Box'][:, 2, 1].max() for Trajectory in Trajectories if len(Trajectory))
+    return Low, High
+
+def TrajectoriesProfile(Paths, Types, Settings, Resolution=0.5, Every=1, FromStep=0):
+    # Profile averaged over the stitched frames of Paths from FromStep on, a
+    # later file taking over from its first step
+    Opened = [ST.TrajectoryPart(Path, Stage) for Stage, Path in enumerate(Paths)]
+    try:
+        View = ST.StitchedView(Opened)
+        if len(View) == 0:
+            return None
+        Accumulator = ProfileAccumulator(*Bounds([Part.Data for Part in View.Parts]), Types, Settings, Resolution)
+        for Part, Stop in zip(View.Parts, View.Stops):
+            for Frame in range(int(np.searchsorted(Part.Step[:Stop], FromStep)), Stop, Every):
+                Accumulator.Add(Part.Data.Frame(Frame), Part.Data.Index['Box'][Frame])
+        return Accumulator.Result() if Accumulator.Frames else None
+    finally:
+        for Part in Opened:
+            Part.Data.close()
+
+def ConditionProfile(Settings, Temp, Press, Types, FileName='dump_comp.lammpstrj', Resolution=0.5, Every=1,
+                     FromStep=0):
+    Paths = [os.path.join(Stage.Path, FileName)
+             for Stage in RD.ScanCondition(os.path.join(Settings['STARTINGDIR'], Temp, Press))
+             if os.path.exists(os.path.join(Stage.Path, FileName))]
+    return TrajectoriesProfile(Paths, Types, Settings, Resolution, Every, FromStep)
+
+def WriteCSV(Result, Path):
+    Columns = [Result.Centres] + list(Result.Density) + list(Result.GroupDensity) + [Result.Temperature]
+    Header = ','.join(['z'] + [f'rho_{Element}' for Element in Result.Elements] + [f'rho_{Group}' for Group in Groups]
+                      + ['T'])
+    np.savetxt(Path, np.column_stack(Columns), delimiter=',', header=Header, comments='', fmt='%.6g')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    import SpeciesAnalysis as SA
+    Types = SA.TypeMap(FG.Settings)
+    for Temp in FG.Temperatures:
+        for Press in FG.Pressures:
+            if not os.path.isdir(os.path.join(FG.STARTINGDIR, Temp, Press)):
+                continue
+            Result = ConditionProfile(FG.Settings, Temp, Press, Types)
+            if Result is None:
+                print(f'{Temp} {Press}: no frames')
+                continue
+            Path = os.path.join(FG.STARTINGDIR, Temp, Press, 'profile_comp.csv')
+            WriteCSV(Result, Path)
+            print(f'{Temp} {Press}: {Result.Frames} frames -> {Path}')
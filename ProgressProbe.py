@@ -0,0 +1,143 @@
+"""
+Progress of a stage read from the end of its log.lammps
+
+The log is read backwards a block at a time, only as far as the last thermo
+line, so a probe costs a few KB whatever the size of the log. On the way it
+picks up
+- an ERROR line, the run crashed
+- 'Total wall time', LAMMPS exited normally
+- 'Loop time', the last run command finished
+Timesteps carry on across restarts, so the last thermo step compared with
+EquilTime and CompTime tells how far the condition has got. Compression only
+counts as done when the run command last echoed (the inputs set echo both)
+is the one that goes to CompTime, so a log that ends cleanly after some
+other run isn't taken as finished compression.
+
+Run this file directly to print the progress of the latest stage of every
+condition in FileGenerator.py.
+"""
+
+import os
+import re
+from collections import namedtuple
+import RestartDiscovery as RD
+
+# State is 'NotStarted', 'Running' (or killed, the log can't tell), 'Finished'
+# or 'Crashed'. RunEnded is True when the last run/minimize command finished
+Progress = namedtuple('Progress', ['State', 'LastStep', 'RunEnded', 'Equilibrated', 'Compressed', 'Error'])
+
+LogName = 'log.lammps'
+
+# With echo both LAMMPS prints a run command as read and again once its
+# variables are substituted. The inputs run compression/shear as
+# run ${Ncomp} (CompRun)
+RunLine = re.compile(r'^run\s+(\S+)')
+RunVariable = re.compile(r'^run\s+\$\{(\w+)\}')
+CompRun = 'Ncomp'
+
+def IsThermoLine(Line):
+    Fields = Line.split()
+    if len(Fields) < 2 or not Fields[0].isdigit():
+        return False
+    try:
+        for Field in Fields[1:]:
+            float(Field)
+    except ValueError:
+        return False
+    return True
+
+def TailLines(Path, Block=4096, MaxBytes=65536):
+    # Complete lines from the end of the file, last first. A final line
+    # without a newline is still being written and is skipped
+    with open(Path, 'rb') as file:
+        End = file.seek(0, os.SEEK_END)
+        Position = End
+        Rest = b''
+        Partial = True
+        while Position > 0 and End - Position < MaxBytes:
+            Size = min(Block, Position)
+            Position -= Size
+            file.seek(Position)
+            Lines = (file.read(Size) + Rest).split(b'\n')
+            if Partial:
+                # Empty if the file ends in a newline, the unfinished line otherwise
+                Lines.pop()
+                Partial = len(Lines) == 0
+                if Partial:
+                    Rest = b''
+                    continue
+            Rest = Lines.pop(0) # May be cut short by the block boundary
+            for Line in reversed(Lines):
+                yield Line.decode(errors='replace')
+        if Position == 0 and not Partial:
+            yield Rest.decode(errors='replace')
+
+def Probe(StageDir, EquilTime, CompTime, Block=4096, MaxBytes=65536, RunMaxBytes=1 << 22):
+    # Up to MaxBytes are read for the last thermo line, then on up to
+    # RunMaxBytes for the run command that printed it
+    Path = os.path.join(StageDir, LogName)
+    if not os.path.exists(Path):
+        return Progress('NotStarted', None, False, False, False, None)
+
+    LastStep = None
+    RunEnded = False
+    Exited = False
+    Error = None
+    Run = None # The run command as echoed, last first
+    Read = 0
+    for Line in TailLines(Path, Block, RunMaxBytes):
+        Read += len(Line) + 1
+        if Run is not None:
+            # The line before the substituted command is the command as
+            # read when it had any variables
+            Run.append(Line)
+            break
+        if LastStep is not None:
+            if RunLine.match(Line):
+                Run = [Line]
+            continue
+        if Read > MaxBytes:
+            break
+        if IsThermoLine(Line):
+            LastStep = int(Line.split()[0])
+            continue
+        if Line.startswith('ERROR'):
+            Error = Line.strip()
+        elif Line.startswith('Loop time'):
+            RunEnded = True
+        elif Line.startswith('Total wall time'):
+            Exited = True
+
+    if Error is not None:
+        State = 'Crashed'
+    elif Exited:
+        State = 'Finished'
+    elif LastStep is None:
+        State = 'NotStarted'
+    else:
+        State = 'Running'
+    Equilibrated = LastStep is not None and LastStep >= int(EquilTime)
+    # The variable the last run was given, None if the log has no echo or
+    # the run was given a number
+    Variable = next((Found.group(1) for Found in map(RunVariable.match, Run or ()) if Found), None)
+    Compressed = LastStep is not None and LastStep >= int(CompTime) and Variable in (None, CompRun)
+    return Progress(State, LastStep, RunEnded, Equilibrated, Compressed, Error)
+
+def PrintProgress(STARTINGDIR, Temperatures, Pressures, EquilTime, CompTime):
+    print(f'{"Temp":<8}{"Press":<8}{"Stage":<12}{"State":<12}{"Step":>10}  Phase')
+    for Temp in Temperatures:
+        for Press in Pressures:
+            ConditionDir = os.path.join(STARTINGDIR, Temp, Press)
+            Stages = RD.ScanCondition(ConditionDir) if os.path.isdir(ConditionDir) else []
+            if len(Stages) == 0:
+                print(f'{Temp:<8}{Press:<8}-')
+                continue
+            Result = Probe(Stages[-1].Path, EquilTime, CompTime)
+            Phase = 'Completed' if Result.Compressed else 'Compression' if Result.Equilibrated else 'Equilibration'
+            print(f'{Temp:<8}{Press:<8}{Stages[-1].Name:<12}{Result.State:<12}{Result.LastStep or "-":>10}  {Phase}')
+            if Result.Error is not None:
+                print(f'    {Result.Error}')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintProgress(FG.STARTINGDIR, FG.Temperatures, FG.Pressures, FG.EquilTime, FG.CompTime)
@@ -0,0 +1,80 @@
+"""
+Restart discovery for a condition directory (STARTINGDIR/Temp/Press)
+
+- One os.scandir pass lists the stages of a condition (FirstRun, Restart_N)
+- One os.scandir pass per stage collects its restart steps and output sizes
+- Stages and restart steps are integers and are ordered numerically, so
+  Restart_10 comes after Restart_9 and comp.restart.1000000 after
+  comp.restart.999999
+"""
+
+import os
+from collections import namedtuple
+
+Stage = namedtuple('Stage', ['Name', 'Number', 'Path'])
+StageScan = namedtuple('StageScan', ['Files', 'EquilSteps', 'CompSteps', 'Sizes'])
+Restart = namedtuple('Restart', ['Type', 'Step', 'FileName'])
+
+# Output files whose sizes are collected while scanning a stage
+OutputFiles = ('log.lammps', 'fc_ave.dump', 'dump_equil.lammpstrj', 'dump_comp.lammpstrj',
+               'bonds_equil.txt', 'bonds_comp.txt')
+
+def StageNumber(Name):
+    # FirstRun is stage 0, Restart_N is stage N, anything else is not a stage
+    if Name == 'FirstRun':
+        return 0
+    if Name.startswith('Restart_') and Name[len('Restart_'):].isdigit():
+        return int(Name[len('Restart_'):])
+    return None
+
+def StageName(Number):
+    return 'FirstRun' if Number == 0 else f'Restart_{Number}'
+
+def RestartStep(Name):
+    # Returns ('equil' or 'comp', step) for a restart file name, else None
+    for Prefix in ('equil', 'comp'):
+        if Name.startswith(f'{Prefix}.restart.'):
+            Step = Name[len(Prefix) + len('.restart.'):]
+            if Step.isdigit():
+                return Prefix, int(Step)
+    return None
+
+def ScanCondition(ConditionDir):
+    Stages = []
+    with os.scandir(ConditionDir) as Entries:
+        for Entry in Entries:
+            Number = StageNumber(Entry.name)
+            if Number is not None and Entry.is_dir():
+                Stages.append(Stage(Entry.name, Number, Entry.path))
+    return sorted(Stages, key=lambda x: x.Number)
+
+def ScanStage(StageDir):
+    Files = 0
+    EquilSteps = []
+    CompSteps = []
+    Sizes = {}
+    with os.scandir(StageDir) as Entries:
+        for Entry in Entries:
+            Files += 1
+            Found = RestartStep(Entry.name)
+            if Found is not None:
+                (EquilSteps if Found[0] == 'equil' else CompSteps).append(Found[1])
+            elif Entry.name in OutputFiles:
+                Sizes[Entry.name] = Entry.stat().st_size
+    EquilSteps.sort()
+    CompSteps.sort()
+    return StageScan(Files, EquilSteps, CompSteps, Sizes)
+
+def LatestRestart(EquilSteps, CompSteps, EquilTime):
+    # Newest restart file to carry on from, typed the same way MakeFiles
+    # chooses between the equilibration and compression/shear inputs
+    Steps = sorted(set(EquilSteps) | set(CompSteps))
+    if len(Steps) == 0:
+        return None
+    Step = Steps[-1]
+    if Step in EquilSteps and (Step <= int(EquilTime) or Step not in CompSteps):
+        return Restart('Equilibration', Step, f'equil.restart.{Step}')
+    return Restart('CompShear', Step, f'comp.restart.{Step}')
+
+def IsComplete(CompSteps, CompTime):
+    return len(CompSteps) > 0 and max(CompSteps) >= int(CompTime)
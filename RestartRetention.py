@@ -0,0 +1,232 @@
+"""
+Retention policy for the equil.restart.N / comp.restart.N files of a campaign
+
+Restart files are kept per condition, across its stages, by any of
+- KeepLast   : the newest K restart steps
+- KeepEvery  : every Nth restart step of each phase (0 for none)
+- Boundaries : the last equilibration restart (where compression/shear
+  starts from) and the last compression/shear restart
+and every restart file a stage still needs is protected whatever the policy:
+the one named by read_restart in the input of a stage that hasn't finished,
+the newest of the previous stage for a chained stage that resolves its
+restart file when it starts, and the target of every symbolic link kept.
+
+A step kept in one stage is kept under all its names, so a restart file
+staged into the next stage (hardlink, symlink or copy) keeps its original.
+Before anything of a condition is deleted its newest kept restart file is
+read through and checked for the LAMMPS restart header and a size near the
+others of its phase. If it fails the newest older one that passes is kept
+too, and nothing is deleted from a condition without one. Deletions run on a thread pool.
+Reclaimed bytes only count a file once every name of it is deleted, as
+hardlinked copies free nothing until then.
+
+Run this file directly, with --dry-run to only report what would go, e.g.
+    python RestartRetention.py --keep-last 2 --keep-every 10 --dry-run
+"""
+
+import os
+import re
+import argparse
+import numpy as np
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import RestartDiscovery as RD
+import ProgressProbe as PP
+
+# Written at the start of every binary restart file since LAMMPS 2016
+Magic = b'LammpS RestartT'
+
+Policy = namedtuple('Policy', ['KeepLast', 'KeepEvery', 'Boundaries'])
+# Path is the name in the stage, Key the (device, inode) of the file it
+# resolves to, Bytes its size (0 for a symbolic link) and Links its link count
+RestartFile = namedtuple('RestartFile', ['Stage', 'Path', 'Type', 'Step', 'Bytes', 'Key', 'Links', 'Target'])
+# Verified is the newest step checked readable, None when nothing was deleted
+Decision = namedtuple('Decision', ['Temp', 'Press', 'Keep', 'Delete', 'Reclaimed', 'Verified', 'Error'])
+
+ReadRestart = re.compile(r'^\s*read_restart\s+(\S+)', re.M)
+
+def ConditionFiles(ConditionDir):
+    # Every restart file of a condition, and its stages in order
+    Stages = RD.ScanCondition(ConditionDir)
+    Files = []
+    for Stage in Stages:
+        with os.scandir(Stage.Path) as Entries:
+            for Entry in Entries:
+                Found = RD.RestartStep(Entry.name)
+                if Found is None:
+                    continue
+                Target = os.path.realpath(Entry.path) if Entry.is_symlink() else None
+                try:
+                    Stat = os.stat(Entry.path)
+                except FileNotFoundError:
+                    Stat = None # A dangling symbolic link
+                Key = (Stat.st_dev, Stat.st_ino) if Stat else None
+                Bytes = 0 if Target is not None or Stat is None else Stat.st_size
+                Files.append(RestartFile(Stage.Name, Entry.path, Found[0], Found[1], Bytes, Key,
+                                         Stat.st_nlink if Stat else 0, Target))
+    return Stages, Files
+
+def InUse(Stages, Files, EquilTime, CompTime):
+    # Steps a stage that hasn't finished still has to read
+    Steps = set()
+    for i, Stage in enumerate(Stages):
+        if PP.Probe(Stage.Path, EquilTime, CompTime).State == 'Finished':
+            continue
+        with os.scandir(Stage.Path) as Entries:
+            Inputs = [Entry.path for Entry in Entries if Entry.name.endswith('.lammps')]
+        for Input in Inputs:
+            with open(Input, errors='replace') as file:
+                for Name in ReadRestart.findall(file.read()):
+                    Found = RD.RestartStep(os.path.basename(Name))
+                    if Found is not None:
+                        Steps.add(Found[1])
+                    elif i > 0:
+                        # Resolved when the job starts, from the newest
+                        # restart file of the previous stage
+                        Previous = [File.Step for File in Files if File.Stage == Stages[i - 1].Name]
+                        if Previous:
+                            Steps.add(max(Previous))
+    return Steps
+
+def Select(Files, Rules, Protected=()):
+    # Steps to keep
+    Keep = set(Protected)
+    Steps = sorted({File.Step for File in Files})
+    if Rules.KeepLast > 0:
+        Keep.update(Steps[-Rules.KeepLast:])
+    for Type in ('equil', 'comp'):
+        Phase = sorted({File.Step for File in Files if File.Type == Type})
+        if not Phase:
+            continue
+        if Rules.KeepEvery > 0:
+            Keep.update(Phase[::Rules.KeepEvery])
+        if Rules.Boundaries:
+            Keep.add(Phase[-1])
+    return Keep
+
+def IsReadable(Path, MinBytes=0, ChunkBytes=1 << 24):
+    # Reads the whole file, so a damaged or truncated one fails here rather
+    # than when a job starts from it
+    try:
+        Size = os.path.getsize(Path)
+        Read = 0
+        with open(Path, 'rb') as file:
+            Header = file.read(len(Magic))
+            Read += len(Header)
+            while True:
+                Data = file.read(ChunkBytes)
+                if not Data:
+                    break
+                Read += len(Data)
+        return Header == Magic and Read == Size and Size >= max(1, MinBytes)
+    except OSError:
+        return False
+
+def Verify(Files, Steps):
+    # Newest of Steps readable under one of its names, else None. A file much
+    # smaller than the others of its phase was cut short while being written
+    Sizes = defaultdict(list)
+    for File in Files:
+        if File.Target is None and File.Bytes > 0:
+            Sizes[File.Type].append(File.Bytes)
+    for Step in sorted(Steps, reverse=True):
+        for File in Files:
+            if File.Step == Step and IsReadable(File.Path, 0.9 * np.median(Sizes[File.Type] or [0])):
+                return Step
+    return None
+
+def Plan(STARTINGDIR, Temp, Press, Rules, EquilTime, CompTime):
+    ConditionDir = os.path.join(STARTINGDIR, Temp, Press)
+    Stages, Files = ConditionFiles(ConditionDir)
+    if not Files:
+        return Decision(Temp, Press, [], [], 0, None, None)
+    Keep = Select(Files, Rules, InUse(Stages, Files, EquilTime, CompTime))
+
+    # The newest kept step has to be readable, if it isn't the newest older
+    # step that is is kept as well
+    Newest = max(Keep, default=max(File.Step for File in Files) + 1)
+    Verified = Verify(Files, {Newest})
+    if Verified != Newest:
+        Verified = Verify(Files, {File.Step for File in Files if File.Step < Newest})
+        if Verified is None:
+            return Decision(Temp, Press, Files, [], 0, None,
+                            'no readable LAMMPS restart file, nothing deleted')
+        Keep.add(Verified)
+
+    # Targets of kept symbolic links are kept whatever their step
+    Targets = {File.Target for File in Files if File.Step in Keep and File.Target is not None}
+    Kept = [File for File in Files if File.Step in Keep or File.Path in Targets]
+    KeptPaths = {File.Path for File in Kept}
+    Delete = [File for File in Files if File.Path not in KeptPaths]
+
+    # A file is only freed once all of its names are gone
+    Names = defaultdict(int)
+    Sizes = {}
+    Links = {}
+    for File in Delete:
+        if File.Target is None and File.Key is not None:
+            Names[File.Key] += 1
+            Sizes[File.Key] = File.Bytes
+            Links[File.Key] = File.Links
+    Reclaimed = sum(Sizes[Key] for Key, Count in Names.items() if Count >= Links[Key])
+    return Decision(Temp, Press, Kept, Delete, Reclaimed, Verified, None)
+
+def Remove(Path):
+    try:
+        os.unlink(Path)
+        return None
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        return f'{Path}: {e}'
+
+def Apply(Decisions, Workers=8):
+    # Deletes every file the decisions drop, returns the errors
+    Paths = [File.Path for Decided in Decisions for File in Decided.Delete]
+    with ThreadPoolExecutor(max_workers=Workers) as Executor:
+        return [Error for Error in Executor.map(Remove, Paths) if Error is not None]
+
+def Retain(Settings, Temperatures, Pressures, Rules, DryRun=False, Workers=8):
+    Decisions = []
+    for Temp in Temperatures:
+        for Press in Pressures:
+            if os.path.isdir(os.path.join(Settings['STARTINGDIR'], Temp, Press)):
+                Decisions.append(Plan(Settings['STARTINGDIR'], Temp, Press, Rules, Settings['EquilTime'],
+                                      Settings['CompTime']))
+    Errors = [] if DryRun else Apply(Decisions, Workers)
+    return Decisions, Errors
+
+def PrintDecisions(Decisions, Errors, DryRun):
+    print(f'{"Temp":<8}{"Press":<8}{"Kept":>6}{"Deleted":>9}{"Reclaimed":>14}  Verified')
+    for Decided in Decisions:
+        print(f'{Decided.Temp:<8}{Decided.Press:<8}{len(Decided.Keep):>6}{len(Decided.Delete):>9}'
+              f'{Decided.Reclaimed / 2 ** 30:>11.2f} GB  {Decided.Verified if Decided.Verified is not None else "-"}')
+    Total = sum(Decided.Reclaimed for Decided in Decisions)
+    Files = sum(len(Decided.Delete) for Decided in Decisions)
+    print(f'{"Would delete" if DryRun else "Deleted"} {Files - len(Errors)} restart files, '
+          f'{Total / 2 ** 30:.2f} GB {"reclaimable" if DryRun else "reclaimed"}')
+    for Decided in Decisions:
+        if Decided.Error is not None:
+            print(f'{Decided.Temp} {Decided.Press}: {Decided.Error}')
+    for Error in Errors:
+        print(Error)
+
+def main():
+    import FileGenerator as FG
+    Parser = argparse.ArgumentParser(description='Delete superseded restart files of a campaign')
+    Parser.add_argument('--temp', nargs='+', default=FG.Temperatures)
+    Parser.add_argument('--press', nargs='+', default=FG.Pressures)
+    Parser.add_argument('--keep-last', type=int, default=2, help='newest restart steps kept per condition')
+    Parser.add_argument('--keep-every', type=int, default=0, help='keep every Nth restart step of each phase')
+    Parser.add_argument('--no-boundaries', action='store_true',
+                        help="don't keep the last restart of each phase regardless")
+    Parser.add_argument('--workers', type=int, default=8, help='files deleted at once')
+    Parser.add_argument('--dry-run', action='store_true', help='report what would be deleted without deleting')
+    Args = Parser.parse_args()
+
+    Rules = Policy(Args.keep_last, Args.keep_every, not Args.no_boundaries)
+    Decisions, Errors = Retain(FG.Settings, Args.temp, Args.press, Rules, Args.dry_run, Args.workers)
+    PrintDecisions(Decisions, Errors, Args.dry_run)
+
+if __name__ == '__main__':
+    main()
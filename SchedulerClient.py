@@ -0,0 +1,237 @@
+"""
+Asynchronous client for qsub/qstat/qdel
+
+- Commands run as asyncio subprocesses with at most Concurrency in flight
+- Failures that look like an overloaded scheduler are retried with
+  exponential backoff, anything else raises SchedulerError
+- Job IDs are captured from qsub's stdout
+- The executables are looked up on PATH (or given explicitly), so stub
+  scripts can stand in for the scheduler
+
+Imperial runs PBS Pro and UCL runs SGE, HPC picks the dialect.
+"""
+
+import re
+import random
+import asyncio
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+CommandResult = namedtuple('CommandResult', ['Args', 'ReturnCode', 'Stdout', 'Stderr'])
+Job = namedtuple('Job', ['JobId', 'Name', 'State', 'Owner'])
+
+# Messages the schedulers print when they are refusing work for now
+TransientErrors = re.compile(r'try again|too busy|temporarily|timed? ?out|connection refused|'
+                             r'could not connect|unable to contact|max.* jobs|rate limit|'
+                             r'cannot be reached', re.IGNORECASE)
+
+class SchedulerError(RuntimeError):
+    pass
+
+def ParseJobId(Output):
+    # PBS prints the job ID on its own, SGE wraps it in a sentence
+    Match = re.search(r'Your job(?:-array)? (\d+)', Output)
+    if Match:
+        return Match.group(1)
+    return Output.strip().split()[0] if Output.strip() else None
+
+def JobError(JobId, Lines):
+    # The lines of qdel's output about JobId, None if it isn't mentioned.
+    # PBS names jobs as given (1234.server, 1234[5].server), SGE by number
+    Short = JobId.split('.')[0]
+    Pattern = re.compile(rf'(?<![\w\[]){re.escape(Short)}(?![\w\[])')
+    Found = [Line.strip() for Line in Lines if Pattern.search(Line)]
+    return '\n'.join(Found) or None
+
+def ExpandTasks(Tasks):
+    # SGE task lists look like '1-6:1' or '1,3,5'
+    Expanded = []
+    for Part in Tasks.split(','):
+        Match = re.fullmatch(r'(\d+)(?:-(\d+)(?::(\d+))?)?', Part.strip())
+        if Match is None:
+            continue
+        First = int(Match.group(1))
+        Last = int(Match.group(2) or First)
+        Step = int(Match.group(3) or 1)
+        Expanded.extend(range(First, Last + 1, Step))
+    return Expanded
+
+def ParsePBSQstat(Output):
+    # Output of 'qstat -f -t', one 'Job Id:' block per job or subjob.
+    # Long attribute values continue on lines starting with a tab
+    Jobs = []
+    Attributes = None
+    JobId = None
+    Key = None
+    for Line in Output.splitlines():
+        if Line.startswith('Job Id:'):
+            if JobId is not None:
+                Jobs.append(Job(JobId, Attributes.get('Job_Name'), Attributes.get('job_state'),
+                                Attributes.get('Job_Owner', '').split('@')[0]))
+            JobId = Line.split(':', 1)[1].strip()
+            Attributes = {}
+            Key = None
+        elif JobId is not None and Line.startswith('\t') and Key is not None:
+            Attributes[Key] += Line.strip()
+        elif JobId is not None and ' = ' in Line:
+            Key, Value = Line.strip().split(' = ', 1)
+            Attributes[Key] = Value
+    if JobId is not None:
+        Jobs.append(Job(JobId, Attributes.get('Job_Name'), Attributes.get('job_state'),
+                        Attributes.get('Job_Owner', '').split('@')[0]))
+    return Jobs
+
+def ParseSGEQstat(Output):
+    # Output of 'qstat -xml', array tasks are reported as JobId.Task
+    Jobs = []
+    if not Output.strip():
+        return Jobs
+    for Element in ET.fromstring(Output).iter('job_list'):
+        Number = Element.findtext('JB_job_number')
+        Name = Element.findtext('JB_name')
+        State = Element.findtext('state')
+        Owner = Element.findtext('JB_owner')
+        Tasks = Element.findtext('tasks')
+        if Tasks:
+            for Task in ExpandTasks(Tasks):
+                Jobs.append(Job(f'{Number}.{Task}', Name, State, Owner))
+        else:
+            Jobs.append(Job(Number, Name, State, Owner))
+    return Jobs
+
+class SchedulerClient:
+    def __init__(self, HPC, Concurrency=8, Retries=5, Backoff=1.0, MaxBackoff=60.0, Executables=None):
+        if HPC not in ('Imperial', 'UCL'):
+            raise ValueError(f'HPC not properly defined: {HPC!r}')
+        self.HPC = HPC
+        self.Concurrency = Concurrency
+        self.Retries = Retries
+        self.Backoff = Backoff
+        self.MaxBackoff = MaxBackoff
+        self.Executables = dict(qsub='qsub', qstat='qstat', qdel='qdel')
+        self.Executables.update(Executables or {})
+        self._Semaphore = None
+
+    def _Limit(self):
+        # Created lazily so the semaphore belongs to the running event loop
+        if self._Semaphore is None:
+            self._Semaphore = asyncio.Semaphore(self.Concurrency)
+        return self._Semaphore
+
+    async def Run(self, Args, Cwd=None, Check=True):
+        Args = [self.Executables.get(Args[0], Args[0])] + list(Args[1:])
+        for Attempt in range(self.Retries + 1):
+            async with self._Limit():
+                Process = await asyncio.create_subprocess_exec(
+                    *Args, cwd=Cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                Stdout, Stderr = await Process.communicate()
+            Result = CommandResult(Args, Process.returncode, Stdout.decode(), Stderr.decode())
+            if Result.ReturnCode == 0 or not Check:
+                return Result
+            if Attempt == self.Retries or not TransientErrors.search(Result.Stderr + Result.Stdout):
+                raise SchedulerError(f'{" ".join(Args)} exited with code {Result.ReturnCode}'
+                                     f'{f" in {Cwd}" if Cwd else ""}: {Result.Stderr.strip()}')
+            # Scheduler is overloaded, back off (with jitter) outside the limit
+            Delay = min(self.MaxBackoff, self.Backoff * 2 ** Attempt)
+            await asyncio.sleep(Delay * random.uniform(0.5, 1.0))
+
+    def DependencyArgs(self, DependsOn):
+        # Start once DependsOn has ended, whether it succeeded or not
+        if self.HPC == 'Imperial':
+            return ['-W', f'depend=afterany:{DependsOn}']
+        return ['-hold_jid', DependsOn.split('.')[0]] # SGE holds on whole jobs, not tasks
+
+    async def Submit(self, Script, Cwd, DependsOn=None):
+        Args = ['qsub'] + (self.DependencyArgs(DependsOn) if DependsOn else [])
+        Result = await self.Run(Args + [Script], Cwd=Cwd)
+        JobId = ParseJobId(Result.Stdout)
+        if JobId is None:
+            raise SchedulerError(f'qsub {Script} in {Cwd} did not print a job ID')
+        return JobId
+
+    async def Query(self):
+        if self.HPC == 'Imperial':
+            Result = await self.Run(['qstat', '-f', '-t'])
+            return ParsePBSQstat(Result.Stdout)
+        Result = await self.Run(['qstat', '-xml'])
+        return ParseSGEQstat(Result.Stdout)
+
+    async def Cancel(self, JobIds):
+        # Returns {JobId: None or the error for that job}
+        async def CancelOne(JobId):
+            try:
+                await self.Run(['qdel', JobId])
+                return None
+            except SchedulerError as e:
+                return str(e)
+        Errors = await asyncio.gather(*(CancelOne(JobId) for JobId in JobIds))
+        return dict(zip(JobIds, Errors))
+
+    async def CancelBatched(self, JobIds, BatchSize=100):
+        # qdel takes many job IDs at once, so cancel in batches rather than
+        # one call per job. qdel exits non-zero for the whole batch when one
+        # of its jobs is unknown or already finished, while still cancelling
+        # the rest, so the failures are read off its per-job messages. A
+        # batch whose messages name none of its jobs is cancelled again one
+        # job at a time. Returns {JobId: None or the error for that job}
+        Batches = [list(JobIds[i:i + BatchSize]) for i in range(0, len(JobIds), BatchSize)]
+        async def CancelBatch(Batch):
+            Result = await self.Run(['qdel'] + Batch, Check=False)
+            if Result.ReturnCode == 0:
+                return dict.fromkeys(Batch)
+            Lines = (Result.Stderr + Result.Stdout).splitlines()
+            Errors = {JobId: JobError(JobId, Lines) for JobId in Batch}
+            if all(Error is None for Error in Errors.values()):
+                return await self.Cancel(Batch)
+            return Errors
+        Errors = {}
+        for Result in await asyncio.gather(*(CancelBatch(Batch) for Batch in Batches)):
+            Errors.update(Result)
+        return Errors
+
+    async def SubmitAll(self, Submissions):
+        # Submissions is a list of (Script, Cwd), returns JobId or the
+        # exception for each, in the same order
+        return await asyncio.gather(*(self.Submit(Script, Cwd) for Script, Cwd in Submissions),
+                                    return_exceptions=True)
+
+    async def SubmitChain(self, Submissions, DependsOn=None):
+        # Submit (Script, Cwd) pairs one after another, each depending on the
+        # one before. Returns the job IDs, ending with the exception if a
+        # submission failed part way
+        JobIds = []
+        for Script, Cwd in Submissions:
+            try:
+                DependsOn = await self.Submit(Script, Cwd, DependsOn)
+            except Exception as e:
+                return JobIds + [e]
+            JobIds.append(DependsOn)
+        return JobIds
+
+    async def SubmitChains(self, Chains, DependsOn=None):
+        # Chains run concurrently, DependsOn optionally gives the job each
+        # chain has to wait for
+        DependsOn = DependsOn or [None] * len(Chains)
+        return await asyncio.gather(*(self.SubmitChain(Chain, After)
+                                      for Chain, After in zip(Chains, DependsOn)))
+
+    # Blocking wrappers for scripts. Each runs its own event loop, so the
+    # semaphore from a previous loop is dropped first
+    def _RunSync(self, Coroutine):
+        self._Semaphore = None
+        return asyncio.run(Coroutine)
+
+    def SubmitAllSync(self, Submissions):
+        return self._RunSync(self.SubmitAll(Submissions))
+
+    def SubmitChainsSync(self, Chains, DependsOn=None):
+        return self._RunSync(self.SubmitChains(Chains, DependsOn))
+
+    def QuerySync(self):
+        return self._RunSync(self.Query())
+
+    def CancelSync(self, JobIds):
+        return self._RunSync(self.Cancel(JobIds))
+
+    def CancelBatchedSync(self, JobIds, BatchSize=100):
+        return self._RunSync(self.CancelBatched(JobIds, BatchSize))
@@ -0,0 +1,102 @@
+"""
+Cached snapshot of the scheduler queue, mapped back to campaign conditions
+
+One qstat is taken per snapshot and reused until it is TTL seconds old, so
+a generator run never queries the scheduler more than once. Each live job
+is mapped back to (Temp, Press, Stage) from
+- the job IDs recorded in the campaign index
+- the System_Array_<sweep> manifest of its array, for array tasks
+- its job name, System_Temp_Press[.pbs], for anything else
+"""
+
+import os
+import re
+import time
+import threading
+from collections import namedtuple, defaultdict
+import CampaignIndex as CI
+
+LiveJob = namedtuple('LiveJob', ['JobId', 'Name', 'State', 'Stage'])
+
+# PBS keeps finished jobs around for a while in these states
+FinishedStates = ('F', 'X', 'C')
+
+def ArrayPattern(System):
+    return re.compile(rf'{re.escape(System)}_Array_\d+(?:_\d+)?')
+
+def ReadManifest(STARTINGDIR, System):
+    # Array job name -> {task number -> (Temp, Press, Stage)}, from every
+    # manifest MakePBSArrayFile has written
+    Manifests = {}
+    Pattern = ArrayPattern(System)
+    if not os.path.isdir(STARTINGDIR):
+        return Manifests
+    for Name in os.listdir(STARTINGDIR):
+        if not Name.endswith('_manifest.txt') or not Pattern.fullmatch(Name[:-len('_manifest.txt')]):
+            continue
+        Tasks = {}
+        with open(os.path.join(STARTINGDIR, Name)) as file:
+            for Task, Line in enumerate(file, start=1):
+                Fields = Line.rstrip('\n').split('\t')
+                Tasks[Task] = (Fields[0], Fields[1], Fields[2])
+        Manifests[Name[:-len('_manifest.txt')]] = Tasks
+    return Manifests
+
+def ArrayTask(JobId):
+    # 1234[5].server (PBS) or 1234.5 (SGE) -> 5
+    Match = re.match(r'\d+\[(\d+)\]', JobId) or re.fullmatch(r'\d+\.(\d+)', JobId)
+    return int(Match.group(1)) if Match else None
+
+def NamePattern(System):
+    return re.compile(rf'{re.escape(System)}_(?P<Temp>[^_.]+)_(?P<Press>[^_.]+)(?:\.pbs)?')
+
+def ConditionOf(Job, System, Manifest, Recorded=None, Pattern=None):
+    # (Temp, Press, Stage) of a job, or None if the job isn't part of the
+    # campaign. Stage is None when only the job name was there to go on
+    if Recorded and Job.JobId in Recorded:
+        return Recorded[Job.JobId]
+    Name = (Job.Name or '')[:-len('.pbs')] if (Job.Name or '').endswith('.pbs') else Job.Name
+    if Name in Manifest:
+        return Manifest[Name].get(ArrayTask(Job.JobId))
+    Match = (Pattern or NamePattern(System)).fullmatch(Job.Name or '')
+    if Match:
+        return Match.group('Temp'), Match.group('Press'), None
+    return None
+
+class SchedulerState:
+    def __init__(self, Client, System, STARTINGDIR, TTL=300):
+        self.Client = Client
+        self.System = System
+        self.STARTINGDIR = STARTINGDIR
+        self.TTL = TTL
+        self._Lock = threading.Lock()
+        self._Taken = None
+        self._Live = None
+
+    def Refresh(self):
+        Jobs = self.Client.QuerySync()
+        Manifest = ReadManifest(self.STARTINGDIR, self.System)
+        Recorded = CI.JobIds(self.STARTINGDIR) if os.path.isdir(self.STARTINGDIR) else {}
+        Pattern = NamePattern(self.System)
+
+        Live = defaultdict(list)
+        for Job in Jobs:
+            if Job.State in FinishedStates or '[]' in Job.JobId:
+                continue # Array parents are represented by their tasks
+            Condition = ConditionOf(Job, self.System, Manifest, Recorded, Pattern)
+            if Condition is not None:
+                Temp, Press, Stage = Condition
+                Live[(Temp, Press)].append(LiveJob(Job.JobId, Job.Name, Job.State, Stage))
+        self._Live = dict(Live)
+        self._Taken = time.monotonic()
+
+    def LiveJobs(self):
+        # {(Temp, Press): [LiveJob, ...]} from a snapshot at most TTL old
+        with self._Lock:
+            if self._Taken is None or time.monotonic() - self._Taken > self.TTL:
+                self.Refresh()
+            return self._Live
+
+    def Invalidate(self):
+        with self._Lock:
+            self._Taken = None
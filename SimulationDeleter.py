@@ -1,28 +1,75 @@
 """
 Script to automatically delete simulations
 
+- qstat output is parsed in memory
+- Only your own jobs that belong to the campaign are cancelled, picked either
+  by job name (System_Temp_Press, or the System_Array_<sweep> manifests for
+  array tasks) or by the job IDs recorded in the campaign index
+- Jobs are cancelled with batched qdel calls, many IDs per call
+
+Defaults (System, Temperatures, Pressures, STARTINGDIR, HPC) come from
+FileGenerator.py, e.g.
+    python SimulationDeleter.py --temp 500K --press 1GPa 2GPa --dry-run
+    python SimulationDeleter.py --campaign
 """
 
-import subprocess
-
-def runcmd(cmd, verbose = False, *args, **kwargs):
-    #bascially allows python to run a bash command, and the code makes sure 
-    #the error of the subproceess is communicated if it fails
-    process = subprocess.run(
-        cmd,
-        text=True,
-        shell=True)
-    
-runcmd('qstat > sims.txt')
-
-sims = []
-with open('sims.txt', 'r') as file:
-    next(file)
-    next(file)
-    filelist = file.readlines()
-    print(filelist)
-    for x in filelist:
-        sims.append(x.split(' ')[0])
-
-for sim in sims:
-    runcmd(f'qdel {sim}')
\ No newline at end of file
+import getpass
+import argparse
+import SchedulerClient as SC
+import SchedulerState as SS
+import CampaignIndex as CI
+import FileGenerator as FG
+
+def MatchByName(Jobs, System, Temperatures, Pressures, Manifest):
+    Pattern = SS.NamePattern(System)
+    Selected = []
+    for Job in Jobs:
+        if '[]' in Job.JobId:
+            continue # Array parents are cancelled through their tasks
+        Condition = SS.ConditionOf(Job, System, Manifest, Pattern=Pattern)
+        if Condition is not None and Condition[0] in Temperatures and Condition[1] in Pressures:
+            Selected.append(Job)
+    return Selected
+
+def MatchByCampaign(Jobs, STARTINGDIR):
+    Recorded = CI.JobIds(STARTINGDIR)
+    return [Job for Job in Jobs if Job.JobId in Recorded]
+
+def main():
+    Parser = argparse.ArgumentParser(description='Cancel the queued/running jobs of a campaign')
+    Parser.add_argument('--system', default=FG.System)
+    Parser.add_argument('--temp', nargs='+', default=FG.Temperatures)
+    Parser.add_argument('--press', nargs='+', default=FG.Pressures)
+    Parser.add_argument('--startingdir', default=FG.STARTINGDIR)
+    Parser.add_argument('--hpc', default=FG.HPC)
+    Parser.add_argument('--campaign', action='store_true',
+                        help='select jobs by the IDs recorded in the campaign index instead of by name')
+    Parser.add_argument('--batch-size', type=int, default=100, help='job IDs per qdel call')
+    Parser.add_argument('--concurrency', type=int, default=4, help='qdel calls in flight at once')
+    Parser.add_argument('--dry-run', action='store_true', help='list the jobs without cancelling them')
+    Args = Parser.parse_args()
+
+    Client = SC.SchedulerClient(Args.hpc, Concurrency=Args.concurrency)
+    User = getpass.getuser()
+    Jobs = [Job for Job in Client.QuerySync() if Job.Owner in (None, '', User)]
+
+    if Args.campaign:
+        Selected = MatchByCampaign(Jobs, Args.startingdir)
+    else:
+        Manifest = SS.ReadManifest(Args.startingdir, Args.system)
+        Selected = MatchByName(Jobs, Args.system, Args.temp, Args.press, Manifest)
+
+    for Job in Selected:
+        print(f'{Job.JobId:<24}{Job.State or "-":<6}{Job.Name}')
+    print(f'{len(Selected)} of {len(Jobs)} jobs selected')
+    if Args.dry_run or len(Selected) == 0:
+        return
+
+    Errors = Client.CancelBatchedSync([Job.JobId for Job in Selected], Args.batch_size)
+    Failed = [JobId for JobId, Error in Errors.items() if Error is not None]
+    for JobId in Failed:
+        print(Errors[JobId])
+    print(f'Cancelled {len(Selected) - len(Failed)} jobs, {len(Failed)} could not be cancelled')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+Molecular species in the bond-order frames of bonds_comp.txt (or
+bonds_equil.txt)
+
+- Atoms are bonded when their bond order is at least Cutoff
+- Fragments are the connected components of everything but the surface
+  atoms (Fe), found with a vectorised union-find (min-label hooking and
+  pointer jumping) over the bond list
+- Each fragment is written as a Hill formula (C, H, then alphabetical). A
+  fragment bonded to the surface gets '@surface' after its formula
+- Bonds are also counted by element pair (O-P, Fe-O, Fe-P, ...)
+- Frames are analysed on a process pool (BondsReader.MapFrames) and the
+  results kept in .<bonds file>.species.npz next to the bonds file, with the
+  byte offset reached and the bytes just before it, so later runs only
+  analyse new frames. A file rewritten in place is analysed again from the
+  start
+- The stages of a condition are stitched by timestep (Stitching.py)
+
+Element types come from HType/FeType/OType/PType/CType in FileGenerator.py.
+Run this file directly to print the most common species of every condition.
+"""
+
+import os
+import numpy as np
+from functools import partial
+from collections import namedtuple, Counter
+import BondsReader as BR
+import RestartDiscovery as RD
+import Stitching as ST
+import NpzCache as NC
+
+CacheVersion = 2
+
+# Counts[i, j] is the number of Species[j] fragments at Step[i], PairCounts
+# the same for bonds between the element pairs in Pairs
+SpeciesSeries = namedtuple('SpeciesSeries', ['Step', 'Species', 'Counts', 'Pairs', 'PairCounts'])
+
+def TypeMap(Settings):
+    # LAMMPS atom type -> element
+    return {int(Settings[f'{Element}Type']): Element for Element in ('H', 'Fe', 'O', 'P', 'C')}
+
+def Components(Atoms, I, J):
+    # Component label (the lowest index in it) of every atom, joined by the
+    # edges I-J
+    Labels = np.arange(Atoms)
+    while True:
+        Low = np.minimum(Labels[I], Labels[J])
+        New = Labels.copy()
+        np.minimum.at(New, Labels[I], Low) # Hook roots onto the lower label
+        np.minimum.at(New, Labels[J], Low)
+        while True:
+            Jumped = New[New]
+            if np.array_equal(Jumped, New):
+                break
+            New = Jumped
+        if np.array_equal(New, Labels):
+            return Labels
+        Labels = New
+
+def HillFormula(Elements, Counts):
+    Order = sorted(range(len(Elements)), key=lambda i: (Elements[i] != 'C', Elements[i] != 'H', Elements[i]))
+    return ''.join(f'{Elements[i]}{Counts[i] if Counts[i] > 1 else ""}' for i in Order if Counts[i] > 0)
+
+def FrameSpecies(Frame, Types, Cutoff=0.3, Surface=('Fe',)):
+    # (Step, {Formula: count}, {Pair: count}) of one BondFrame
+    Elements = sorted(set(Types.values()))
+    Lookup = np.full(max(Types) + 1, -1)
+    for Type, Element in Types.items():
+        Lookup[Type] = Elements.index(Element)
+    Element = Lookup[Frame.Type]
+    OnSurface = np.isin(Element, [Elements.index(Name) for Name in Surface if Name in Elements])
+
+    Bonds = np.diff(Frame.IndPtr)
+    I = np.repeat(np.arange(len(Frame.Id)), Bonds)
+    J = np.minimum(np.searchsorted(Frame.Id, Frame.Neighbours), len(Frame.Id) - 1)
+    Keep = (Frame.BondOrders >= Cutoff) & (Frame.Id[J] == Frame.Neighbours)
+    I, J = I[Keep], J[Keep]
+
+    # Bonds are listed from both ends, count each once
+    Once = I < J
+    Pairs = Counter()
+    PairCodes = np.minimum(Element[I[Once]], Element[J[Once]]) * len(Elements) \
+        + np.maximum(Element[I[Once]], Element[J[Once]])
+    for Code, Count in zip(*np.unique(PairCodes, return_counts=True)):
+        Pairs[f'{Elements[Code // len(Elements)]}-{Elements[Code % len(Elements)]}'] = int(Count)
+
+    Internal = ~OnSurface[I] & ~OnSurface[J]
+    Labels = Components(len(Frame.Id), I[Internal], J[Internal])
+    Bound = np.zeros(len(Frame.Id), dtype=bool)
+    Bound[Labels[I[~OnSurface[I] & OnSurface[J]]]] = True
+
+    # Element counts of every fragment, then one formula per distinct row
+    Molecule = ~OnSurface
+    Roots, Fragment = np.unique(Labels[Molecule], return_inverse=True)
+    Table = np.zeros((len(Roots), len(Elements) + 1), dtype=np.int64)
+    np.add.at(Table, (Fragment, Element[Molecule]), 1)
+    Table[:, -1] = Bound[Roots]
+    Species = Counter()
+    for Row, Count in zip(*np.unique(Table, axis=0, return_counts=True)):
+        Formula = HillFormula(Elements, Row[:-1])
+        Species[f'{Formula}@surface' if Row[-1] else Formula] += int(Count)
+    return Frame.Step, dict(Species), dict(Pairs)
+
+def ToSeries(Results):
+    Steps = np.array([Step for Step, Species, Pairs in Results], dtype=np.int64)
+    Species = sorted({Name for Frame in Results for Name in Frame[1]})
+    Pairs = sorted({Name for Frame in Results for Name in Frame[2]})
+    Counts = np.array([[Frame[1].get(Name, 0) for Name in Species] for Frame in Results],
+                      dtype=np.int64).reshape(len(Results), len(Species))
+    PairCounts = np.array([[Frame[2].get(Name, 0) for Name in Pairs] for Frame in Results],
+                          dtype=np.int64).reshape(len(Results), len(Pairs))
+    return SpeciesSeries(Steps, Species, Counts, Pairs, PairCounts)
+
+def Concatenate(Parts):
+    # Stack series that may have different species, missing ones count 0
+    Species = sorted({Name for Part in Parts for Name in Part.Species})
+    Pairs = sorted({Name for Part in Parts for Name in Part.Pairs})
+    def Widen(Names, Counts, All):
+        Wide = np.zeros((len(Counts), len(All)), dtype=np.int64)
+        Wide[:, [All.index(Name) for Name in Names]] = Counts
+        return Wide
+    return SpeciesSeries(
+        np.concatenate([Part.Step for Part in Parts]) if Parts else np.empty(0, dtype=np.int64), Species,
+        np.concatenate([Widen(Part.Species, Part.Counts, Species) for Part in Parts])
+        if Parts else np.empty((0, 0), dtype=np.int64), Pairs,
+        np.concatenate([Widen(Part.Pairs, Part.PairCounts, Pairs) for Part in Parts])
+        if Parts else np.empty((0, 0), dtype=np.int64))
+
+def CachePath(Path):
+    Directory, Name = os.path.split(Path)
+    return os.path.join(Directory, f'.{Name}.species.npz')
+
+def FileSpecies(Path, Types, Cutoff=0.3, Surface=('Fe',), Workers=8, PoolType='process', Caching=True):
+    # SpeciesSeries of one bonds file, analysing only frames not yet cached
+    Stat = os.stat(Path)
+    Key = repr((sorted(Types.items()), Cutoff, tuple(Surface), Stat.st_ino))
+    Cached = SpeciesSeries(np.empty(0, dtype=np.int64), [], np.empty((0, 0), dtype=np.int64), [],
+                           np.empty((0, 0), dtype=np.int64))
+    Start = 0
+    Cache = CachePath(Path)
+    if Caching and os.path.exists(Cache):
+        try:
+            with np.load(Cache) as Loaded:
+                # A file rewritten in place keeps its inode, but not the
+                # bytes before where the cache got to
+                if (int(Loaded['Version']) == CacheVersion and str(Loaded['Key']) == Key
+                        and int(Loaded['End']) <= Stat.st_size
+                        and NC.ReadTail(Path, int(Loaded['End'])) == Loaded['Tail'].tobytes()):
+                    Start = int(Loaded['End'])
+                    Cached = SpeciesSeries(Loaded['Step'], [str(x) for x in Loaded['Species']], Loaded['Counts'],
+                                           [str(x) for x in Loaded['Pairs']], Loaded['PairCounts'])
+        except (OSError, KeyError, ValueError):
+            Start = 0
+    if Start == Stat.st_size:
+        return Cached
+
+    Function = partial(FrameSpecies, Types=Types, Cutoff=Cutoff, Surface=tuple(Surface))
+    Results, End = BR.MapFrames(Path, Function, Workers, PoolType, Start=Start)
+    Series = Concatenate([Cached, ToSeries(Results)]) if Results else Cached
+    if Caching and End != Start:
+        NC.SaveNpzAtomic(Cache, Version=CacheVersion, Key=Key, End=End,
+                         Tail=np.frombuffer(NC.ReadTail(Path, End), dtype=np.uint8), Step=Series.Step,
+                         Species=np.array(Series.Species, dtype=str), Counts=Series.Counts,
+                         Pairs=np.array(Series.Pairs, dtype=str), PairCounts=Series.PairCounts)
+    return Series
+
+def ConditionSpecies(STARTINGDIR, Temp, Press, Types, FileName='bonds_comp.txt', Cutoff=0.3, Surface=('Fe',),
+                     Workers=8, PoolType='process'):
+    Parts = []
+    for Stage in RD.ScanCondition(os.path.join(STARTINGDIR, Temp, Press)):
+        Path = os.path.join(Stage.Path, FileName)
+        if os.path.exists(Path):
+            Series = FileSpecies(Path, Types, Cutoff, Surface, Workers, PoolType)
+            if len(Series.Step) > 0:
+                Parts.append(Series)
+    Stops = ST.Cuts([Part.Step for Part in Parts])
+    return Concatenate([Part._replace(Step=Part.Step[:Stop], Counts=Part.Counts[:Stop],
+                                      PairCounts=Part.PairCounts[:Stop]) for Part, Stop in zip(Parts, Stops)])
+
+def WriteCSV(Series, Path):
+    Header = ','.join(['Step'] + Series.Species + [f'bonds:{Pair}' for Pair in Series.Pairs])
+    Table = np.column_stack([Series.Step, Series.Counts, Series.PairCounts]) if len(Series.Step) else \
+        np.empty((0, 1 + len(Series.Species) + len(Series.Pairs)), dtype=np.int64)
+    np.savetxt(Path, Table, fmt='%d', delimiter=',', header=Header, comments='')
+
+def PrintSpecies(Settings, Temperatures, Pressures, Top=5, Workers=8, PoolType='process'):
+    Types = TypeMap(Settings)
+    for Temp in Temperatures:
+        for Press in Pressures:
+            if not os.path.isdir(os.path.join(Settings['STARTINGDIR'], Temp, Press)):
+                print(f'{Temp} {Press}: -')
+                continue
+            Series = ConditionSpecies(Settings['STARTINGDIR'], Temp, Press, Types, Workers=Workers,
+                                      PoolType=PoolType)
+            if len(Series.Step) == 0:
+                print(f'{Temp} {Press}: no frames')
+                continue
+            Last = sorted(zip(Series.Counts[-1], Series.Species), reverse=True)[:Top]
+            Bonds = ', '.join(f'{Pair} {Count}' for Pair, Count in zip(Series.Pairs, Series.PairCounts[-1]))
+            print(f'{Temp} {Press} step {Series.Step[-1]}: '
+                  + ', '.join(f'{Count} {Name}' for Count, Name in Last if Count > 0) + f' | bonds {Bonds}')
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintSpecies(FG.Settings, FG.Temperatures, FG.Pressures, Workers=FG.Workers)
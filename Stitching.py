@@ -0,0 +1,116 @@
+"""
+One continuous series per condition from the outputs of its stages
+
+Each stage restarts from the newest restart file of the one before, so its
+outputs (thermo, fc_ave.dump, dumps, bonds) repeat the tail of the previous
+stage. Stitching resolves the overlap by timestep, a later stage winning:
+every stage is cut at the first step written by any stage after it.
+
+Nothing is rewritten or copied. A StitchedView keeps each stage's arrays
+(or Trajectory) as they are with the number of rows used from it, and only
+concatenates the rows asked for. A Stitcher remembers what it loaded per
+output file, keyed by the file's inode, size and mtime, so stitching again
+after a new stage only loads that stage.
+"""
+
+import os
+import numpy as np
+from collections import namedtuple
+import RestartDiscovery as RD
+import Trajectory as TJ
+
+# Data is a dict of column arrays (one row per step) or a Trajectory
+Part = namedtuple('Part', ['Stage', 'Step', 'Data'])
+
+def Cuts(Steps):
+    # Rows used from each stage's (sorted, non-empty) steps: those before the
+    # first step of any later stage
+    Stops = []
+    Later = None
+    for Step in reversed(Steps):
+        Stops.append(len(Step) if Later is None else int(np.searchsorted(Step, Later)))
+        Later = Step[0] if Later is None else min(Later, Step[0])
+    return Stops[::-1]
+
+def TrajectoryPart(Path, Stage):
+    Trajectory = TJ.Trajectory(Path)
+    return Part(Stage, Trajectory.Steps, Trajectory)
+
+class StitchedView:
+    def __init__(self, Parts):
+        self.Parts = [Part for Part in Parts if len(Part.Step) > 0]
+        self.Stops = Cuts([Part.Step for Part in self.Parts])
+        self.Offsets = np.concatenate(([0], np.cumsum(self.Stops))).astype(np.int64)
+        self._Step = None
+
+    def __len__(self):
+        return int(self.Offsets[-1])
+
+    @property
+    def Step(self):
+        if self._Step is None:
+            self._Step = np.concatenate([Part.Step[:Stop] for Part, Stop in zip(self.Parts, self.Stops)]) \
+                if self.Parts else np.empty(0, dtype=np.int64)
+        return self._Step
+
+    def Locate(self, i):
+        # (part, row in that part) of row i of the view
+        i = i + len(self) if i < 0 else i
+        if not 0 <= i < len(self):
+            raise IndexError(f'Row {i} out of range for {len(self)} rows')
+        Index = int(np.searchsorted(self.Offsets, i, side='right')) - 1
+        return Index, i - int(self.Offsets[Index])
+
+    def Stage(self, i):
+        return self.Parts[self.Locate(i)[0]].Stage
+
+    def Column(self, Name, Start=0, Stop=None):
+        # Rows Start:Stop of a column, concatenating only the parts they span
+        Stop = len(self) if Stop is None else min(Stop, len(self))
+        Pieces = []
+        for Index, Part in enumerate(self.Parts):
+            Low = max(Start, self.Offsets[Index]) - self.Offsets[Index]
+            High = min(Stop, self.Offsets[Index + 1]) - self.Offsets[Index]
+            if High > Low:
+                Pieces.append(Part.Data[Name][Low:High])
+        return np.concatenate(Pieces) if Pieces else np.empty(0)
+
+    def Rows(self, Low, High):
+        # Start and stop rows covering steps Low <= Step < High
+        return int(np.searchsorted(self.Step, Low)), int(np.searchsorted(self.Step, High))
+
+    def Frame(self, i):
+        # Row i of a view over trajectories, as (atoms, box)
+        Index, Local = self.Locate(i)
+        Trajectory = self.Parts[Index].Data
+        return Trajectory.Frame(Local), Trajectory.Index['Box'][Local]
+
+class Stitcher:
+    def __init__(self, Loader, FileName):
+        # Loader(Path, Stage) returns a Part for one stage's output file
+        self.Loader = Loader
+        self.FileName = FileName
+        self._Loaded = {}
+
+    def View(self, ConditionDir):
+        Parts = []
+        for Stage in RD.ScanCondition(ConditionDir):
+            Path = os.path.join(Stage.Path, self.FileName)
+            try:
+                Stat = os.stat(Path)
+            except FileNotFoundError:
+                continue
+            Signature = (Stat.st_ino, Stat.st_size, Stat.st_mtime_ns)
+            Known = self._Loaded.get(Path)
+            if Known is None or Known[0] != Signature:
+                if Known is not None and hasattr(Known[1].Data, 'close'):
+                    Known[1].Data.close()
+                Known = self._Loaded[Path] = (Signature, self.Loader(Path, Stage.Name))
+            Parts.append(Known[1])
+        return StitchedView(Parts)
+
+    def close(self):
+        for Signature, Loaded in self._Loaded.values():
+            if hasattr(Loaded.Data, 'close'):
+                Loaded.Data.close()
+        self._Loaded.clear()
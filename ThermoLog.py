@@ -0,0 +1,153 @@
+"""
+Thermo tables from log.lammps as typed column arrays
+
+- One pass over the log finds every thermo block (a 'Step ...' header up to
+  its 'Loop time' line) among the echoed input, warnings and setup output
+- Each block's rows are parsed together with NumPy, Step as int64 and every
+  other column as float64
+- The result is cached as .log.lammps.npz next to the log, keyed by the
+  log's size and mtime, so reading it again takes milliseconds
+- The stages of a condition are stitched by timestep (Stitching.py)
+
+Run this file directly to print the latest thermo values of every condition
+in FileGenerator.py.
+"""
+
+import os
+import numpy as np
+from functools import partial
+from collections import namedtuple
+import Stitching as ST
+import NpzCache as NC
+
+LogName = 'log.lammps'
+CacheName = '.log.lammps.npz'
+CacheVersion = 1
+
+# Columns is the header of the block, Data maps each column to its array
+ThermoBlock = namedtuple('ThermoBlock', ['Columns', 'Data'])
+
+def ParseBlock(Columns, Rows):
+    Values = np.fromstring(b' '.join(Rows).decode(), dtype=np.float64, sep=' ').reshape(-1, len(Columns))
+    Data = {Column: Values[:, i] for i, Column in enumerate(Columns)}
+    Data[Columns[0]] = Values[:, 0].astype(np.int64)
+    return ThermoBlock(Columns, Data)
+
+def ParseLog(Path):
+    Blocks = []
+    Columns = None
+    Rows = []
+    with open(Path, 'rb') as file:
+        for Line in file:
+            Stripped = Line.lstrip()
+            if Stripped.startswith(b'Step ') or Stripped.startswith(b'Step\t'):
+                if Columns is not None and Rows:
+                    Blocks.append(ParseBlock(Columns, Rows))
+                Columns = tuple(Stripped.decode().split())
+                Rows = []
+            elif Columns is None:
+                continue
+            elif Stripped[:1].isdigit():
+                # Rows of the wrong length are cut short or something else
+                # that happens to start with a number
+                Fields = Stripped.split()
+                if len(Fields) == len(Columns):
+                    Rows.append(Stripped)
+            elif Stripped.startswith(b'Loop time') or Stripped.startswith(b'ERROR'):
+                if Rows:
+                    Blocks.append(ParseBlock(Columns, Rows))
+                Columns = None
+                Rows = []
+            # Anything else (warnings) can turn up in the middle of a block
+    if Columns is not None and Rows:
+        Blocks.append(ParseBlock(Columns, Rows))
+    return Blocks
+
+def SaveCache(Path, Stat, Blocks):
+    Arrays = {'Version': CacheVersion, 'Size': Stat.st_size, 'MtimeNs': Stat.st_mtime_ns, 'Blocks': len(Blocks)}
+    for i, Block in enumerate(Blocks):
+        Arrays[f'{i}_Columns'] = np.array(Block.Columns)
+        for Column in Block.Columns:
+            Arrays[f'{i}_{Column}'] = Block.Data[Column]
+    return NC.SaveNpzAtomic(Path, **Arrays)
+
+def LoadCache(Path, Stat):
+    # The cached blocks, or None if the cache is missing or out of date
+    try:
+        with np.load(Path) as Cache:
+            if (int(Cache['Version']) != CacheVersion or int(Cache['Size']) != Stat.st_size
+                    or int(Cache['MtimeNs']) != Stat.st_mtime_ns):
+                return None
+            Blocks = []
+            for i in range(int(Cache['Blocks'])):
+                Columns = tuple(str(Column) for Column in Cache[f'{i}_Columns'])
+                Blocks.append(ThermoBlock(Columns, {Column: Cache[f'{i}_{Column}'] for Column in Columns}))
+            return Blocks
+    except (OSError, KeyError, ValueError):
+        return None
+
+def ReadLog(StageDir, Caching=True):
+    # Every thermo block of a stage's log.lammps, [] if there is no log
+    Path = os.path.join(StageDir, LogName)
+    try:
+        Stat = os.stat(Path)
+    except FileNotFoundError:
+        return []
+    CachePath = os.path.join(StageDir, CacheName)
+    Blocks = LoadCache(CachePath, Stat) if Caching else None
+    if Blocks is None:
+        Blocks = ParseLog(Path)
+        if Caching:
+            SaveCache(CachePath, Stat, Blocks)
+    return Blocks
+
+def StageColumns(Blocks, Names):
+    # Step and the Names columns across the blocks that have all of them. A
+    # new run repeats the last step of the one before, which is dropped
+    Steps = []
+    Columns = {Name: [] for Name in Names}
+    Last = -1
+    for Block in Blocks:
+        if not all(Name in Block.Data for Name in Names):
+            continue
+        Keep = Block.Data[Block.Columns[0]] > Last
+        if not Keep.any():
+            continue
+        Steps.append(Block.Data[Block.Columns[0]][Keep])
+        for Name in Names:
+            Columns[Name].append(Block.Data[Name][Keep])
+        Last = Steps[-1][-1]
+    if not Steps:
+        return np.empty(0, dtype=np.int64), {Name: np.empty(0) for Name in Names}
+    return np.concatenate(Steps), {Name: np.concatenate(Columns[Name]) for Name in Names}
+
+def StagePart(Path, Stage, Names, Caching=True):
+    Step, Columns = StageColumns(ReadLog(os.path.dirname(Path), Caching), Names)
+    return ST.Part(Stage, Step, Columns)
+
+def ConditionView(STARTINGDIR, Temp, Press, Names, Caching=True):
+    Stitcher = ST.Stitcher(partial(StagePart, Names=Names, Caching=Caching), LogName)
+    return Stitcher.View(os.path.join(STARTINGDIR, Temp, Press))
+
+def ConditionThermo(STARTINGDIR, Temp, Press, Names, Caching=True):
+    # (Step, {Name: values}) across every stage of a condition
+    View = ConditionView(STARTINGDIR, Temp, Press, Names, Caching)
+    return View.Step, {Name: View.Column(Name) for Name in Names}
+
+def PrintThermo(STARTINGDIR, Temperatures, Pressures, Names=('c_temp_free', 'Press')):
+    print(f'{"Temp":<8}{"Press":<8}{"Rows":>10}{"Step":>12}' + ''.join(f'{Name:>14}' for Name in Names))
+    for Temp in Temperatures:
+        for Press in Pressures:
+            if not os.path.isdir(os.path.join(STARTINGDIR, Temp, Press)):
+                print(f'{Temp:<8}{Press:<8}-')
+                continue
+            Step, Columns = ConditionThermo(STARTINGDIR, Temp, Press, Names)
+            if len(Step) == 0:
+                print(f'{Temp:<8}{Press:<8}{0:>10}')
+                continue
+            print(f'{Temp:<8}{Press:<8}{len(Step):>10}{Step[-1]:>12}'
+                  + ''.join(f'{Columns[Name][-1]:>14.4g}' for Name in Names))
+
+if __name__ == '__main__':
+    import FileGenerator as FG
+    PrintThermo(FG.STARTINGDIR, FG.Temperatures, FG.Pressures)
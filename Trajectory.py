@@ -0,0 +1,154 @@
+"""
+Random access to the text dumps written by the inputs (dump_min.lammpstrj,
+dump_equil.lammpstrj and dump_comp.lammpstrj, id type x y z)
+
+- The file is memory mapped and scanned once for 'ITEM: TIMESTEP', giving
+  the byte range, step, atom count and box of every frame
+- The frame index is kept as .<dump>.index.npz next to the dump, keyed by
+  its size and mtime. When the dump has grown (same inode, same first frame
+  header) only the frames after the last complete one are scanned, a dump
+  that was replaced is scanned again from the start
+- A frame (or range of frames) is parsed straight from the memory map into
+  a NumPy structured array with one field per dumped column, sorted by id
+
+Text dumps have to be parsed, so frames can't be zero-copy views of the
+file, but reading frame N touches only that frame's bytes.
+"""
+
+import os
+import mmap
+import hashlib
+import numpy as np
+import NpzCache as NC
+
+CacheVersion = 2
+
+IndexType = np.dtype([('Step', np.int64), ('Atoms', np.int64), ('Start', np.int64), ('Data', np.int64),
+                      ('End', np.int64), ('Box', np.float64, (3, 2))])
+
+# Columns parsed as integers, everything else is float64
+IntegerColumns = ('id', 'type', 'mol', 'proc', 'ix', 'iy', 'iz')
+
+def IndexPath(Path):
+    Directory, Name = os.path.split(Path)
+    return os.path.join(Directory, f'.{Name}.index.npz')
+
+def ScanFrames(Map, Start=0):
+    # Frames from Start to the end of the map, as (index rows, columns). A
+    # frame that isn't completely written yet is left out
+    Frames = []
+    Columns = None
+    Position = Map.find(b'ITEM: TIMESTEP', Start)
+    while Position != -1:
+        Header = []
+        Cursor = Position
+        for i in range(9):
+            End = Map.find(b'\n', Cursor)
+            if End == -1:
+                return Frames, Columns
+            Header.append(Map[Cursor:End].decode())
+            Cursor = End + 1
+        Step = int(Header[1])
+        Atoms = int(Header[3])
+        Box = [[float(Value) for Value in Line.split()[:2]] for Line in Header[5:8]]
+        Columns = tuple(Header[8].split()[2:])
+
+        # Atom lines are at least a few bytes each, which saves scanning
+        # through most of a frame for the next header
+        Next = Map.find(b'ITEM: TIMESTEP', Cursor + Atoms * 2 * len(Columns))
+        FrameEnd = len(Map) if Next == -1 else Next
+        if Next == -1 and Map[Cursor:FrameEnd].count(b'\n') < Atoms:
+            break
+        Frames.append((Step, Atoms, Position, Cursor, FrameEnd, Box))
+        Position = Next
+    return Frames, Columns
+
+def HeadDigest(Map, Index):
+    # SHA-1 of the first frame's header, '' before a frame is indexed
+    if len(Index) == 0:
+        return ''
+    return hashlib.sha1(Map[int(Index['Start'][0]):int(Index['Data'][0])]).hexdigest()
+
+class Trajectory:
+    def __init__(self, Path, Caching=True):
+        self.Path = Path
+        self._File = open(Path, 'rb')
+        Size = os.fstat(self._File.fileno()).st_size
+        self._Map = mmap.mmap(self._File.fileno(), 0, access=mmap.ACCESS_READ) if Size > 0 else b''
+        self.Index, self.Columns = self._BuildIndex(Caching)
+        self.Type = np.dtype([(Column, np.int64 if Column in IntegerColumns else np.float64)
+                              for Column in self.Columns])
+
+    def _BuildIndex(self, Caching):
+        Stat = os.stat(self.Path)
+        Index = np.empty(0, dtype=IndexType)
+        Columns = ()
+        Cache = IndexPath(self.Path)
+        if Caching and os.path.exists(Cache):
+            try:
+                with np.load(Cache) as Loaded:
+                    # A dump replaced by another that grew past the old
+                    # size has a new inode or a different first frame
+                    if (int(Loaded['Version']) == CacheVersion and int(Loaded['Size']) <= Stat.st_size
+                            and int(Loaded['Inode']) == Stat.st_ino
+                            and str(Loaded['Head']) == HeadDigest(self._Map, Loaded['Frames'])):
+                        Index = Loaded['Frames']
+                        Columns = tuple(str(Column) for Column in Loaded['Columns'])
+                        if int(Loaded['Size']) == Stat.st_size and int(Loaded['MtimeNs']) == Stat.st_mtime_ns:
+                            return Index, Columns
+            except (OSError, KeyError, ValueError):
+                Index = np.empty(0, dtype=IndexType)
+
+        # Rescan from the last indexed frame, it may have been incomplete
+        Start = int(Index['Start'][-1]) if len(Index) > 0 else 0
+        Frames, Found = ScanFrames(self._Map, Start)
+        Index = np.concatenate([Index[:-1] if len(Index) > 0 else Index, np.array(Frames, dtype=IndexType)])
+        Columns = Found or Columns
+        if Caching:
+            NC.SaveNpzAtomic(Cache, Version=CacheVersion, Size=Stat.st_size, MtimeNs=Stat.st_mtime_ns,
+                             Inode=Stat.st_ino, Head=HeadDigest(self._Map, Index), Frames=Index,
+                             Columns=np.array(Columns))
+        return Index, Columns
+
+    def __len__(self):
+        return len(self.Index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Exception):
+        self.close()
+
+    def close(self):
+        if isinstance(self._Map, mmap.mmap):
+            self._Map.close()
+        self._File.close()
+
+    @property
+    def Steps(self):
+        return self.Index['Step']
+
+    def FrameAtStep(self, Step):
+        i = np.searchsorted(self.Index['Step'], Step)
+        if i == len(self.Index) or self.Index['Step'][i] != Step:
+            raise KeyError(f'No frame at step {Step} in {self.Path}')
+        return self.Frame(i)
+
+    def Frame(self, i):
+        Row = self.Index[i]
+        Values = np.fromstring(self._Map[Row['Data']:Row['End']], dtype=np.float64, sep=' ')
+        Values = Values[:Row['Atoms'] * len(self.Columns)].reshape(-1, len(self.Columns))
+        Values = Values[np.argsort(Values[:, self.Columns.index('id')], kind='stable')] \
+            if 'id' in self.Columns else Values
+        Atoms = np.empty(len(Values), dtype=self.Type)
+        for j, Column in enumerate(self.Columns):
+            Atoms[Column] = Values[:, j]
+        return Atoms
+
+    def Frames(self, Start=None, Stop=None, Step=None):
+        # Frames in range(Start, Stop, Step) stacked into a (Frames, Atoms)
+        # array, or a list if the number of atoms changes along the way
+        Selected = [self.Frame(i) for i in range(*slice(Start, Stop, Step).indices(len(self)))]
+        if Selected and all(len(Atoms) == len(Selected[0]) for Atoms in Selected):
+            return np.stack(Selected)
+        return Selected
@@ -0,0 +1,123 @@
+"""
+Tests for the log parsing of Performance.py against log.lammps as LAMMPS
+writes it, and for the resources recommended from a campaign's history
+
+Run with python -m pytest -q from this directory
+"""
+
+import os
+import pytest
+import Performance as PF
+import HelperFunctions as HF
+
+# A reax/c log.lammps excerpt with the lines ParseLog reads as LAMMPS (29 Sep
+# 2021) prints them
+RealLog = """LAMMPS (29 Sep 2021 - Update 3)
+Reading data file ...
+  orthogonal box = (0.0000000 0.0000000 -10.000000) to (40.320000 34.920000 60.000000)
+  4 by 4 by 2 MPI processor grid
+Neighbor list info ...
+Setting up Verlet run ...
+  Unit style    : real
+  Current step  : 0
+  Time step     : 0.25
+Per MPI rank memory allocation (min/avg/max) = 112.4 | 118.7 | 126.3 Mbytes
+Step Temp E_pair E_mol TotEng Press
+       0          300   -1108443.3            0   -1095127.4    -1205.234
+    1000    301.42153   -1108551.2            0   -1095172.3    -998.1142
+Loop time of 255.798 on 32 procs for 1000 steps with 14896 atoms
+
+Performance: 0.084 ns/day, 284.220 hours/ns, 3.909 timesteps/s
+99.6% CPU use with 32 MPI tasks x 1 OpenMP threads
+
+MPI task timing breakdown:
+Section |  min time  |  avg time  |  max time  |%varavg| %total
+---------------------------------------------------------------
+Pair    | 198.42     | 206.11     | 214.33     |  28.1 | 80.58
+Neigh   | 0.91215    | 0.95021    | 0.99876    |   1.2 |  0.37
+Comm    | 2.1342     | 10.321     | 18.032     | 120.4 |  4.03
+Output  | 0.0021344  | 0.0021875  | 0.0023901  |   0.0 |  0.00
+Modify  | 37.912     | 38.197     | 38.501     |   2.3 | 14.93
+Other   |            | 0.2161     |            |       |  0.08
+
+Nlocal:        465.500 ave         502 max         431 min
+Total wall time: 0:04:17
+"""
+
+@pytest.fixture
+def Log(tmp_path):
+    Path = tmp_path / 'log.lammps'
+    Path.write_text(RealLog)
+    return str(Path)
+
+def test_ParseRealLog(Log):
+    Runs = PF.ParseLog(Log)
+    assert len(Runs) == 1
+    Run = Runs[0]
+    assert (Run.Procs, Run.Threads, Run.Steps, Run.Atoms) == (32, 1, 1000, 14896)
+    assert Run.LoopTime == pytest.approx(255.798)
+    assert Run.NsPerDay == pytest.approx(0.084)
+    assert Run.StepsPerSecond == pytest.approx(3.909)
+    assert Run.MemoryMB == pytest.approx(126.3)
+    assert Run.Sections['Pair'] == pytest.approx(80.58)
+    assert Run.Sections['Output'] == 0.0
+
+def test_OldMemoryLine(tmp_path):
+    Path = tmp_path / 'log.lammps'
+    Path.write_text(RealLog.replace('Per MPI rank memory allocation (min/avg/max) = 112.4 | 118.7 | 126.3 Mbytes',
+                                    'Memory usage per processor = 97.5 Mbytes'))
+    assert PF.ParseLog(str(Path))[0].MemoryMB == pytest.approx(97.5)
+
+def test_SyntheticLogMatchesReal(tmp_path):
+    # The synthetic log has to parse the same way as a real one
+    Path = str(tmp_path / 'log.lammps')
+    PF.WriteSyntheticLog(Path, 16, 10000, 1000, 1e-6, 1e-4, 1e-3, MemoryBase=50.0, MemoryPerAtom=0.05, Runs=2)
+    Runs = PF.ParseLog(Path)
+    assert len(Runs) == 2
+    assert all(Run.MemoryMB == pytest.approx(50.0 + 0.05 * 10000 / 16, rel=1e-3) for Run in Runs)
+
+# Model the synthetic history is timed by
+Serial, Parallel, Comm = 1e-6, 5e-4, 1e-3
+MemoryBase, MemoryPerAtom = 50.0, 0.05
+Atoms = 10000
+
+def Settings(STARTINGDIR):
+    return {'STARTINGDIR': str(STARTINGDIR), 'System': 'Test', 'HPC': 'Imperial', 'EquilTime': '100000',
+            'CompTime': '400000'}
+
+def WriteHistory(STARTINGDIR, Procs):
+    # One stage log per rank count, spread over two conditions
+    for i, Count in enumerate(Procs):
+        StageDir = os.path.join(STARTINGDIR, '300K', f'{i % 2 + 1}GPa', f'Restart_{i // 2 + 1}')
+        os.makedirs(StageDir)
+        PF.WriteSyntheticLog(os.path.join(StageDir, 'log.lammps'), Count, Atoms, 2000, Serial, Parallel, Comm,
+                             MemoryBase, MemoryPerAtom)
+
+def test_FitRecoversModel(tmp_path):
+    WriteHistory(tmp_path, (8, 16, 32, 64))
+    assert PF.Harvest(str(tmp_path), 'Test') == 4
+    Fitted = PF.Fit('Test', PF.History(str(tmp_path), 'Test'))
+    assert (Fitted.Runs, Fitted.Atoms) == (4, Atoms)
+    assert (Fitted.Serial, Fitted.Parallel, Fitted.Comm) == pytest.approx((Serial, Parallel, Comm), rel=1e-3)
+    assert (Fitted.MemoryBase, Fitted.MemoryPerAtom) == pytest.approx((MemoryBase, MemoryPerAtom), rel=1e-3)
+
+def test_Recommend(tmp_path):
+    # 500000 steps take 0.3265 s each on 16 cores, 56.7 hours with the
+    # safety margin. 8 cores would go over the 72 hour limit and every core
+    # count above 16 costs more core-hours. 81.25 MB per rank with the
+    # margin is 1.9 GB for the node
+    WriteHistory(tmp_path, (8, 16, 32, 64))
+    assert PF.RecommendFor(Settings(tmp_path)) == PF.Resources(Ranks=16, Nodes=1, MemoryGB=2, WalltimeHours=57)
+
+def test_RecommendWithoutHistory(tmp_path):
+    # Nothing harvested, and runs on a single core count, recommend nothing
+    # and the job script keeps the machine's defaults
+    assert PF.RecommendFor(Settings(tmp_path)) is None
+    WriteHistory(tmp_path, (32, 32))
+    assert PF.RecommendFor(Settings(tmp_path)) is None
+
+    HF.MakePBSFile('Test', '300K', '1GPa', str(tmp_path), 'Imperial', Resources=PF.RecommendFor(Settings(tmp_path)))
+    Default = PF.DefaultResources['Imperial']
+    Script = (tmp_path / 'Test_300K_1GPa.pbs').read_text()
+    assert f'#PBS -l select=1:ncpus={Default.Ranks}:mem={Default.MemoryGB}gb\n' in Script
+    assert f'#PBS -l walltime={Default.WalltimeHours}:00:00\n' in Script
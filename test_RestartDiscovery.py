@@ -0,0 +1,80 @@
+"""
+Tests for RestartDiscovery.py on synthetic condition trees
+
+Run with python -m pytest -q from this directory
+"""
+
+import os
+import pytest
+import RestartDiscovery as RD
+
+EquilTime = 100000
+CompTime = 1000000
+
+def Touch(Path):
+    open(Path, 'w').close()
+
+@pytest.fixture
+def Condition(tmp_path):
+    # Twelve stages, thousands of restart files in the first, out of order
+    # names (Restart_10 before Restart_9 as strings) and unrelated entries
+    for Number in range(12):
+        os.mkdir(tmp_path / RD.StageName(Number))
+    os.mkdir(tmp_path / 'Restart_notes')
+    Touch(tmp_path / 'Restart_3.txt')
+    First = tmp_path / 'FirstRun'
+    for Step in range(0, EquilTime + 1, 50):
+        Touch(First / f'equil.restart.{Step}')
+    for Step in range(EquilTime, 3 * EquilTime + 1, 100):
+        Touch(First / f'comp.restart.{Step}')
+    Touch(First / 'comp.restart.tmp')
+    Touch(First / 'equil.restart.')
+    Touch(First / 'log.lammps')
+    return tmp_path
+
+def test_StageNumber():
+    assert RD.StageNumber('FirstRun') == 0
+    assert RD.StageNumber('Restart_10') == 10
+    assert RD.StageNumber('Restart_x') is None
+    assert RD.StageNumber('results') is None
+
+def test_RestartStep():
+    assert RD.RestartStep('equil.restart.500') == ('equil', 500)
+    assert RD.RestartStep('comp.restart.1200000') == ('comp', 1200000)
+    assert RD.RestartStep('comp.restart.tmp') is None
+    assert RD.RestartStep('equil.restart.') is None
+    assert RD.RestartStep('log.lammps') is None
+
+def test_ScanConditionNumericOrder(Condition):
+    Stages = RD.ScanCondition(str(Condition))
+    Names = [Stage.Name for Stage in Stages]
+    assert Names == ['FirstRun'] + [f'Restart_{Number}' for Number in range(1, 12)]
+    assert Names.index('Restart_10') > Names.index('Restart_9')
+    assert Stages[-1].Path == os.path.join(str(Condition), 'Restart_11')
+
+def test_ScanStageThousandsOfFiles(Condition):
+    Scan = RD.ScanStage(str(Condition / 'FirstRun'))
+    assert len(Scan.EquilSteps) == EquilTime // 50 + 1
+    assert len(Scan.CompSteps) == 2 * EquilTime // 100 + 1
+    assert Scan.EquilSteps == sorted(Scan.EquilSteps)
+    assert Scan.CompSteps[-1] == 3 * EquilTime
+    assert Scan.Sizes == {'log.lammps': 0}
+
+def test_LatestRestartTyping(Condition):
+    Scan = RD.ScanStage(str(Condition / 'FirstRun'))
+    assert RD.LatestRestart(Scan.EquilSteps, Scan.CompSteps, EquilTime) == \
+        RD.Restart('CompShear', 3 * EquilTime, f'comp.restart.{3 * EquilTime}')
+    # Only equilibration written yet
+    assert RD.LatestRestart(Scan.EquilSteps, [], EquilTime) == \
+        RD.Restart('Equilibration', EquilTime, f'equil.restart.{EquilTime}')
+    # Both written at the end of equilibration, equilibration wins
+    assert RD.LatestRestart([EquilTime], [EquilTime], EquilTime).Type == 'Equilibration'
+    # Both past equilibration, compression/shear wins
+    assert RD.LatestRestart([EquilTime + 10], [EquilTime + 10], EquilTime).Type == 'CompShear'
+    assert RD.LatestRestart([], [], EquilTime) is None
+
+def test_IsComplete():
+    assert not RD.IsComplete([], CompTime)
+    assert not RD.IsComplete([CompTime - 1], CompTime)
+    assert RD.IsComplete([CompTime], CompTime)
+    assert RD.IsComplete([CompTime + 100, 5], str(CompTime))